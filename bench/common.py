@@ -0,0 +1,109 @@
+'''压测公共部分：插件沙箱、伪事件与统计工具'''
+import sys
+import json
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+class FakeEvent:
+    '''模拟 AstrMessageEvent 中插件用到的接口'''
+    def __init__(self, group_id: str, user_id: str, text: str, name: Optional[str] = None, admin: bool = False):
+        self.group_id = group_id
+        self.user_id = user_id
+        self.text = text
+        self.name = name or f"用户{user_id}"
+        self.admin = admin
+
+    def get_sender_name(self) -> str:
+        return self.name
+
+    def get_sender_id(self) -> str:
+        return self.user_id
+
+    def get_group_id(self) -> str:
+        return self.group_id
+
+    def get_message_str(self) -> str:
+        return self.text
+
+    def is_admin(self) -> bool:
+        return self.admin
+
+    def is_private_chat(self) -> bool:
+        return self.group_id is None
+
+    def plain_result(self, text: str) -> str:
+        return text
+
+def prepare_plugin(base_url: str, group_ids: Sequence[str], workdir: Optional[Path] = None):
+    '''
+    将插件指向桩服务器与临时数据目录，并返回 (config, chat, group) 三个模块
+
+    必须在创建 GroupManager 之前调用；真实的 data 目录不会被读写。
+    '''
+    from tools import config, chat, group
+    from tools.ledger import ledger
+    from tools.log import sinks
+    from tools.profiler import profiler
+
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="huaer_bench_"))
+    for name in ("groups", "public", "private", "whitelist"):
+        (workdir / name).mkdir(parents=True, exist_ok=True)
+
+    config.DATA_DIR = workdir
+    config.GROUPS_DIR = workdir / "groups"
+    config.PUBLIC_DIR = chat.PUBLIC_DIR = workdir / "public"
+    config.PRIVATE_DIR = workdir / "private"
+
+    group_file = workdir / "whitelist" / "group_whitelist.json"
+    user_file = workdir / "whitelist" / "user_whitelist.json"
+    group_file.write_text(json.dumps(list(group_ids)), encoding="utf-8")
+    user_file.write_text("[]", encoding="utf-8")
+    group.GROUP_WHITELIST_FILE = group_file
+    group.USER_WHITELIST_FILE = user_file
+
+    api_url = f"{base_url}/v1/chat/completions"
+    emb_url = f"{base_url}/v1/embeddings"
+    config.API_URL = chat.API_URL = api_url
+    config.EMB_URL = chat.EMB_URL = emb_url
+    config.API_KEY = chat.API_KEY = "Bearer stub"
+    config.SAPI_KEY = chat.SAPI_KEY = "stub"
+    config.SAPI_URL = chat.SAPI_URL = f"{base_url}/v2/ai_search/chat/completions" # 走百度格式，便于重定向
+
+    group.GroupManager._instance = None # 单例重置，保证每次压测都是新的实例
+    config._shared_rag = None # 公共知识库同理，需落在临时目录下
+    config._state = None # 状态存储同理
+    config._state_io = None
+    ledger.close() # token账本改写到临时目录
+    ledger.file, ledger.spent, ledger._pending = workdir / "ledger.sqlite3", {}, []
+    sinks.relocate(workdir) # 结构化日志与trace写到临时目录的logs/traces下
+    profiler.out_dir = workdir / "profiles"
+    return config, chat, group
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近秩法求分位数"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 0.50),
+        "p95": percentile(samples, 0.95),
+        "p99": percentile(samples, 0.99),
+        "max": max(samples) if samples else 0.0,
+        "mean": sum(samples) / len(samples) if samples else 0.0,
+    }
+
+def dump_report(report: Dict, path: Optional[str]):
+    """打印报告，并按需写入JSON文件"""
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if path:
+        Path(path).write_text(text, encoding="utf-8")
@@ -0,0 +1,103 @@
+'''
+离线压测：以本地桩服务器代替SiliconFlow与搜索接口，驱动 GroupManager/ChatHandler
+
+用法（在插件根目录、已安装插件依赖的环境中运行）：
+    python -m bench.load_test --groups 8 --users 4 --turns 5 --search --latency 0.3
+'''
+import time
+import asyncio
+import argparse
+from typing import Dict, List
+
+from .common import FakeEvent, prepare_plugin, latency_summary, dump_report
+from .stubs import StubServer, StubOptions
+
+async def _user_loop(handler, group_id: str, user_id: str, turns: int, think: float,
+                     latencies: List[float], failures: List[str]):
+    """单个用户按顺序发起多轮对话（闭环）"""
+    for i in range(turns):
+        text = f"第{i}条消息，来自{user_id}"
+        event = FakeEvent(group_id, user_id, f"对话 {text}")
+        start = time.perf_counter()
+        reply = await handler.handle_chat(event, text.split())
+        latencies.append(time.perf_counter() - start)
+        if reply.startswith(("⚠️", "📛", "⏳", "❌")):
+            failures.append(reply)
+        if think:
+            await asyncio.sleep(think)
+
+async def run(args: argparse.Namespace) -> Dict:
+    options = StubOptions(
+        latency=args.latency,
+        jitter=args.jitter,
+        token_rate=args.token_rate,
+        completion_tokens=args.completion_tokens,
+        tool_call_ratio=args.tool_call_ratio,
+        error_rate=args.error_rate,
+        search_latency=args.search_latency,
+        seed=args.seed,
+    )
+    group_ids = [str(100000 + i) for i in range(args.groups)]
+
+    async with StubServer(options) as server:
+        _, _, group = prepare_plugin(server.base_url, group_ids, args.workdir)
+        from tools.scheduler import scheduler
+
+        manager = group.GroupManager()
+        await manager.load_groups()
+        for gid in group_ids:
+            cc = manager.get_group(gid).chat_config
+            cc.prt = False
+            cc.search = args.search
+            cc.rag = args.rag
+            cc.allin = args.rag
+
+        latencies: List[float] = []
+        failures: List[str] = []
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _user_loop(manager.get_group(gid).chat_handler, gid, f"{gid}{u:02d}",
+                       args.turns, args.think, latencies, failures)
+            for gid in group_ids for u in range(args.users)
+        ))
+        elapsed = time.perf_counter() - start
+
+        for grp in manager.groups.values():
+            await grp.chat_handler.http_client.aclose()
+
+        return {
+            "config": {k: v for k, v in vars(args).items() if k not in ("json", "workdir")},
+            "turns": len(latencies),
+            "failures": len(failures),
+            "elapsed_s": elapsed,
+            "throughput_tps": len(latencies) / elapsed if elapsed else 0.0,
+            "latency_s": latency_summary(latencies),
+            "upstream_calls": dict(server.calls),
+            "upstream_errors": dict(server.errors),
+            "tokens": dict(server.tokens),
+            "scheduler": scheduler.stats(),
+        }
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="HuaEr bot 离线压测")
+    parser.add_argument("--groups", type=int, default=4, help="并发组群数")
+    parser.add_argument("--users", type=int, default=3, help="每群并发用户数")
+    parser.add_argument("--turns", type=int, default=5, help="每个用户的对话轮数")
+    parser.add_argument("--think", type=float, default=0.0, help="用户两轮之间的间隔（秒）")
+    parser.add_argument("--search", action="store_true", help="开启联网搜索（走function calling）")
+    parser.add_argument("--rag", action="store_true", help="开启RAG及allin（需要hipporag_lite）")
+    parser.add_argument("--latency", type=float, default=0.2, help="桩LLM基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="桩LLM生成速度（token/秒）")
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--tool-call-ratio", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率")
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="临时数据目录，默认自动创建")
+    parser.add_argument("--json", default=None, help="报告输出路径")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    dump_report(asyncio.run(run(arguments)), arguments.json)
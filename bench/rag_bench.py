@@ -0,0 +1,127 @@
+'''
+RAG规模基准：以确定性的伪嵌入/伪抽取桩服务器测量HippoRAG随索引增长的开销
+
+依次把索引填充到 --sizes 中的各个规模，在每个检查点测量：
+索引吞吐、不同num下的检索延迟、save/重新加载耗时、磁盘占用与进程内存峰值。
+默认关闭RAGStore的词法索引与公共知识库，使检索全部落到HippoRAG上（基准的关键词查询大多会被BM25短路）；
+加 --lexical 则测量插件实际使用的混合检索。
+
+用法（在插件根目录、已安装插件依赖的环境中运行）：
+    python -m bench.rag_bench --sizes 1000,10000,100000 --nums 1,3,5 --json rag_report.json
+'''
+import os
+import time
+import random
+import asyncio
+import argparse
+import resource
+from pathlib import Path
+from typing import Dict, List
+
+from .common import prepare_plugin, latency_summary, dump_report
+from .stubs import StubServer, StubOptions
+
+SUBJECTS = ["小明", "小红", "华尔", "阿强", "Alice", "Bob", "老王", "猫猫"]
+VERBS = ["喜欢", "讨厌", "记得", "希望", "许诺", "认为"]
+OBJECTS = ["草莓蛋糕", "周末爬山", "Python", "考试周", "新番动画", "火锅", "夜跑", "第{n}号计划"]
+
+def make_passages(count: int, start: int, seed: int) -> List[str]:
+    """生成与allin模式下对话记录形态相近的确定性语料"""
+    rng = random.Random(seed + start)
+    out = []
+    for n in range(start, start + count):
+        obj = rng.choice(OBJECTS).format(n=n)
+        out.append(f"用户[{rng.choice(SUBJECTS)}]: 时间[2025-08-{n % 28 + 1:02d}] 我{rng.choice(VERBS)}{obj}，编号{n}")
+    return out
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) if path.exists() else 0
+
+def max_rss_mb() -> float:
+    """进程常驻内存峰值（MB，Linux下ru_maxrss单位为KB）"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def run(args: argparse.Namespace) -> Dict:
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    nums = [int(n) for n in args.nums.split(",")]
+    options = StubOptions(latency=args.latency, jitter=0.0, token_rate=0, embedding_dim=args.dim, seed=args.seed)
+
+    async with StubServer(options) as server:
+        config, _, _ = prepare_plugin(server.base_url, [], args.workdir)
+        config.RAG = {**config.RAG, "lexical": args.lexical, "shared": False} # 只测本群的库
+        cc = config.ChatConfig(900001) # 独立的基准组群，数据位于临时目录
+        cc.file.mkdir(parents=True, exist_ok=True)
+        Path(cc.rag_file).mkdir(parents=True, exist_ok=True)
+
+        rng = random.Random(args.seed)
+        checkpoints = []
+        indexed = 0
+        for size in sizes:
+            batch_times: List[float] = []
+            t0 = time.perf_counter()
+            while indexed < size:
+                batch = make_passages(min(args.batch, size - indexed), indexed, args.seed)
+                b0 = time.perf_counter()
+                await cc.hipporag.index(batch)
+                batch_times.append(time.perf_counter() - b0)
+                indexed += len(batch)
+            ingest_s = time.perf_counter() - t0
+
+            retrieve = {}
+            for num in nums:
+                samples = []
+                for _ in range(args.queries):
+                    n = rng.randrange(indexed)
+                    query = [f"谁{rng.choice(VERBS)}编号{n}的事情"]
+                    q0 = time.perf_counter()
+                    await cc.hipporag.retrieve(query, num)
+                    samples.append(time.perf_counter() - q0)
+                retrieve[str(num)] = latency_summary(samples)
+
+            s0 = time.perf_counter()
+            await cc.hipporag.save()
+            save_s = time.perf_counter() - s0
+
+            l0 = time.perf_counter()
+            cc._reset_rag() # 重新从磁盘构建实例
+            await cc.hipporag.retrieve(["加载预热"], 1)
+            load_s = time.perf_counter() - l0
+
+            checkpoints.append({
+                "passages": indexed,
+                "ingest_s": ingest_s,
+                "ingest_passages_per_s": (indexed - (checkpoints[-1]["passages"] if checkpoints else 0)) / ingest_s if ingest_s else 0.0,
+                "batch_latency_s": latency_summary(batch_times),
+                "retrieve_latency_s": retrieve,
+                "save_s": save_s,
+                "load_s": load_s,
+                "disk_bytes": dir_size(Path(cc.rag_file)),
+                "max_rss_mb": max_rss_mb(),
+            })
+            print(f"[{indexed}] ingest {ingest_s:.1f}s, save {save_s:.2f}s, load {load_s:.2f}s", flush=True)
+
+        return {
+            "config": {k: v for k, v in vars(args).items() if k not in ("json", "workdir")},
+            "pid": os.getpid(),
+            "checkpoints": checkpoints,
+            "upstream_calls": dict(server.calls),
+            "tokens": dict(server.tokens),
+        }
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="HuaEr bot RAG规模基准")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="逗号分隔的索引规模检查点")
+    parser.add_argument("--nums", default="1,3,5", help="逗号分隔的检索num取值")
+    parser.add_argument("--queries", type=int, default=50, help="每个num的检索次数")
+    parser.add_argument("--batch", type=int, default=100, help="每次index调用的文档数")
+    parser.add_argument("--dim", type=int, default=256, help="伪嵌入维度")
+    parser.add_argument("--latency", type=float, default=0.0, help="桩服务器延迟（秒），默认不模拟网络")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lexical", action="store_true", help="启用词法索引（测量混合检索而非HippoRAG本身）")
+    parser.add_argument("--workdir", default=None, help="临时数据目录，默认自动创建")
+    parser.add_argument("--json", default=None, help="报告输出路径")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    dump_report(asyncio.run(run(arguments)), arguments.json)
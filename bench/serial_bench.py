@@ -0,0 +1,102 @@
+'''
+序列化基准：比较tools.serial（orjson可用时）与原先标准库写法在真实形态数据上的编解码耗时
+
+数据按组群配置的实际形态构造：记忆体为带时间戳和用户名的中英混合对话，
+payload为发送给上游的请求体（人格+工具资料+记忆），state为保存的组群配置。
+对比项：
+    payload  原先由httpx以json=编码（json.dumps后encode）      现为serial.dumps
+    response 原先response.json()（json.loads）               现为serial.loads
+    state    原先json.dump(indent=2, ensure_ascii=False)     现为serial.dumps(pretty=True)（[state] pretty关闭时为紧凑输出，另记两者体积）
+
+用法（在插件根目录运行，无需桩服务器）：
+    python -m bench.serial_bench --rounds 6,50,200,1000 --repeat 200
+'''
+import json
+import time
+import random
+import argparse
+from typing import Any, Callable, Dict, List
+
+from .common import dump_report # 导入common时会把插件根目录加入sys.path
+from tools import serial
+
+LINES = ["今天的草莓蛋糕好好吃喵~", "帮我查一下明天上海的天气", "Python的asyncio怎么取消任务？", "周末一起去爬山吗",
+         "我记得你说过喜欢火锅", "The quick brown fox jumps over the lazy dog.", "考试周好累，想睡觉"]
+
+def make_memory(count: int, seed: int) -> List[Dict[str, str]]:
+    """生成count条与_create_mess输出形态一致的对话记录"""
+    rng = random.Random(seed)
+    mess = []
+    for n in range(count):
+        stamp = f"时间[2025-08-{n % 28 + 1:02d} 12:{n % 60:02d}:00] "
+        if n % 2 == 0:
+            text = "，".join(rng.choice(LINES) for _ in range(rng.randint(1, 4)))
+            mess.append({"role": "user", "content": f"{stamp}用户[群友{rng.randint(1, 30)}]: {text}"})
+        else:
+            text = "".join(rng.choice(LINES) for _ in range(rng.randint(3, 12)))
+            mess.append({"role": "assistant", "content": stamp + text})
+    return mess
+
+def make_payload(mess: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {
+        "model": "deepseek-ai/DeepSeek-V3",
+        "messages": [{"role": "system", "content": "你是名叫华尔的猫娘。"},
+                     {"role": "system", "content": "(资料: " + "；".join(LINES) * 4 + ")"}] + mess,
+        "max_tokens": 1024,
+    }
+
+def make_response(mess: List[Dict[str, str]]) -> bytes:
+    body = {"id": "chatcmpl-bench", "object": "chat.completion", "model": "deepseek-ai/DeepSeek-V3",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": mess[-1]["content"] if mess else "喵",
+                                     "reasoning_content": "".join(m["content"] for m in mess[-4:])}}],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200}}
+    return json.dumps(body).encode("utf-8") # 上游返回的是默认转义的ASCII JSON
+
+def make_state(mess: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {"rd": len(mess), "prt": True, "mod": 3, "tkc": False, "rag": True, "memory": mess, "compact": False,
+            "summary": "".join(LINES), "cooldown": 300.0, "max_token": 1024, "default_personality": "你是名叫华尔的猫娘。",
+            "cooldown_until": 0.0, "recall_times": 0}
+
+def timeit(func: Callable[[], Any], repeat: int) -> float:
+    """单次调用的平均耗时（微秒），取三轮中最快的一轮"""
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        best = min(best, time.perf_counter() - t0)
+    return best / repeat * 1e6
+
+def run(args: argparse.Namespace) -> Dict:
+    results = []
+    for rounds in (int(r) for r in args.rounds.split(",")):
+        mess = make_memory(rounds, args.seed)
+        payload, response, state = make_payload(mess), make_response(mess), make_state(mess)
+        cases = {
+            "payload": (lambda: json.dumps(payload).encode("utf-8"), lambda: serial.dumps(payload)),
+            "response": (lambda: json.loads(response), lambda: serial.loads(response)),
+            "state": (lambda: json.dumps(state, ensure_ascii=False, indent=2).encode("utf-8"), lambda: serial.dumps(state, pretty=True)),
+        }
+        row = {"messages": rounds, "payload_bytes": len(serial.dumps(payload))}
+        for name, (old, new) in cases.items():
+            before, after = timeit(old, args.repeat), timeit(new, args.repeat)
+            row[name] = {"stdlib_us": round(before, 2), "serial_us": round(after, 2), "speedup": round(before / after, 2)}
+        row["state_bytes"] = {"indent2": len(json.dumps(state, ensure_ascii=False, indent=2).encode("utf-8")),
+                              "compact": len(serial.dumps(state))}
+        results.append(row)
+        print(f"[{rounds}条] payload x{row['payload']['speedup']}, response x{row['response']['speedup']}, "
+              f"state x{row['state']['speedup']}", flush=True)
+    return {"backend": serial.BACKEND, "config": {k: v for k, v in vars(args).items() if k != "json"}, "results": results}
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="HuaEr bot 序列化基准")
+    parser.add_argument("--rounds", default="6,50,200,1000", help="逗号分隔的记忆体条数")
+    parser.add_argument("--repeat", type=int, default=200, help="每项每轮的调用次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="报告输出路径")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    dump_report(run(arguments), arguments.json)
@@ -0,0 +1,269 @@
+'''
+本地桩服务器（仅依赖标准库）
+
+提供与SiliconFlow兼容的 /v1/chat/completions、/v1/embeddings，
+以及Tavily(/search)、百度(/v2/ai_search/chat/completions)格式的搜索接口；
+对HippoRAG的实体/三元组抽取提示词返回固定格式的JSON，
+用于在不消耗真实额度的情况下压测插件。
+'''
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import struct
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+@dataclass
+class StubOptions:
+    '''桩服务器行为参数'''
+    latency: float = 0.2 # 每次请求的基础延迟（秒）
+    jitter: float = 0.05 # 延迟抖动上限（秒）
+    token_rate: float = 200.0 # 生成速度（token/秒），0表示不模拟生成耗时
+    completion_tokens: int = 64 # 每次回复的token数
+    tool_call_ratio: float = 1.0 # 携带tools的请求返回tool_calls的概率
+    error_rate: float = 0.0 # 返回错误的概率
+    error_status: int = 500 # 注入错误的HTTP状态码
+    search_latency: float = 0.1 # 搜索接口延迟（秒）
+    search_results: int = 3 # 每次搜索返回的条目数
+    embedding_dim: int = 256 # 伪嵌入向量维度
+    seed: int = 0
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """以文本哈希为种子生成确定性的单位向量"""
+    out: List[float] = []
+    counter = 0
+    while len(out) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        out.extend((v / 2**31) - 1.0 for v in struct.unpack("<8I", digest))
+        counter += 1
+    vec = out[:dim]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+def estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    """粗略估算提示词token数（约每1.5个字符一个token）"""
+    return sum(int(len(str(m.get("content", ""))) / 1.5) + 4 for m in messages)
+
+class StubServer:
+    '''
+    极简异步HTTP/1.1服务器，支持keep-alive与Content-Length请求体
+
+    calls按"METHOD path"统计调用次数，tokens统计提示/生成token数。
+    '''
+    def __init__(self, options: Optional[StubOptions] = None, host: str = "127.0.0.1", port: int = 0):
+        self.options = options or StubOptions()
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.tokens: Counter = Counter()
+        self.rng = random.Random(self.options.seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: set = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "StubServer":
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        for writer in list(self._writers): # 先断开长连接，让连接协程自然退出
+            writer.close()
+        await asyncio.sleep(0)
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    # HTTP层
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers: Dict[str, str] = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                status, payload = await self._route(method, path.split("?")[0], body)
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'ERR'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        self.calls[f"{method} {path}"] += 1
+        try:
+            req = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            return 400, {"error": "invalid json"}
+
+        if self.options.error_rate and self.rng.random() < self.options.error_rate:
+            self.errors[path] += 1
+            await asyncio.sleep(self.options.latency)
+            return self.options.error_status, {"error": "injected failure"}
+
+        if path.endswith("/chat/completions") and "resource_type_filter" in req:
+            return 200, await self._baidu_search(req)
+        if path.endswith("/chat/completions"):
+            return 200, await self._completion(req)
+        if path.endswith("/embeddings"):
+            return 200, await self._embeddings(req)
+        if path.endswith("/search"):
+            return 200, await self._tavily_search(req)
+        return 404, {"error": f"unknown path {path}"}
+
+    # 业务层
+    async def _sleep(self, base: float, tokens: int = 0):
+        delay = base + self.rng.random() * self.options.jitter
+        if tokens and self.options.token_rate > 0:
+            delay += tokens / self.options.token_rate
+        await asyncio.sleep(delay)
+
+    @staticmethod
+    def _entities(text: str, limit: int = 3) -> List[str]:
+        """从文本中确定性地抽取若干"实体"（英文/数字词或两字中文片段）"""
+        found: List[str] = []
+        for token in re.findall(r"[A-Za-z0-9]+|[\u4e00-\u9fff]{2}", text):
+            if token not in found:
+                found.append(token)
+            if len(found) >= limit:
+                break
+        return found or ["未知"]
+
+    def _rag_extraction(self, prompt: str, last: str) -> Optional[str]:
+        """为HippoRAG的NER/三元组抽取提示词返回固定格式的JSON，其余请求返回None"""
+        lowered = prompt.lower()
+        if "triple" in lowered:
+            ents = self._entities(last, 4)
+            triples = [[ents[i], "相关", ents[i + 1]] for i in range(len(ents) - 1)] or [[ents[0], "是", ents[0]]]
+            return json.dumps({"triples": triples}, ensure_ascii=False)
+        if "named_entities" in lowered or "named entity" in lowered:
+            return json.dumps({"named_entities": self._entities(last)}, ensure_ascii=False)
+        return None
+
+    def _tool_arguments(self, name: str, text: str) -> Dict[str, Any]:
+        if name == "_llm_tool_ddg_search":
+            return {"queries": [text[:32]], "max_results": self.options.search_results}
+        if name == "_llm_tool_rag_retrieve":
+            return {"queries": [text[:32]], "num": 2}
+        if name == "_llm_tool_rag_index":
+            return {"contents": [text[:64]]}
+        return {}
+
+    async def _completion(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        messages = req.get("messages", [])
+        prompt_tokens = estimate_tokens(messages)
+        last = str(messages[-1].get("content", "")) if messages else ""
+        tools = req.get("tools") or []
+
+        message: Dict[str, Any] = {"role": "assistant"}
+        completion_tokens = self.options.completion_tokens
+        if tools and self.rng.random() < self.options.tool_call_ratio:
+            completion_tokens = 16
+            message["content"] = ""
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{i}_{int(time.time() * 1000)}",
+                    "type": "function",
+                    "function": {
+                        "name": t["function"]["name"],
+                        "arguments": json.dumps(self._tool_arguments(t["function"]["name"], last), ensure_ascii=False),
+                    },
+                }
+                for i, t in enumerate(tools) if t.get("type") == "function"
+            ]
+        elif (extracted := self._rag_extraction(" ".join(str(m.get("content", "")) for m in messages), last)) is not None:
+            completion_tokens = len(extracted) // 2
+            message["content"] = extracted
+        else:
+            message["content"] = "喵~ " + ("好的" * max(1, completion_tokens // 2))
+            message["reasoning_content"] = "（桩服务器思考内容）"
+
+        self.tokens["prompt"] += prompt_tokens
+        self.tokens["completion"] += completion_tokens
+        await self._sleep(self.options.latency, completion_tokens)
+        return {
+            "id": "stub",
+            "object": "chat.completion",
+            "model": req.get("model", ""),
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    async def _embeddings(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = req.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self.tokens["embedding"] += sum(len(t) for t in inputs)
+        await self._sleep(self.options.latency / 4)
+        return {
+            "object": "list",
+            "model": req.get("model", ""),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(t, self.options.embedding_dim)}
+                for i, t in enumerate(inputs)
+            ],
+        }
+
+    def _search_items(self, query: str) -> List[Dict[str, str]]:
+        return [
+            {"title": f"{query} - 结果{i}", "url": f"https://example.invalid/{i}", "content": f"关于{query}的桩搜索结果{i}。"}
+            for i in range(self.options.search_results)
+        ]
+
+    async def _tavily_search(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        await self._sleep(self.options.search_latency)
+        return {"query": req.get("query", ""), "results": self._search_items(req.get("query", ""))}
+
+    async def _baidu_search(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        await self._sleep(self.options.search_latency)
+        query = req["messages"][-1]["content"] if req.get("messages") else ""
+        return {"references": self._search_items(query)}
+
+async def _main():
+    import argparse
+    parser = argparse.ArgumentParser(description="单独运行桩服务器")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = await StubServer(StubOptions(latency=args.latency, error_rate=args.error_rate), port=args.port).start()
+    print(f"stub server listening on {server.base_url}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,103 @@
+'''
+trace查看器：读取 data/traces 下的JSONL（native或otel格式，含滚动备份）
+
+用法：
+    python -m bench.trace_view                  # 列出最慢的若干条trace
+    python -m bench.trace_view --trace 1a2b3c4d # 按trace_id（前缀即可）打印瀑布图
+'''
+import json
+import argparse
+from pathlib import Path
+from collections import defaultdict
+from typing import Dict, List
+
+from .common import ROOT
+
+def _normalize(record: Dict) -> Dict:
+    """将两种格式统一为 trace_id/span_id/parent_id/name/start/duration_ms/status/attrs"""
+    if "traceId" in record:
+        attrs = {a["key"]: next(iter(a["value"].values()), "") for a in record.get("attributes", [])}
+        status = record.get("status", {})
+        return {
+            "trace_id": record["traceId"],
+            "span_id": record["spanId"],
+            "parent_id": record.get("parentSpanId") or None,
+            "name": record["name"],
+            "start": record["startTimeUnixNano"] / 1e9,
+            "duration_ms": (record["endTimeUnixNano"] - record["startTimeUnixNano"]) / 1e6,
+            "status": "ok" if status.get("code", 1) == 1 else status.get("message", "error"),
+            "attrs": attrs,
+        }
+    return record
+
+def load_spans(trace_dir: Path) -> Dict[str, List[Dict]]:
+    """按trace_id分组读取所有span"""
+    traces: Dict[str, List[Dict]] = defaultdict(list)
+    for file in sorted(trace_dir.glob("*.jsonl*")):
+        with open(file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    span = _normalize(json.loads(line))
+                except (json.JSONDecodeError, KeyError):
+                    continue
+                traces[span["trace_id"]].append(span)
+    return traces
+
+def _extent(spans: List[Dict]) -> float:
+    start = min(s["start"] for s in spans)
+    return max(s["start"] + s["duration_ms"] / 1000 for s in spans) - start
+
+def summarize(traces: Dict[str, List[Dict]], top: int) -> str:
+    rows = sorted(traces.items(), key=lambda kv: _extent(kv[1]), reverse=True)[:top]
+    lines = [f"共 {len(traces)} 条trace，最慢的 {len(rows)} 条：", "总耗时ms | span数 | trace_id | 根span"]
+    for trace_id, spans in rows:
+        roots = [s for s in spans if not s["parent_id"]]
+        root = roots[0] if roots else spans[0]
+        attrs = " ".join(f"{k}={v}" for k, v in root.get("attrs", {}).items())
+        lines.append(f"{_extent(spans) * 1000:9.1f} | {len(spans):5d} | {trace_id[:16]} | {root['name']} {attrs}")
+    return "\n".join(lines)
+
+def waterfall(spans: List[Dict], width: int = 60) -> str:
+    """以父子关系缩进、按相对时间画条形图"""
+    origin = min(s["start"] for s in spans)
+    total = _extent(spans) or 1e-9
+    children: Dict[str, List[Dict]] = defaultdict(list)
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        children[s["parent_id"] if s["parent_id"] in ids else None].append(s)
+
+    lines = [f"trace {spans[0]['trace_id']}  总耗时 {total * 1000:.1f}ms"]
+    def walk(parent, depth):
+        for s in sorted(children.get(parent, []), key=lambda x: x["start"]):
+            offset = int((s["start"] - origin) / total * width)
+            length = max(1, int(s["duration_ms"] / 1000 / total * width))
+            bar = " " * offset + "█" * min(length, width - offset)
+            flag = "" if s.get("status", "ok") == "ok" else f" !{s['status']}"
+            label = ("  " * depth + s["name"])[:28]
+            lines.append(f"{label:<28} |{bar:<{width}}| {s['duration_ms']:8.1f}ms{flag}")
+            walk(s["span_id"], depth + 1)
+    walk(None, 0)
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="HuaEr bot trace查看器")
+    parser.add_argument("--dir", default=str(ROOT / "data" / "traces"), help="trace文件所在目录")
+    parser.add_argument("--trace", default=None, help="trace_id或其前缀")
+    parser.add_argument("--top", type=int, default=20, help="列出最慢trace的条数")
+    args = parser.parse_args()
+
+    traces = load_spans(Path(args.dir))
+    if not args.trace:
+        print(summarize(traces, args.top))
+        return
+    matched = [tid for tid in traces if tid.startswith(args.trace)]
+    if not matched:
+        print(f"未找到trace: {args.trace}")
+    for tid in matched:
+        print(waterfall(traces[tid]))
+
+if __name__ == "__main__":
+    main()
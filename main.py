@@ -2,7 +2,7 @@
 # Copyright (c) 2025 HuaEr DevGroup. Licensed under MIT.
 import re
 from pathlib import Path
-from asyncio import to_thread, gather
+from asyncio import gather, create_task
 
 from astrbot import logger
 from astrbot.api.event import filter
@@ -12,7 +12,13 @@ from astrbot.api.event import AstrMessageEvent as Event
 
 from .tools import chat
 from .tools import config as cc
-from .tools.config import Information, Tools
+from .tools.limiter import AdmissionControl, RateLimiter
+from .tools.log import sinks
+from .tools.profiler import profiler
+from .tools.scheduler import scheduler
+from .tools.tasks import tasks
+from .tools.ledger import ledger
+from .tools.config import Information, Tools, MODELS
 from .tools.group import GroupManagement, GroupManager
 
 # 权限响应器
@@ -43,7 +49,10 @@ class HuaErBot(Star):
 
         # 初始化核心组件
         self.groupmanager = GroupManager()
+        self.rate_limiter = RateLimiter() # 对话限流器
+        self.admission = AdmissionControl() # 对话准入（过载保护）
         self.ID_symbol = None  # 管理员控制符号
+        self._lease_task = None # 多进程部署时的租约循环
 
 
     async def initialize(self):
@@ -56,6 +65,14 @@ class HuaErBot(Star):
             f"{'='*40}\n"
         )
         logger.info(version_info)
+        await self.groupmanager.load_groups()
+        await cc.state_io().call(ledger.open)
+        if self.groupmanager.workers > 1:
+            try:
+                await self.groupmanager.rebalance() # 先取得租约再开始服务，否则首次续约前的事件会因不负责任何组群被丢弃
+            except Exception as e:
+                logger.error(f"租约初始化失败: {e}")
+            self._lease_task = create_task(self.groupmanager.run_leases())
 
     def _get_group(self, group_id: str) -> GroupManagement:
         return self.groupmanager.get_group(group_id)
@@ -72,8 +89,20 @@ class HuaErBot(Star):
         elif event.is_private_chat():
             return self.groupmanager.private_group_id
 
+    def _check_rate(self, event: Event, group: GroupManagement) -> str:
+        "对话限流检查，通过时返回空字符串，超级用户不受限制"
+        if event.is_admin():
+            return ""
+        passed, wait = self.rate_limiter.acquire(
+            str(event.get_sender_id()), group.chat_config.name, MODELS[group.chat_config.mod]
+        )
+        return "" if passed else f"⏳ 请求过于频繁，请{max(1, round(wait))}秒后再试"
+
     def _check_access(self, event: Event) -> bool:
-        "依据白名单鉴权"
+        "依据白名单鉴权；组群尚未加载完成、或多进程部署时由其他进程负责的组群不响应"
+        target = self._get_info(event)
+        if self._get_group(target) is None or not self.groupmanager.owns(target):
+            return False
         user_id = event.get_sender_id()
         group_id =  None if event.is_private_chat() else str(event.get_group_id())
         if group_id:
@@ -92,7 +121,27 @@ class HuaErBot(Star):
         """核心功能，可设置调用限制，参见配置文件"""
         if not self._check_access(event):
             return
-        yield event.plain_result(await self._get_group(self._get_info(event)).chat_handler.handle_chat(event, Tools._extract_args(event.get_message_str(), "对话")))
+        group = self._get_group(self._get_info(event))
+        contents = Tools._extract_args(event.get_message_str(), "对话")
+        if not contents: # 无效输入不消耗限流令牌，也不占用准入名额
+            yield event.plain_result("📛 请输入有效内容")
+            return
+        if limited := self._check_rate(event, group):
+            yield event.plain_result(limited)
+            return
+        if (ticket := self.admission.enter(event.is_admin())) is None:
+            yield event.plain_result("⚠️ 当前请求过多，请稍后再试")
+            return
+        try:
+            if not ticket.granted:
+                yield event.plain_result(f"⏳ 当前繁忙，您前面还有{ticket.ahead}条，请稍候" if ticket.ahead else "⏳ 当前繁忙，马上轮到您，请稍候")
+                if not await self.admission.wait(ticket):
+                    yield event.plain_result("⌛ 排队超时，请稍后再试")
+                    return
+            yield event.plain_result(await group.chat_handler.handle_chat(event, contents))
+        finally:
+            self.admission.leave(ticket)
+            if profiler.active: profiler.turn_done() # 生成器提前结束（如排队超时、被关闭）也计为一轮
 
     @filter.command("MD")
     async def handle_markdown(self, event: Event):
@@ -188,6 +237,20 @@ class HuaErBot(Star):
             return
         yield event.plain_result(self._get_group(self._get_info(event)).chat_handler.handle_clean_memory())
 
+    @filter.command("记忆压缩")
+    async def handle_switch_compact(self, event: Event):
+        """超出记忆容量的对话折叠进滚动摘要，而非直接丢弃(switch)"""
+        if not self._check_access(event):
+            return
+        yield event.plain_result(self._get_group(self._get_info(event)).chat_handler.switch_compact())
+
+    @filter.command("合并回复")
+    async def handle_switch_batch(self, event: Event):
+        """窗口期内多位用户的对话请求合为一次请求，再拆分回各自(switch)"""
+        if not self._check_access(event):
+            return
+        yield event.plain_result(self._get_group(self._get_info(event)).chat_handler.switch_batch())
+
     @filter.command("RAG添加")
     async def handle_insert_rag(self, event: Event):
         """添加文档至RAG索引(多个内容可用空格分隔)"""
@@ -219,6 +282,47 @@ class HuaErBot(Star):
             return
         yield event.plain_result(await self._get_group(self._get_info(event)).chat_handler.handle_save_index())
 
+    @filter.command("RAG导入")
+    async def handle_ingest_rag(self, event: Event):
+        """流式导入数据目录下的txt/md/jsonl文件至RAG索引（切块、分批、可断点续传）"""
+        if not self._check_access(event):
+            return
+        contents = Tools._extract_args(event.get_message_str(), "RAG导入")
+        async for message in self._get_group(self._get_info(event)).chat_handler.handle_bulk_ingest(" ".join(contents)):
+            yield event.plain_result(message)
+
+    @filter.command("RAG去重")
+    async def handle_dedup_rag(self, event: Event):
+        """查看或设置自动入库前的近重复过滤阈值"""
+        if not self._check_access(event):
+            return
+        contents = Tools._extract_args(event.get_message_str(), "RAG去重")
+        yield event.plain_result(self._get_group(self._get_info(event)).chat_handler.handle_dedup_setting(contents))
+
+    @filter.command("RAG容量")
+    async def handle_capacity_rag(self, event: Event):
+        """查看或设置RAG索引的容量上限与淘汰策略"""
+        if not self._check_access(event):
+            return
+        contents = Tools._extract_args(event.get_message_str(), "RAG容量")
+        yield event.plain_result(await self._get_group(self._get_info(event)).chat_handler.handle_capacity_setting(contents))
+
+    @filter.command("RAG迁出")
+    async def handle_export_rag(self, event: Event):
+        """将RAG索引（文档、嵌入与图谱）打包为可迁移的压缩归档"""
+        if not self._check_access(event):
+            return
+        contents = Tools._extract_args(event.get_message_str(), "RAG迁出")
+        yield event.plain_result(await self._get_group(self._get_info(event)).chat_handler.handle_export_archive(contents))
+
+    @filter.command("RAG迁入")
+    async def handle_import_rag(self, event: Event):
+        """从RAG归档合并索引，直接使用归档中的嵌入而不重新嵌入"""
+        if not self._check_access(event):
+            return
+        contents = Tools._extract_args(event.get_message_str(), "RAG迁入")
+        yield event.plain_result(await self._get_group(self._get_info(event)).chat_handler.handle_import_archive(" ".join(contents)))
+
     # ===================== 人格管理事件组 =====================
     # 人格管理响应器定义
     # 与bot行为相关的设定
@@ -243,7 +347,7 @@ class HuaErBot(Star):
         "此群已经存储的人格（私有人格）或公共人格将被列出"
         if not self._check_access(event):
             return
-        yield event.plain_result(self._get_group(self._get_info(event)).personality_manager.handle_list_persona())
+        yield event.plain_result(await self._get_group(self._get_info(event)).personality_manager.handle_list_persona())
 
     @filter.command("人格读取")
     async def handle_load_persona(self, event: Event):
@@ -251,7 +355,7 @@ class HuaErBot(Star):
         if not self._check_access(event):
             return
         contents = Tools._extract_args(event.get_message_str(), "人格读取")
-        yield event.plain_result(self._get_group(self._get_info(event)).personality_manager.handle_load_persona(contents))
+        yield event.plain_result(await self._get_group(self._get_info(event)).personality_manager.handle_load_persona(contents))
 
     # ===================== 白名单管理事件组 =====================
     # 白名单管理响应器定义
@@ -289,14 +393,14 @@ class HuaErBot(Star):
         "将此群的配置保存到自身配置文件中"
         if not self._check_access(event):
             return
-        yield event.plain_result(self._get_group(self._get_info(event)).save_group())
+        yield event.plain_result(await self._get_group(self._get_info(event)).save_group())
 
     @filter.command("加载配置")
     async def load_group(self, event: Event):
         "加载此群自身的配置文件"
         if not self._check_access(event):
             return
-        yield event.plain_result(self._get_group(self._get_info(event)).load_group())
+        yield event.plain_result(await self._get_group(self._get_info(event)).load_group())
 
     @filter.command("重置配置")
     async def reset_group(self, event: Event):
@@ -346,6 +450,54 @@ class HuaErBot(Star):
                 logger.warning("未检测到组群号")
                 yield event.plain_result("⚠️ 请输入组群号")
 
+    @perm_dec
+    @filter.command("调度状态")
+    async def show_scheduler(self, event: Event):
+        """查看上游API调度器的并发与排队耗时指标，以及对话准入与后台任务情况"""
+        yield event.plain_result("\n".join((scheduler.stats_text(), self.admission.stats_text(), tasks.stats_text())))
+
+    @perm_dec
+    @filter.command("用量统计")
+    async def show_ledger(self, event: Event):
+        """查看最近N天（默认1天即今天）token用量最多的组群、用户与模型，以及各组群的每日预算"""
+        contents = Tools._extract_args(event.get_message_str(), "用量统计")
+        if contents and not contents[0].isdigit():
+            yield event.plain_result("⚠️ 格式错误，正确格式：/用量统计 [天数]")
+            return
+        await ledger.flush()
+        yield event.plain_result(await cc.state_io().call(ledger.report, int(contents[0]) if contents else 1))
+
+    @perm_dec
+    @filter.command("性能分析")
+    async def handle_profile(self, event: Event):
+        """剖析接下来N轮对话（默认5轮）或T秒（参数带s/秒后缀），结束后返回耗时最多的函数"""
+        contents = Tools._extract_args(event.get_message_str(), "性能分析")
+        arg = contents[0] if contents else "5"
+        if not (match := re.fullmatch(r'(\d+(?:\.\d+)?)\s*(s|秒)?', arg)):
+            yield event.plain_result("⚠️ 格式错误，正确格式：/性能分析 [轮数|秒数s]")
+            return
+        value, by_time = float(match.group(1)), bool(match.group(2))
+        if error := profiler.start(turns=0 if by_time else int(value), seconds=value if by_time else 0):
+            yield event.plain_result(error)
+            return
+        yield event.plain_result(f"🔬 开始剖析{'%g秒' % value if by_time else '%d轮对话' % int(value)}")
+        yield event.plain_result(await profiler.wait(value + 5 if by_time else 600))
+
+    @perm_dec
+    @filter.command("共享RAG添加")
+    async def handle_insert_shared_rag(self, event: Event):
+        """添加文档至所有组群共享的公共知识库(多个内容可用空格分隔)"""
+        yield event.plain_result("开始插入，请稍等...")
+        contents = Tools._extract_args(event.get_message_str(), "共享RAG添加")
+        yield event.plain_result(await self._get_group("public").chat_handler.handle_shared_index(contents))
+
+    @perm_dec
+    @filter.command("共享RAG删除")
+    async def handle_delete_shared_rag(self, event: Event):
+        """从公共知识库删除文档(多个内容可用空格分隔)"""
+        contents = Tools._extract_args(event.get_message_str(), "共享RAG删除")
+        yield event.plain_result(await self._get_group("public").chat_handler.handle_shared_index(contents, delete=True))
+
     @filter.command("退出群聊")
     async def exit_group(self, event: Event):
         """解控群聊"""
@@ -359,19 +511,33 @@ class HuaErBot(Star):
     async def terminate(self):
         """关闭时自动保存函数"""
         logger.info("检测到终止指令，自动保存中...")
-
-        tasks = []
-        for group in self.groupmanager.groups.values():
-            tasks.append(to_thread(group.save_group))
-            tasks.append(group.chat_handler.handle_save_index())
-
-        results = await gather(*tasks, return_exceptions=True)
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+        await tasks.drain() # 先排空后台RAG写入等任务，再保存索引
+        await ledger.flush()
+
+        jobs = []
+        for group_id, group in self.groupmanager.groups.items():
+            if not self.groupmanager.owns(group_id): # 由其他进程负责的组群，内存中的状态可能已过时
+                continue
+            jobs.append(group.save_group())
+            jobs.append(group.chat_handler.handle_save_index())
+        if (shared := cc.shared_rag(create=False)) is not None:
+            jobs.append(shared.save())
+
+        results = await gather(*jobs, return_exceptions=True)
 
         for result in results:
             if isinstance(result, Exception):
                 logger.error(f"保存任务失败: {result}")
 
+        if self.groupmanager.workers > 1:
+            await cc.state_io().call(self.groupmanager.release_all)
+        cc.state_io().close() # 等待I/O线程池中的写入完成
+        ledger.close()
+        cc.state_store().close()
         logger.info("保存完毕！")
+        sinks.shutdown() # 刷新后台日志队列
 
 # ===================================================
 #                   项目落款 / Project Footer
@@ -0,0 +1 @@
+'''单元测试：各模块的离线测试，不访问网络（需要上游的部分使用 bench.stubs 的本地桩服务器或替换HTTP层）'''
@@ -0,0 +1,54 @@
+'''测试公共部分：把插件根目录加入sys.path，测试以 tools.xxx 的形式导入各模块
+
+用法（在插件根目录运行，需已安装AstrBot）：
+    python -m pytest -q tests
+'''
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from typing import Dict, Iterator, List, Tuple
+
+import pytest
+
+from tools.rag import QuerySolution, RAGBackend
+
+class MemoryBackend(RAGBackend):
+    '''内存中的RAG后端，语义与HippoRAG一致：任一文档已存在时index整批拒绝，全部不存在时delete报错'''
+    def __init__(self):
+        self.docs : Dict[str, str] = {}
+        self.calls : Dict[str, int] = {"index": 0, "retrieve": 0, "delete": 0}
+
+    async def index(self, contents: List[str]):
+        self.calls["index"] += 1
+        if existing := [c for c in contents if c in self.docs]:
+            raise ValueError(f"以下文档已存在于索引中: {existing}")
+        for text in contents:
+            self.docs[text] = f"chunk-{len(self.docs)}"
+
+    async def retrieve(self, queries: List[str], num: int) -> List[QuerySolution]:
+        self.calls["retrieve"] += 1
+        return [QuerySolution(q, [d for d in self.docs if set(q) & set(d)][:num]) for q in queries]
+
+    async def delete(self, contents: List[str]):
+        self.calls["delete"] += 1
+        if not (found := [c for c in contents if c in self.docs]):
+            raise ValueError("没有找到可删除的文档")
+        for text in found:
+            del self.docs[text]
+
+    async def clear(self):
+        self.docs.clear()
+
+    async def save(self):
+        pass
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return iter(list(self.docs.items()))
+
+@pytest.fixture
+def memory_backend() -> MemoryBackend:
+    return MemoryBackend()
@@ -0,0 +1,76 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("hipporag_lite")
+
+from bench.stubs import StubServer, StubOptions
+from bench.common import prepare_plugin
+
+DOCS = [f"用户[小明]: 时间[2025-08-0{n}] 我喜欢第{n}号计划，编号{n}" for n in range(1, 7)]
+EMBEDDINGS = "POST /v1/embeddings"
+
+def _group(config, gid: int):
+    cc = config.ChatConfig(gid)
+    cc.file.mkdir(parents=True, exist_ok=True)
+    Path(cc.rag_file).mkdir(parents=True, exist_ok=True)
+    return cc
+
+def test_hipporag_round_trip(tmp_path):
+    async def main():
+        options = StubOptions(latency=0.0, jitter=0.0, token_rate=0, embedding_dim=32)
+        async with StubServer(options) as server:
+            config, _, _ = prepare_plugin(server.base_url, [], tmp_path)
+            from tools.archive import RAGArchive
+            archive = RAGArchive(config.EMBED[0])
+
+            src = _group(config, 900001)
+            await src.hipporag.index(DOCS)
+            await src.hipporag.retrieve([DOCS[0]], 1) # 产生使用记录
+            dest = tmp_path / "src.zip"
+            counts = await archive.export(src.hipporag, dest)
+            assert counts["passages"] == len(DOCS)
+            assert counts["entities"] > 0 and counts["facts"] > 0
+
+            dst = _group(config, 900002)
+            before = server.calls.get(EMBEDDINGS, 0)
+            assert await archive.load(dst.hipporag, dest) == len(DOCS)
+            assert server.calls.get(EMBEDDINGS, 0) == before # 导入不重新嵌入
+            assert sorted(text for text, _ in dst.hipporag) == sorted(DOCS)
+            assert await dst.hipporag.count() == len(DOCS)
+
+            solution = (await dst.hipporag.retrieve([DOCS[2]], 1))[0]
+            assert solution.docs == [DOCS[2]]
+            assert await archive.load(dst.hipporag, dest) == 0 # 重复导入全部跳过
+
+            await dst.hipporag.save()
+            dst._reset_rag() # 从磁盘重新加载
+            assert sorted(text for text, _ in dst.hipporag) == sorted(DOCS)
+
+            with pytest.raises(ValueError):
+                await RAGArchive("other-model").load(dst.hipporag, dest)
+            config.state_io().close()
+            config._state_io = None # 已关闭的入口不留给后续测试
+    asyncio.run(main())
+
+def test_local_round_trip_half_precision(tmp_path):
+    async def main():
+        async with StubServer(StubOptions(latency=0.0, jitter=0.0, token_rate=0, embedding_dim=32)) as server:
+            from tools.rag import RAGStore
+            from tools.vector import LocalVectorBackend
+            from tools.archive import RAGArchive
+            url = f"{server.base_url}/v1/embeddings"
+            make = lambda name: RAGStore(LocalVectorBackend(str(tmp_path / name), "Bearer stub", url, "m"), str(tmp_path / name))
+            src = make("src")
+            await src.index(DOCS)
+            dest = tmp_path / "local.zip"
+            assert (await RAGArchive("m").export(src, dest, half=True)) == {"passages": len(DOCS)}
+
+            dst = make("dst")
+            before = server.calls.get(EMBEDDINGS, 0)
+            assert await RAGArchive("m").load(dst, dest) == len(DOCS)
+            assert server.calls.get(EMBEDDINGS, 0) == before
+            assert (await dst.retrieve([DOCS[4]], 1))[0].docs == [DOCS[4]]
+    asyncio.run(main())
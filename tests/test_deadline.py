@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from tools import deadline as module
+from tools.deadline import TurnDeadline
+from tools.tasks import TaskRegistry
+
+CONF = {"turn_timeout": 90.0, "main_reserve": 30.0, "min_optional": 5.0, "call_timeout": 60.0}
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(module.time, "monotonic", lambda: now[0])
+    return now
+
+def test_no_deadline_outside_scope():
+    turn = TurnDeadline(CONF)
+    assert turn.remaining() is None
+    assert turn.optional() == turn.main() == turn.timeout() == 60.0
+
+def test_optional_stages_leave_reserve_for_main(clock):
+    turn = TurnDeadline(CONF)
+    with turn.scope():
+        assert turn.remaining() == 90.0
+        assert turn.optional() == 60.0 # 不超过单次请求上限
+        assert turn.optional(0.4) == pytest.approx(24.0)
+        clock[0] += 50
+        assert turn.optional() == pytest.approx(10.0)
+        assert turn.main() == pytest.approx(40.0)
+        clock[0] += 30
+        assert turn.optional() == 0.0
+        assert turn.main() == 30.0 # 即使期限将至，主对话仍保留reserve
+    assert turn.remaining() is None
+
+def test_disabled_falls_back_to_call_timeout(clock):
+    turn = TurnDeadline({**CONF, "enable": False})
+    with turn.scope():
+        assert turn.remaining() is None and turn.main() == 60.0
+
+def test_nested_scopes_restore_outer(clock):
+    turn = TurnDeadline(CONF)
+    with turn.scope():
+        clock[0] += 20
+        with turn.scope():
+            assert turn.remaining() == 90.0
+        assert turn.remaining() == 70.0
+
+def test_background_tasks_escape_turn_deadline():
+    async def main():
+        registry, seen = TaskRegistry({}), []
+
+        async def job():
+            seen.append(module.deadline.remaining())
+
+        with module.deadline.scope():
+            assert module.deadline.remaining() is not None
+            registry.spawn(job(), "job")
+        await registry.drain(1.0)
+        return seen
+    assert asyncio.run(main()) == [None]
@@ -0,0 +1,31 @@
+from tools.dedup import Deduplicator, minhash, normalize, similarity, strip_header
+
+def test_normalize_ignores_format():
+    assert normalize("Hello， World！") == normalize("hello world")
+
+def test_strip_header():
+    assert strip_header("时间[2025-08-01 12:00:00] 用户[小明]: 你好") == "你好"
+    assert strip_header("用户[小明]: 你好") == "你好"
+    assert strip_header("普通文本: 你好") == "普通文本: 你好"
+
+def test_same_message_from_different_users_collapses():
+    a = "时间[2025-08-01 12:00:00] 用户[小明]: 你好"
+    b = "时间[2025-08-02 18:30:05] 用户[阿花]: 你好"
+    assert similarity(minhash(a), minhash(b)) == 1.0
+    dedup = Deduplicator()
+    dedup.add([a])
+    assert dedup.is_duplicate(b, 0.8)
+    assert dedup.is_duplicate(b, 1.0) # 规范化后完全一致
+
+def test_near_duplicate_and_distinct():
+    dedup = Deduplicator()
+    dedup.add(["用户[甲]: 明天上海的天气怎么样，会不会下雨，要不要带伞"])
+    assert dedup.is_duplicate("用户[乙]: 明天上海的天气怎么样，会不会下雨，要不要带伞呢", 0.7)
+    assert not dedup.is_duplicate("用户[乙]: Python的asyncio怎么取消任务", 0.7)
+
+def test_remove():
+    dedup = Deduplicator()
+    dedup.add(["草莓蛋糕好好吃", "周末一起去爬山吗"])
+    dedup.remove(["草莓蛋糕好好吃"])
+    assert len(dedup) == 1
+    assert not dedup.is_duplicate("草莓蛋糕好好吃", 0.8)
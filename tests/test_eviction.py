@@ -0,0 +1,46 @@
+import asyncio
+
+from tools.eviction import UsageTable
+from tools.rag import RAGStore
+
+def _table(tmp_path) -> UsageTable:
+    """a最早入库但最近被检索，b检索次数最多，c、d从未被检索"""
+    table = UsageTable(tmp_path / "x.usage.json")
+    for n, text in enumerate("abcd"):
+        table.add([text * 10], now=100.0 + n)
+    table.rows["a" * 10][1:3] = [500.0, 1]
+    table.rows["b" * 10][1:3] = [300.0, 5]
+    return table
+
+def test_policies(tmp_path):
+    table = _table(tmp_path)
+    assert table.victims(3, 0, "age") == ["a" * 10, "b" * 10] # 淘汰到上限的90%以内
+    assert table.victims(3, 0, "lru") == ["c" * 10, "d" * 10]
+    assert table.victims(3, 0, "lfu") == ["c" * 10, "d" * 10]
+    assert table.victims(4, 0, "lru") == [] # 未超限
+
+def test_byte_limit(tmp_path):
+    table = _table(tmp_path)
+    assert table.total_bytes == 40
+    assert table.victims(0, 35, "lru") == ["c" * 10]
+
+def test_persist_and_align(tmp_path):
+    table = _table(tmp_path)
+    table.touch(["c" * 10])
+    table.save()
+    loaded = UsageTable(table.file)
+    loaded.load(["a" * 10, "c" * 10, "e" * 10]) # 与后端实际存在的原文对齐
+    assert loaded.rows["a" * 10][2] == 1 and loaded.rows["c" * 10][2] == 1
+    assert "b" * 10 not in loaded and "e" * 10 in loaded
+    assert loaded.total_bytes == 30
+
+def test_store_evicts_over_capacity(tmp_path, memory_backend):
+    async def main():
+        store = RAGStore(memory_backend, str(tmp_path / "rag"))
+        await store.index([f"文档{i}" for i in range(10)])
+        await store.retrieve(["文档0"], 1)
+        assert await store.evict(5, 0, "lru") == 6 # 回落到 5*0.9
+        assert await store.count() == 4 and len(memory_backend.docs) == 4
+        assert "文档0" in memory_backend.docs # 最近被检索过，保留
+        assert store.stats["evicted"] == 6
+    asyncio.run(main())
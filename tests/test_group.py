@@ -0,0 +1,42 @@
+import asyncio
+
+from bench.common import prepare_plugin
+from tools.state import SQLiteState, shard_of
+
+GROUPS = ["123456", "654321", "111111", "222222"]
+
+def _managers(tmp_path, count: int = 2):
+    '''同一状态库上的count个进程（各自的GroupManager实例）'''
+    config, _, group = prepare_plugin("http://stub.invalid", GROUPS, tmp_path)
+    config._state = SQLiteState(tmp_path / "state.sqlite3", tmp_path)
+    managers = []
+    for index in range(count):
+        group.STATE = {"backend": "sqlite", "workers": count, "worker_index": index, "lease_ttl": 30.0}
+        group.GroupManager._instance, group.GroupManager._initialized = None, False
+        manager = group.GroupManager()
+        manager.owner = f"w{index}"
+        managers.append(manager)
+    group.GroupManager._instance, group.GroupManager._initialized = None, False
+    return config, managers
+
+def test_groups_are_sharded_and_taken_over(tmp_path):
+    config, (w0, w1) = _managers(tmp_path)
+    async def main():
+        assert not w0.owns("private") # 首次rebalance之前不负责任何组群
+        for manager in (w0, w1, w0, w1): # 1号启动前其组群先由0号接管，随后交还
+            await manager.rebalance()
+        assert {"private", "public"} <= w0.owned and not {"private", "public"} & w1.owned # 共用记忆体的实例固定在0号
+        for gid in GROUPS:
+            assert (w0 if shard_of(gid, 2) == 0 else w1).owns(gid)
+        assert w0.owned.isdisjoint(w1.owned)
+
+        w1.release_all() # 1号进程退出，0号接管其组群
+        await w0.rebalance()
+        assert set(GROUPS) <= w0.owned
+        w0.release_all()
+    try:
+        asyncio.run(main())
+    finally:
+        config.state_io().close()
+        config._state.close()
+        config._state = config._state_io = None
@@ -0,0 +1,93 @@
+import asyncio
+
+from tools.ingest import BulkIngestor, iter_chunks
+from tools.rag import RAGStore
+from tools.tokens import estimate_tokens
+
+CONF = {"chunk_tokens": 16, "overlap_tokens": 0, "batch": 4, "concurrency": 2, "report_every": 0.0}
+
+def _source(tmp_path, count: int = 40):
+    path = tmp_path / "notes.txt"
+    path.write_text("\n\n".join(f"第{i}段：今天记录了第{i}件事。" for i in range(count)), encoding="utf-8")
+    return path
+
+async def _drain(ingestor: BulkIngestor, path):
+    progress = None
+    async for progress in ingestor.run(path):
+        pass
+    return progress
+
+def test_chunks_are_bounded_and_deterministic(tmp_path):
+    path = _source(tmp_path)
+    chunks = list(iter_chunks(path, 32, 14))
+    assert chunks == list(iter_chunks(path, 32, 14))
+    assert all(estimate_tokens(c) <= 32 for c in chunks)
+    assert all(a.split()[-1] == b.split()[0] for a, b in zip(chunks, chunks[1:])) # 相邻块以上一块末句开头
+    assert len(list(iter_chunks(path, 32, 0))) < len(chunks)
+
+def test_partially_existing_batch_is_written(tmp_path, memory_backend):
+    path = _source(tmp_path)
+    chunks = list(iter_chunks(path, CONF["chunk_tokens"], 0))
+    assert len(set(chunks)) == len(chunks) == 40
+    store = RAGStore(memory_backend, str(tmp_path / "rag"))
+
+    async def main():
+        await store.index(chunks[1:2]) # 第一批中的一块已存在，HippoRAG会整批拒绝
+        return await _drain(BulkIngestor(store, "g", CONF), path)
+    progress = asyncio.run(main())
+    assert progress["finished"] and progress["failed"] == 0
+    assert progress["indexed"] == len(chunks) - 1 and progress["skipped"] == 1
+    assert set(memory_backend.docs) == set(chunks)
+
+def test_resume_after_failed_batch(tmp_path, memory_backend):
+    path = _source(tmp_path)
+    chunks = list(iter_chunks(path, CONF["chunk_tokens"], 0))
+    store = RAGStore(memory_backend, str(tmp_path / "rag"))
+    index = memory_backend.index
+    poisoned = chunks[10]
+
+    async def flaky(contents):
+        if poisoned in contents:
+            raise RuntimeError("上游超时")
+        await index(contents)
+    memory_backend.index = flaky
+
+    async def main(): # 写入锁绑定在事件循环上，两次导入需在同一个循环中进行
+        first = await _drain(BulkIngestor(store, "g", CONF), path)
+        assert first["failed"] == CONF["batch"]
+        assert first["done"] == 8 # 失败批次之前连续完成的块数
+        assert poisoned not in memory_backend.docs
+        assert BulkIngestor._checkpoint_file(path).exists()
+
+        memory_backend.index = index
+        return await _drain(BulkIngestor(store, "g", CONF), path)
+    second = asyncio.run(main())
+    assert second["resumed"] == 8 and second["failed"] == 0 and second["finished"]
+    assert set(memory_backend.docs) == set(chunks) # 失败的批次被重试，其后已写入的块跳过
+    assert not BulkIngestor._checkpoint_file(path).exists()
+
+def test_batches_embed_concurrently_and_write_serially(tmp_path, memory_backend):
+    path = _source(tmp_path)
+    chunks = list(iter_chunks(path, CONF["chunk_tokens"], 0))
+    store = RAGStore(memory_backend, str(tmp_path / "rag"))
+    running, peak, written = [0], [0], []
+
+    async def embed(texts):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return [[float(len(text))] for text in texts]
+
+    async def add_vectors(texts, vectors):
+        assert store.write_lock.locked() and len(vectors) == len(texts)
+        written.extend(texts)
+        for text in texts:
+            memory_backend.docs[text] = f"chunk-{len(memory_backend.docs)}"
+        return len(texts)
+    memory_backend.embed, memory_backend.add_vectors = embed, add_vectors
+
+    progress = asyncio.run(_drain(BulkIngestor(store, "g", CONF), path))
+    assert progress["finished"] and progress["indexed"] == len(chunks)
+    assert peak[0] == CONF["concurrency"] # 嵌入不受写入锁限制
+    assert sorted(written) == sorted(chunks) and memory_backend.calls["index"] == 0
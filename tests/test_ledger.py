@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from tools import ledger
+from tools.ledger import TokenLedger, _split
+from tools.state import FileState, StateIO
+
+USAGE = {"prompt_tokens": 100, "completion_tokens": 21, "completion_tokens_details": {"reasoning_tokens": 5}}
+
+@pytest.fixture
+def make_ledger(tmp_path, monkeypatch):
+    io, opened = StateIO(FileState()), []
+    monkeypatch.setattr(ledger, "state_io", lambda: io) # 不依赖全局的状态读写入口
+    def make(**conf):
+        book = TokenLedger({"file": str(tmp_path / "ledger.sqlite3"), "flush_every": 1000, **conf})
+        opened.append(book)
+        return book
+    yield make
+    for book in opened:
+        book.close()
+    io.close()
+
+def _rows(book: TokenLedger):
+    with book._lock:
+        return book._connect().execute("SELECT user, prompt, completion, reasoning FROM usage ORDER BY user").fetchall()
+
+def test_split_keeps_total():
+    assert _split(10, 3) == [4, 3, 3]
+    assert _split(2, 4) == [1, 1, 0, 0]
+    assert sum(_split(12345, 7)) == 12345
+
+def test_merged_reply_is_split_between_users(make_ledger):
+    book = make_ledger()
+    with book.user("a", "b"):
+        book.record("g1", "model", "chat", USAGE)
+    book.record("g1", "model", "summary", USAGE) # 范围外计入匿名用户
+    asyncio.run(book.flush())
+    assert _rows(book) == [("", 100, 21, 5), ("a", 50, 11, 3), ("b", 50, 10, 2)]
+    assert book.spent == {"g1": 242}
+    report = book.report()
+    assert "g1: 242（输入200/输出42/思考10，2次）" in report # 同一请求拆出的多行只计一次
+    assert "a: 61（输入50/输出11/思考3，1次）" in report
+
+def test_budget_per_group(make_ledger):
+    book = make_ledger(daily_budget=200, budgets={1001: 0})
+    book.record("g1", "model", "chat", USAGE)
+    assert book.over_budget("g1") is None
+    book.record("g1", "model", "chat", USAGE)
+    assert "200" in book.over_budget("g1")
+    book.record("1001", "model", "chat", USAGE)
+    book.record("1001", "model", "chat", USAGE)
+    assert book.over_budget("1001") is None # 单独设置为0即不限
+    assert make_ledger(enable=False, daily_budget=1).over_budget("g1") is None
+
+def test_open_restores_todays_spending(make_ledger):
+    book = make_ledger(daily_budget=300)
+    book.record("g1", "model", "chat", USAGE)
+    book.record("g1", "model", "chat", USAGE)
+    asyncio.run(book.flush())
+    book.close()
+
+    restarted = make_ledger(daily_budget=300)
+    restarted.open()
+    assert restarted.spent == {"g1": 242}
+    restarted.record("g1", "model", "chat", USAGE)
+    assert restarted.over_budget("g1") is not None
+
+def test_empty_usage_is_ignored(make_ledger):
+    book = make_ledger()
+    book.record("g1", "model", "chat", None)
+    book.record("g1", "model", "chat", {})
+    assert book.spent == {} and book._pending == []
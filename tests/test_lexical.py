@@ -0,0 +1,75 @@
+import asyncio
+
+from tools import serial
+from tools.lexical import LexicalIndex, tokenize
+from tools.rag import RAGStore
+
+DOCS = ["小明喜欢草莓蛋糕", "小红讨厌Python考试", "阿强许诺周末去爬山", "华尔记得编号42的计划"]
+
+def test_tokenize_mixed():
+    assert tokenize("Python考试") == ["python", "考试"]
+    assert tokenize("小明喜欢") == ["小明", "明喜", "喜欢"]
+    assert tokenize("编号42") == ["编号", "42"]
+
+def test_bm25_ranking_and_coverage(tmp_path):
+    index = LexicalIndex(tmp_path / "x.lexical.json")
+    index.add(DOCS)
+    hits = index.search("编号42", 3)
+    assert hits[0][0] == "华尔记得编号42的计划"
+    assert hits[0][2] == 1.0 # 查询词全部命中
+    assert index.search("完全无关的词", 3) == []
+
+def test_remove_and_persist(tmp_path):
+    file = tmp_path / "x.lexical.json"
+    index = LexicalIndex(file)
+    index.add(DOCS)
+    index.remove(["华尔记得编号42的计划", "不存在的文档"])
+    assert "华尔记得编号42的计划" not in index and len(index) == 3
+    assert not index.search("编号42", 3)
+    index.save()
+
+    loaded = LexicalIndex(file)
+    assert loaded.load()
+    assert sorted(loaded.docs.values()) == sorted(DOCS[:3])
+    assert loaded.search("草莓蛋糕", 1)[0][0] == "小明喜欢草莓蛋糕"
+    assert not LexicalIndex(tmp_path / "missing.json").load()
+
+def test_store_short_circuits_exact_hits(tmp_path, memory_backend):
+    async def main():
+        store = RAGStore(memory_backend, str(tmp_path / "rag"))
+        await store.index(DOCS)
+        result = (await store.retrieve(["编号42的计划"], 1))[0]
+        assert result.docs == ["华尔记得编号42的计划"]
+        assert memory_backend.calls["retrieve"] == 0 # 词法结果明显胜出，不请求后端
+        assert store.stats["short_circuit"] == 1
+
+        await store.retrieve(["天气怎么样"], 1) # 无词法命中，走后端
+        assert memory_backend.calls["retrieve"] == 1
+    asyncio.run(main())
+
+def test_store_rebuilds_missing_lexical_file(tmp_path, memory_backend):
+    async def main():
+        memory_backend.docs = {d: str(i) for i, d in enumerate(DOCS)} # 旧版数据：只有后端
+        store = RAGStore(memory_backend, str(tmp_path / "rag"))
+        await store.retrieve(["编号42"], 1)
+        assert len(store.lexical) == len(DOCS)
+        assert (tmp_path / "rag.lexical.json").exists()
+    asyncio.run(main())
+
+def test_lexical_file_written_on_save_and_reconciled_on_load(tmp_path, memory_backend):
+    file = tmp_path / "rag.lexical.json"
+    async def main():
+        store = RAGStore(memory_backend, str(tmp_path / "rag"))
+        await store.index(DOCS[:3])
+        assert serial.load_file(file) == [] # 首次使用时写出的空索引；此后的写入不再逐次重写文件
+        await store.save()
+        assert len(serial.load_file(file)) == 3
+
+        await store.index(DOCS[3:])
+        await store.delete(DOCS[:1]) # 未保存即"崩溃"
+        reloaded = RAGStore(memory_backend, str(tmp_path / "rag"))
+        await reloaded.retrieve(["编号42"], 1)
+        return reloaded
+    reloaded = asyncio.run(main())
+    assert sorted(reloaded.lexical.ids) == sorted(DOCS[1:])
+    assert sorted(serial.load_file(file)) == sorted(DOCS[1:])
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from tools import limiter
+from tools.limiter import AdmissionControl, RateLimiter, TokenBucket
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(limiter.time, "monotonic", lambda: now[0])
+    return now
+
+def test_bucket_refill_and_wait():
+    bucket = TokenBucket(2, 0.5)
+    now = bucket.stamp
+    assert bucket.wait_time(now) == 0.0
+    bucket.take(); bucket.take()
+    assert bucket.wait_time(now) == pytest.approx(2.0)
+    assert bucket.wait_time(now + 2.0) == 0.0
+    assert bucket.idle(now + 10.0) and bucket.tokens == 2 # 不超过容量
+
+def test_disabled_by_default():
+    rl = RateLimiter({})
+    assert all(rl.acquire("u", "g", "m")[0] for _ in range(100))
+
+def test_user_bucket_and_refill(clock):
+    rl = RateLimiter({"enable": True, "user_capacity": 2, "user_rate": 0.5})
+    assert rl.acquire("u1", "g", "m") == (True, 0.0)
+    assert rl.acquire("u1", "g", "m") == (True, 0.0)
+    passed, wait = rl.acquire("u1", "g", "m")
+    assert not passed and wait == pytest.approx(2.0)
+    assert rl.acquire("u2", "g", "m")[0] # 其他用户不受影响
+    clock[0] += 2.0
+    assert rl.acquire("u1", "g", "m")[0]
+
+def test_rejection_takes_no_tokens(clock):
+    rl = RateLimiter({"enable": True, "user_capacity": 5, "user_rate": 1, "group_capacity": 1, "group_rate": 0.1})
+    assert rl.acquire("u1", "g", "m")[0]
+    assert not rl.acquire("u1", "g", "m")[0] # 组群桶不足，整体拒绝
+    assert rl.buckets[("user", "u1")].tokens == 4
+
+def test_zero_means_unlimited(clock):
+    rl = RateLimiter({"enable": True, "model_capacity": 0, "model_rate": 1})
+    assert all(rl.acquire(f"u{i}", "g", "m")[0] for i in range(50))
+    assert not rl.buckets
+
+def test_sweep_drops_idle_buckets(clock):
+    rl = RateLimiter({"enable": True, "user_capacity": 1, "user_rate": 1})
+    rl.acquire("u1", "g", "m")
+    clock[0] += 700
+    rl.acquire("u2", "g", "m")
+    assert ("user", "u1") not in rl.buckets
+
+def test_admission_disabled_by_default():
+    async def main():
+        gate = AdmissionControl({})
+        return [gate.enter() for _ in range(100)]
+    assert all(ticket.granted for ticket in asyncio.run(main()))
+
+def test_admission_queue_and_handover():
+    async def main():
+        gate = AdmissionControl({"enable": True, "max_inflight": 1, "max_queue": 1})
+        first = gate.enter()
+        second = gate.enter()
+        assert first.granted and not second.granted and second.ahead == 0
+        assert gate.enter() is None # 排队已满
+        admin = gate.enter(superuser=True)
+        assert admin.granted # 超级用户不排队
+        waiter = asyncio.create_task(gate.wait(second))
+        await asyncio.sleep(0)
+        gate.leave(first)
+        assert not second.granted # 超级用户仍占着名额
+        gate.leave(admin)
+        assert await waiter and second in gate.inflight
+        return gate.stats
+    assert asyncio.run(main()) == {"admitted": 3, "queued": 1, "rejected": 1, "expired": 0}
+
+def test_admission_queue_timeout():
+    async def main():
+        gate = AdmissionControl({"enable": True, "max_inflight": 1, "queue_timeout": 0.02})
+        first, second = gate.enter(), gate.enter()
+        assert not await gate.wait(second) # 超时放弃排队
+        assert not gate.queue
+        gate.leave(first)
+        return gate
+    gate = asyncio.run(main())
+    assert gate.stats["expired"] == 1 and not gate.inflight
+
+def test_admission_rejects_when_stalled(clock):
+    async def main():
+        gate = AdmissionControl({"enable": True, "max_inflight": 1, "stall_age": 30})
+        gate.enter()
+        assert not gate.enter().granted
+        clock[0] += 31 # 最早的对话已处理过久，继续排队无益
+        return gate.enter()
+    assert asyncio.run(main()) is None
@@ -0,0 +1,43 @@
+import asyncio
+import cProfile
+
+from tools import profiler as module
+from tools.profiler import Profiler
+
+class _Occupied(cProfile.Profile):
+    '''模拟Python 3.12起已有其他剖析工具时enable抛出的ValueError'''
+    def enable(self, *args, **kwargs):
+        raise ValueError("Another profiling tool is already active")
+
+def test_turns_profile_and_summary(tmp_path):
+    async def main():
+        prof = Profiler(tmp_path)
+        assert prof.start(turns=2) == ""
+        assert prof.start(turns=1) # 已有剖析进行中
+        assert prof.wrap(sum)([1, 2]) == 3
+        prof.turn_done()
+        assert prof.active
+        prof.turn_done()
+        return prof, await prof.wait(1.0)
+    prof, summary = asyncio.run(main())
+    assert not prof.active and summary.startswith("🔬 剖析完成")
+    assert len(list(tmp_path.glob("profile_*.prof"))) == 1
+
+def test_occupied_profiler_is_reported(tmp_path, monkeypatch):
+    async def main():
+        prof = Profiler(tmp_path)
+        monkeypatch.setattr(module.cProfile, "Profile", _Occupied)
+        return prof, prof.start(seconds=1.0)
+    prof, error = asyncio.run(main())
+    assert error.startswith("⚠️") and not prof.active and prof._timer is None
+
+def test_wrap_runs_unprofiled_when_thread_is_occupied(tmp_path, monkeypatch):
+    async def main():
+        prof = Profiler(tmp_path)
+        prof.start(turns=1)
+        monkeypatch.setattr(module.cProfile, "Profile", _Occupied)
+        result = await asyncio.to_thread(prof.wrap(sum), [1, 2])
+        prof.stop()
+        return prof, result
+    prof, result = asyncio.run(main())
+    assert result == 3 and prof.summary.startswith("🔬")
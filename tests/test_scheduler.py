@@ -0,0 +1,73 @@
+import asyncio
+
+from tools.scheduler import FairScheduler
+
+async def _enqueue(sched: FairScheduler, order: list, kind: str, group: str, lane: str = "normal"):
+    """排队取得名额后记录放行顺序并立即归还"""
+    await sched.acquire(kind, group, lane)
+    order.append((group, lane))
+    sched.release(kind)
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_lane_priority():
+    async def main():
+        sched, order = FairScheduler({"max_concurrency": 1}), []
+        await sched.acquire("main", "holder")
+        waiters = [asyncio.create_task(_enqueue(sched, order, "main", "g1", "background")),
+                   asyncio.create_task(_enqueue(sched, order, "main", "g2", "normal")),
+                   asyncio.create_task(_enqueue(sched, order, "main", "g3", "admin"))]
+        await _settle()
+        assert sched.stats()["main"]["queued"] == 3
+        sched.release("main")
+        await asyncio.gather(*waiters)
+        assert [lane for _, lane in order] == ["admin", "normal", "background"]
+    asyncio.run(main())
+
+def test_round_robin_between_groups():
+    async def main():
+        sched, order = FairScheduler({"max_concurrency": 1}), []
+        await sched.acquire("main", "holder")
+        waiters = [asyncio.create_task(_enqueue(sched, order, "main", "busy")) for _ in range(3)]
+        await _settle()
+        waiters.append(asyncio.create_task(_enqueue(sched, order, "main", "quiet")))
+        await _settle()
+        sched.release("main")
+        await asyncio.gather(*waiters)
+        assert [group for group, _ in order] == ["busy", "quiet", "busy", "busy"]
+    asyncio.run(main())
+
+def test_kind_budget():
+    async def main():
+        sched = FairScheduler({"max_concurrency": 4, "embed": 1})
+        await sched.acquire("embed", "g")
+        blocked = asyncio.create_task(sched.acquire("embed", "g"))
+        await _settle()
+        assert not blocked.done()
+        await asyncio.wait_for(sched.acquire("main", "g"), 1) # 其他种类不受embed预算影响
+        sched.release("embed")
+        await asyncio.wait_for(blocked, 1)
+        assert sched.running_kind == {"main": 1, "func": 0, "embed": 1}
+    asyncio.run(main())
+
+def test_cancelled_waiter_leaves_queue():
+    async def main():
+        sched = FairScheduler({"max_concurrency": 1})
+        await sched.acquire("main", "g")
+        waiter = asyncio.create_task(sched.acquire("main", "g"))
+        await _settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert not sched._has_waiters()
+        sched.release("main")
+        assert sched.running == 0
+    asyncio.run(main())
+
+def test_disabled_slot_is_passthrough():
+    async def main():
+        sched = FairScheduler({"enable": False, "max_concurrency": 1})
+        async with sched.slot("main", "g"), sched.slot("main", "g"):
+            assert sched.running == 0
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from tools import serial
+
+DATA = {"rd": 3, "memory": [{"role": "user", "content": "时间[2025-08-01 12:00:00] 用户[群友]: 喵~"}], "cooldown": 1.5, "rag": None}
+
+@pytest.fixture(params=["native", "json"])
+def backend(request, monkeypatch):
+    '''依次以当前实现与标准库回退运行'''
+    if request.param == "json":
+        monkeypatch.setattr(serial, "orjson", None)
+    return request.param
+
+def test_round_trip(backend):
+    raw = serial.dumps(DATA)
+    assert isinstance(raw, bytes)
+    assert serial.loads(raw) == serial.loads(raw.decode("utf-8")) == DATA
+    assert "喵".encode("utf-8") in raw # 不转义非ASCII字符
+    assert serial.dumps_str(DATA) == raw.decode("utf-8")
+
+def test_compact_and_pretty_match_stdlib(backend):
+    assert serial.dumps(DATA) == json.dumps(DATA, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    assert serial.dumps(DATA, pretty=True) == json.dumps(DATA, ensure_ascii=False, indent=2).encode("utf-8")
+
+def test_sort_keys(backend):
+    assert serial.dumps({"b": 1, "a": 2}, sort_keys=True) == b'{"a":2,"b":1}'
+
+def test_default_and_non_str_keys(backend, tmp_path):
+    assert serial.loads(serial.dumps({1: {"x"}}, default=sorted)) == {"1": ["x"]}
+    path = tmp_path / "state.json"
+    path.write_bytes(serial.dumps(DATA, pretty=True))
+    assert serial.load_file(path) == DATA
+
+def test_decode_error_is_json_error(backend):
+    with pytest.raises(json.JSONDecodeError):
+        serial.loads(b"{broken")
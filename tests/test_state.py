@@ -0,0 +1,142 @@
+import asyncio
+import threading
+
+import pytest
+
+from tools import serial, state
+from tools.state import FileState, SQLiteState, StateIO, atomic_write_json
+
+@pytest.fixture(params=["file", "sqlite"])
+def backend(request, tmp_path):
+    store = FileState() if request.param == "file" else SQLiteState(tmp_path / "state.sqlite3", tmp_path)
+    yield store
+    store.close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(state.time, "time", lambda: now[0])
+    return now
+
+def test_lease_is_exclusive_until_expiry(backend, clock):
+    assert backend.acquire("group:1", "a", 30)
+    assert backend.acquire("group:1", "a", 30) # 持有者续约
+    assert not backend.acquire("group:1", "b", 30)
+    assert backend.alive("group:1")
+    clock[0] += 31
+    assert not backend.alive("group:1")
+    assert backend.acquire("group:1", "b", 30) # 过期后可被接管
+    assert not backend.acquire("group:1", "a", 30)
+
+def test_release_only_by_owner(backend, clock):
+    backend.acquire("group:1", "a", 30)
+    backend.release("group:1", "b")
+    assert backend.alive("group:1")
+    backend.release("group:1", "a")
+    assert not backend.alive("group:1")
+    assert backend.acquire("group:1", "b", 30)
+
+def test_sqlite_leases_shared_between_connections(tmp_path, clock):
+    one = SQLiteState(tmp_path / "state.sqlite3", tmp_path)
+    two = SQLiteState(tmp_path / "state.sqlite3", tmp_path)
+    try:
+        assert one.acquire("group:1", "a", 30)
+        assert two.alive("group:1") and not two.acquire("group:1", "b", 30)
+    finally:
+        one.close()
+        two.close()
+
+def test_sqlite_migrates_json_file(tmp_path):
+    path = tmp_path / "groups" / "1.json"
+    FileState().save({"rd": 3}, path)
+    store = SQLiteState(tmp_path / "state.sqlite3", tmp_path)
+    try:
+        assert store.load(path, {}) == {"rd": 3}
+        path.unlink()
+        assert store.exists(path) and store.load(path, {}) == {"rd": 3}
+    finally:
+        store.close()
+
+class _SlowState(FileState):
+    '''记录每次落盘的内容；第一次写入阻塞到放行为止，以便其间的保存排队'''
+    def __init__(self):
+        super().__init__()
+        self.writes, self.gate = [], threading.Event()
+
+    def save(self, data, path):
+        self.gate.wait(5)
+        self.writes.append(data)
+        super().save(data, path)
+
+def test_queued_saves_coalesce_to_latest(tmp_path):
+    async def main():
+        io = StateIO(_SlowState())
+        path = tmp_path / "g.json"
+        try:
+            first = asyncio.create_task(io.save({"n": 0}, path))
+            await asyncio.sleep(0.05) # 第一次写入已进入线程池
+            rest = [asyncio.create_task(io.save({"n": n}, path)) for n in range(1, 5)]
+            await asyncio.sleep(0)
+            io.backend.gate.set()
+            await asyncio.gather(first, *rest)
+        finally:
+            io.close()
+        return io
+    io = asyncio.run(main())
+    assert io.backend.writes == [{"n": 0}, {"n": 4}]
+    assert io.coalesced == 3
+    assert serial.load_file(tmp_path / "g.json") == {"n": 4}
+
+def test_save_error_reaches_every_waiter(tmp_path):
+    class Broken(_SlowState):
+        def save(self, data, path):
+            self.gate.wait(5)
+            raise OSError("磁盘已满")
+
+    async def main():
+        io = StateIO(Broken())
+        try:
+            first = asyncio.create_task(io.save({"n": 0}, tmp_path / "g.json"))
+            await asyncio.sleep(0.05)
+            rest = [asyncio.create_task(io.save({"n": n}, tmp_path / "g.json")) for n in (1, 2)]
+            await asyncio.sleep(0)
+            io.backend.gate.set()
+            return await asyncio.gather(first, *rest, return_exceptions=True)
+        finally:
+            io.close()
+    first, *rest = asyncio.run(main())
+    assert isinstance(first, OSError) and len(rest) == 2 and all(isinstance(e, OSError) for e in rest)
+
+def test_cancelled_saves_do_not_block_later_ones(tmp_path):
+    async def main():
+        io = StateIO(_SlowState())
+        path = tmp_path / "g.json"
+        try:
+            leader = asyncio.create_task(io.save({"n": 0}, path))
+            await asyncio.sleep(0.05) # 写入进行中
+            queued = asyncio.create_task(io.save({"n": 1}, path)) # 等待同一文件的锁
+            follower = asyncio.create_task(io.save({"n": 2}, path)) # 合并到上一条
+            await asyncio.sleep(0)
+            leader.cancel()
+            queued.cancel()
+            await asyncio.sleep(0)
+            io.backend.gate.set()
+            await asyncio.wait_for(follower, 1.0)
+            await asyncio.wait_for(io.save({"n": 3}, path), 1.0)
+        finally:
+            io.close()
+        return io, leader, queued
+    io, leader, queued = asyncio.run(main())
+    assert leader.cancelled() and queued.cancelled()
+    assert io.backend.writes == [{"n": 0}, {"n": 2}, {"n": 3}] # 调用方被取消，已提交的写入照常完成
+    assert not io._queued and serial.load_file(tmp_path / "g.json") == {"n": 3}
+
+def test_atomic_write_keeps_old_file_on_failure(tmp_path):
+    path = tmp_path / "g.json"
+    atomic_write_json(path, {"rd": 1})
+    with pytest.raises(TypeError):
+        atomic_write_json(path, {"rd": object()})
+    assert serial.load_file(path) == {"rd": 1}
+    assert [p.name for p in tmp_path.iterdir()] == ["g.json"] # 临时文件已清理
+    atomic_write_json(path, {"rd": 2}, pretty=True)
+    assert path.read_text(encoding="utf-8") == '{\n  "rd": 2\n}'
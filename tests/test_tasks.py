@@ -0,0 +1,58 @@
+import asyncio
+
+from tools.tasks import TaskRegistry
+
+def test_concurrency_is_bounded():
+    async def main():
+        registry, running, peak = TaskRegistry({"max_concurrency": 2}), [0], [0]
+
+        async def work():
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+
+        for n in range(6):
+            registry.spawn(work(), f"work{n}")
+        assert len(registry) == 6
+        assert await registry.drain(1.0) == []
+        return registry, peak[0]
+    registry, peak = asyncio.run(main())
+    assert peak == 2 and len(registry) == 0
+    assert registry.stats == {"spawned": 6, "failed": 0, "dropped": 0}
+
+def test_failures_are_counted():
+    async def main():
+        registry = TaskRegistry({})
+
+        async def boom():
+            raise ValueError("坏了")
+
+        registry.spawn(boom(), "boom")
+        await registry.drain(1.0)
+        return registry
+    assert asyncio.run(main()).stats["failed"] == 1
+
+def test_drain_cancels_overdue_and_rejects_new_tasks():
+    async def main():
+        registry, cancelled = TaskRegistry({}), []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def late():
+            await asyncio.sleep(0.01)
+            assert registry.spawn(asyncio.sleep(0), "late") is None # 关闭期间不再接受
+
+        registry.spawn(slow(), "slow")
+        registry.spawn(late(), "late_spawner")
+        dropped = await registry.drain(0.1)
+        return registry, dropped, cancelled
+    registry, dropped, cancelled = asyncio.run(main())
+    assert dropped == ["slow"] and cancelled == [True]
+    assert registry.stats["dropped"] == 2 and registry.stats["failed"] == 0
+    assert not registry._closing # 排空后可再次使用
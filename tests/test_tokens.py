@@ -0,0 +1,42 @@
+from tools.tokens import ContextBudget, message_tokens
+
+HEAD = [{"role": "system", "content": "你是名叫华尔的猫娘。"}]
+
+def _history(count: int):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"时间[2025-08-01 12:00:{i:02d}] 第{i}条消息，说了一些话"}
+            for i in range(count)]
+
+def test_fits_without_changes():
+    budget = ContextBudget({})
+    history = _history(4)
+    mess, report = budget.fit(HEAD, None, history, 10_000)
+    assert mess == HEAD + history and report["final"] == report["tokens"]
+
+def test_drops_oldest_history_first():
+    budget = ContextBudget({})
+    history = _history(10)
+    limit = message_tokens(HEAD + history[-3:])
+    mess, report = budget.fit(HEAD, None, history, limit)
+    assert mess == HEAD + history[-3:] and report["dropped"] == 7
+    assert report["final"] <= limit
+
+def test_batched_turn_is_kept_whole():
+    budget = ContextBudget({})
+    history = _history(10)
+    mess, report = budget.fit(HEAD, None, history, 1, current=3) # 放不下也保留本轮的3条发言
+    assert mess[len(HEAD):] == [{**m, "content": m["content"].split("] ", 1)[1]} for m in history[-3:]]
+    assert report["dropped"] == 7 and report["untimed"] == 3
+
+def test_tool_material_is_shortened_before_timestamps():
+    budget = ContextBudget({})
+    history = _history(2)
+    tool = {"role": "system", "content": "(资料: " + "草莓蛋糕很好吃" * 50 + ")"}
+    limit = message_tokens(HEAD + history) + 20
+    mess, report = budget.fit(HEAD, tool, history, limit, current=2)
+    assert report["tool_cut"] > 0 and report["untimed"] == 0 and report["final"] <= limit
+    assert mess[len(HEAD)]["content"].endswith("…") and mess[-2:] == history
+
+def test_disabled_budget_never_trims():
+    history = _history(10)
+    mess, report = ContextBudget({"enable": False}).fit(HEAD, None, history, 1)
+    assert mess == HEAD + history and report["dropped"] == 0
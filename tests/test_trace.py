@@ -0,0 +1,28 @@
+import io
+import logging
+
+from tools.trace import TraceFormatter, Tracer
+
+def test_trace_id_rendered_by_formatter():
+    tracer = Tracer({"enable": False})
+    tracer.enable = True # 不挂载span文件，只测日志标注
+    target = logging.getLogger("huaer.test_trace")
+    target.propagate = False
+    target.setLevel(logging.INFO)
+    stream, seen = io.StringIO(), []
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    handler.addFilter(lambda record: seen.append(record.msg) or True)
+    target.addHandler(handler)
+    tracer.tag_logs(target)
+    try:
+        target.info("回复 %s", "喵")
+        with tracer.span("turn") as span:
+            target.info("回复 %s", "喵")
+        tracer.tag_logs(target) # 重复调用不会再包一层
+    finally:
+        target.removeHandler(handler)
+        target.removeFilter(tracer._tag_record)
+    assert stream.getvalue().splitlines() == ["INFO 回复 喵", f"[trace:{span.trace_id[:8]}] INFO 回复 喵"]
+    assert seen == ["回复 %s", "回复 %s"] # 记录的msg保持为原来的字符串
+    assert isinstance(handler.formatter, TraceFormatter) and not isinstance(handler.formatter.inner, TraceFormatter)
@@ -0,0 +1,59 @@
+import json
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+import httpx
+
+from bench.stubs import fake_embedding
+from tools.vector import LocalVectorBackend
+
+KEY = "Bearer sk-test" # 与config.toml一致，api_key已带Bearer前缀
+DOCS = ["小明喜欢草莓蛋糕", "小红讨厌Python考试", "阿强许诺周末去爬山", "华尔记得编号42的计划", "老王每天夜跑"]
+
+def _backend(path, requests: list) -> LocalVectorBackend:
+    """嵌入请求由MockTransport应答，不访问网络"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append((request.headers.get("Authorization"), body["input"]))
+        data = [{"index": i, "embedding": fake_embedding(text, 16)} for i, text in enumerate(body["input"])]
+        return httpx.Response(200, json={"data": data})
+    backend = LocalVectorBackend(str(path), KEY, "http://embed.test/v1", "test-model", batch_size=2)
+    backend.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return backend
+
+def test_api_key_is_sent_unchanged(tmp_path):
+    requests = []
+    asyncio.run(_backend(tmp_path, requests).index(DOCS[:1]))
+    assert requests[0][0] == KEY
+
+def test_add_search_delete(tmp_path):
+    async def main():
+        requests = []
+        backend = _backend(tmp_path, requests)
+        await backend.index(DOCS)
+        assert [len(inputs) for _, inputs in requests] == [2, 2, 1] # 按batch_size分批
+        assert (await backend.retrieve([DOCS[3]], 1))[0].docs == [DOCS[3]]
+        assert (await backend.nearest([DOCS[0], "完全不同的句子"]))[0] == pytest.approx(1.0, abs=1e-5)
+
+        with pytest.raises(ValueError):
+            await backend.index(DOCS[:2]) # 全部已存在
+        await backend.delete([DOCS[3]])
+        assert DOCS[3] not in (await backend.retrieve([DOCS[3]], 5))[0].docs
+        with pytest.raises(ValueError):
+            await backend.delete([DOCS[3]])
+    asyncio.run(main())
+
+def test_persist_and_compact(tmp_path):
+    async def main():
+        backend = _backend(tmp_path, [])
+        await backend.index(DOCS)
+        await backend.delete(DOCS[:2]) # 删除占比超过COMPACT_RATIO，保存时压缩
+        await backend.save()
+        assert backend.texts == DOCS[2:] and not backend.deleted
+
+        reloaded = _backend(tmp_path, [])
+        assert sorted(text for text, _ in reloaded) == sorted(DOCS[2:])
+        assert (await reloaded.retrieve([DOCS[4]], 1))[0].docs == [DOCS[4]]
+    asyncio.run(main())
@@ -0,0 +1,226 @@
+import io
+import json
+import time
+import zipfile
+from pathlib import Path
+from asyncio import to_thread
+from typing import Any, Dict, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .rag import RAGStore
+
+try:
+    import numpy as np
+except ImportError: # numpy为可选依赖，仅归档功能需要
+    np = None
+
+FORMAT = "huaer-rag"
+VERSION = 1
+
+'''
+归档格式（zip，DEFLATE压缩）：
+    manifest.json       格式名、版本、嵌入模型、维度、精度、来源后端与各部分条数
+    passages.jsonl      文档原文，每行一个JSON字符串，行序与 passages.npy 一致
+    passages.npy        文档嵌入 (n, dim)，float32 或 float16
+    usage.json          文档使用记录（入库/检索时间、命中次数），供淘汰策略延续
+    entities.jsonl/npy  实体及其嵌入（仅HippoRAG）
+    facts.jsonl/npy     事实三元组文本及其嵌入（仅HippoRAG）
+    openie.jsonl        每篇文档的实体与三元组抽取结果（仅HippoRAG）
+'''
+
+def _npy(matrix: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, matrix, allow_pickle=False)
+    return buf.getvalue()
+
+def _jsonl(items: List[Any]) -> bytes:
+    return "\n".join(json.dumps(item, ensure_ascii=False) for item in items).encode("utf-8")
+
+def _read_jsonl(zf: zipfile.ZipFile, name: str) -> List[Any]:
+    if name not in zf.namelist():
+        return []
+    return [json.loads(line) for line in zf.read(name).decode("utf-8").splitlines() if line]
+
+def _read_npy(zf: zipfile.ZipFile, name: str) -> Optional[np.ndarray]:
+    if name not in zf.namelist():
+        return None
+    return np.load(io.BytesIO(zf.read(name)), allow_pickle=False).astype(np.float32)
+
+def _matrix(rows: List[Any], dim: Optional[int] = None) -> np.ndarray:
+    if not rows:
+        return np.zeros((0, dim or 0), dtype=np.float32)
+    return np.asarray([np.asarray(r, dtype=np.float32) for r in rows], dtype=np.float32)
+
+# HippoRAG（hipporag_lite）适配：直接读写其三个嵌入库与OpenIE结果，导入后在本地重建图谱
+def _is_hipporag(backend) -> bool:
+    return hasattr(backend, "chunk_embedding_store") and hasattr(backend, "openie_results_path")
+
+def _export_hipporag(backend) -> Dict[str, Any]:
+    stores = {}
+    for part, store in (("passages", backend.chunk_embedding_store),
+                        ("entities", backend.entity_embedding_store),
+                        ("facts", backend.fact_embedding_store)):
+        stores[part] = (list(store.texts), _matrix(store.embeddings))
+    chunk_ids = set(backend.chunk_embedding_store.hash_ids)
+    openie, _ = backend.load_existing_openie(chunk_ids)
+    stores["openie"] = [
+        {"passage": d["passage"], "entities": d["extracted_entities"], "triples": d["extracted_triples"]}
+        for d in openie if d["idx"] in chunk_ids
+    ]
+    return stores
+
+def _upsert_store(store, texts: List[str], matrix: np.ndarray) -> int:
+    """将带嵌入的文本写入HippoRAG嵌入库，已存在的跳过，不调用嵌入模型"""
+    from hipporag_lite.utils.misc_utils import compute_mdhash_id
+    existing = set(store.hash_id_to_row.keys())
+    ids, rows, vecs = [], [], []
+    for text, vec in zip(texts, matrix):
+        hash_id = compute_mdhash_id(text, prefix=store.namespace + "-")
+        if hash_id not in existing:
+            existing.add(hash_id)
+            ids.append(hash_id)
+            rows.append(text)
+            vecs.append(vec)
+    if ids:
+        store._upsert(ids, rows, vecs)
+    return len(ids)
+
+def _import_hipporag(backend, parts: Dict[str, Any]) -> int:
+    from hipporag_lite.utils.misc_utils import (compute_mdhash_id, text_processing, reformat_openie_results,
+                                                extract_entity_nodes, flatten_facts)
+    if not parts["openie"] or parts["entities"][1] is None:
+        raise ValueError("归档缺少图谱数据（可能导出自local后端），导入HippoRAG需要重新抽取，请改用RAG导入")
+    added = _upsert_store(backend.chunk_embedding_store, *parts["passages"])
+    _upsert_store(backend.entity_embedding_store, *parts["entities"])
+    _upsert_store(backend.fact_embedding_store, *parts["facts"])
+
+    # 合并OpenIE结果，随后按index()的后半段在本地重建图谱
+    chunk_to_rows = backend.chunk_embedding_store.get_all_id_to_rows()
+    all_openie, _ = backend.load_existing_openie(chunk_to_rows.keys())
+    known = {d["idx"] for d in all_openie}
+    for doc in parts["openie"]:
+        idx = compute_mdhash_id(doc["passage"], "chunk-")
+        if idx not in known:
+            known.add(idx)
+            all_openie.append({"idx": idx, "passage": doc["passage"],
+                               "extracted_entities": doc["entities"], "extracted_triples": doc["triples"]})
+    backend.save_openie_results(all_openie)
+
+    _, triple_results = reformat_openie_results(all_openie)
+    chunk_ids = [cid for cid in chunk_to_rows if cid in triple_results]
+    chunk_triples = [[text_processing(t) for t in triple_results[cid].triples] for cid in chunk_ids]
+    entity_nodes, chunk_triple_entities = extract_entity_nodes(chunk_triples)
+    facts = flatten_facts(chunk_triples)
+    # 正常情况下全部已在库中，insert_strings不会发起嵌入请求
+    backend.entity_embedding_store.insert_strings(entity_nodes)
+    backend.fact_embedding_store.insert_strings([str(fact) for fact in facts])
+
+    backend.node_to_node_stats = {}
+    backend.ent_node_to_chunk_ids = {}
+    backend.ready_to_retrieve = False # 检索前重新准备检索用的矩阵与映射
+    backend.add_fact_edges(chunk_ids, chunk_triples)
+    if backend.add_passage_edges(chunk_ids, chunk_triple_entities) > 0:
+        backend.add_synonymy_edges()
+        backend.augment_graph()
+        backend.save_igraph()
+    return added
+
+# 本地向量后端适配
+def _export_local(backend) -> Dict[str, Any]:
+    texts = list(backend.rows)
+    matrix = backend.matrix[[backend.rows[t] for t in texts]] if texts else _matrix([], backend.dim)
+    return {"passages": (texts, np.asarray(matrix, dtype=np.float32))}
+
+async def _import_local(backend, parts: Dict[str, Any]) -> int:
+    texts, matrix = parts["passages"]
+    if backend.dim is not None and matrix.shape[1] != backend.dim:
+        raise ValueError(f"归档嵌入维度 {matrix.shape[1]} 与现有向量 {backend.dim} 不一致")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return await backend.add_vectors(texts, matrix / np.maximum(norms, 1e-12))
+
+class RAGArchive:
+    '''
+    RAG归档：将一个组群的文档、嵌入（可选float16）与图谱三元组打包为单个版本化的压缩文件
+
+    导入时校验嵌入模型，直接写入已有嵌入并在本地重建索引，不产生任何API调用。
+    '''
+    def __init__(self, model: str):
+        if np is None:
+            raise ImportError("RAG归档需要numpy，请先 pip install numpy")
+        self.model = model
+
+    def _write(self, dest: Path, parts: Dict[str, Any], usage: Dict[str, List[float]], backend: str, half: bool):
+        dtype = np.float16 if half else np.float32
+        texts, matrix = parts["passages"]
+        manifest = {
+            "format": FORMAT,
+            "version": VERSION,
+            "model": self.model,
+            "dim": int(matrix.shape[1]) if matrix.size else None,
+            "dtype": np.dtype(dtype).name,
+            "backend": backend,
+            "created": time.time(),
+            "counts": {name: len(part[0]) for name, part in parts.items() if isinstance(part, tuple)},
+        }
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_suffix(".tmp")
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+            for name in ("passages", "entities", "facts"):
+                if name in parts:
+                    zf.writestr(f"{name}.jsonl", _jsonl(parts[name][0]))
+                    zf.writestr(f"{name}.npy", _npy(parts[name][1].astype(dtype)))
+            if "openie" in parts:
+                zf.writestr("openie.jsonl", _jsonl(parts["openie"]))
+            zf.writestr("usage.json", json.dumps({t: usage[t] for t in texts if t in usage}, ensure_ascii=False))
+        tmp.replace(dest)
+
+    async def export(self, store: RAGStore, dest: Path, half: bool = False) -> Dict[str, int]:
+        """导出store到dest，返回各部分条数"""
+        await store.save()
+        await store.count() # 确保使用记录已加载
+        backend = store.backend
+        async with store.write_lock: # 读取期间不允许写入，保证文档、嵌入与图谱一致
+            if _is_hipporag(backend):
+                parts, name = await to_thread(_export_hipporag, backend), "hipporag"
+            elif hasattr(backend, "add_vectors"):
+                parts, name = await to_thread(_export_local, backend), "local"
+            else:
+                raise TypeError(f"{type(backend).__name__} 不支持归档")
+        await to_thread(self._write, dest, parts, store.usage.rows, name, half)
+        return {k: len(v[0]) for k, v in parts.items() if isinstance(v, tuple)}
+
+    def _read(self, src: Path) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, List[float]]]:
+        with zipfile.ZipFile(src) as zf:
+            manifest = json.loads(zf.read("manifest.json"))
+            if manifest.get("format") != FORMAT:
+                raise ValueError("不是有效的RAG归档")
+            if manifest.get("version", 0) > VERSION:
+                raise ValueError(f"归档版本 {manifest['version']} 高于当前支持的 {VERSION}，请先升级插件")
+            if manifest.get("model") != self.model:
+                raise ValueError(f"归档的嵌入模型 {manifest.get('model')} 与当前 {self.model} 不一致，向量不可通用")
+            parts: Dict[str, Any] = {}
+            for name in ("passages", "entities", "facts"):
+                parts[name] = (_read_jsonl(zf, f"{name}.jsonl"), _read_npy(zf, f"{name}.npy"))
+            parts["openie"] = _read_jsonl(zf, "openie.jsonl")
+            usage = json.loads(zf.read("usage.json")) if "usage.json" in zf.namelist() else {}
+        texts, matrix = parts["passages"]
+        if matrix is None or len(texts) != len(matrix):
+            raise ValueError("归档内容不完整：文档与嵌入条数不一致")
+        return manifest, parts, usage
+
+    async def load(self, store: RAGStore, src: Path) -> int:
+        """将归档合并进store（已存在的文档跳过），返回新增文档数"""
+        manifest, parts, usage = await to_thread(self._read, src)
+        backend = store.backend
+        async with store.write_lock: # 导入直接改写后端（HippoRAG在线程中改写），不能与index/delete交错
+            if _is_hipporag(backend):
+                added = await to_thread(_import_hipporag, backend, parts)
+            elif hasattr(backend, "add_vectors"):
+                added = await _import_local(backend, parts)
+            else:
+                raise TypeError(f"{type(backend).__name__} 不支持归档")
+            await store.rebuild(usage)
+        logger.info(f"已从 {src.name}（{manifest['backend']}，{manifest['dtype']}）导入 {added} 条文档")
+        return added
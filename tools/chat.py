@@ -1,18 +1,32 @@
 import re
 import json
 import time
+import asyncio
+import zipfile
 import httpx
 import markdown2
 from pathlib import Path
 from json import JSONDecodeError
 from tavily import AsyncTavilyClient
-from asyncio import to_thread, create_task, gather
-from typing import Optional, Dict, Any, List, Tuple
+from asyncio import to_thread, gather
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
 
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent as Event
 
-from .config import ConfigManager, ChatConfig, Tools, FUNC, API_URL, SAPI_KEY, API_KEY, PRE_MOD, PUBLIC_DIR, MODELS, EMB_URL, SAPI_URL, CSS, HTML_SKELETON
+from . import serial
+from .trace import tracer
+from .log import Lazy, slog
+from .profiler import profiler
+from .scheduler import scheduler
+from .tokens import budget
+from .tasks import tasks
+from .ledger import ledger
+from .deadline import deadline
+from .eviction import POLICIES
+from .ingest import BulkIngestor
+from .archive import RAGArchive
+from .config import ConfigManager, ChatConfig, Tools, shared_rag, state_io, DATA_DIR, INGEST, EMBED, FUNC, SUM_MOD, SUMMARY_MAX, BATCH_WINDOW, BATCH_MAX, API_URL, SAPI_KEY, API_KEY, PRE_MOD, PUBLIC_DIR, MODELS, EMB_URL, SAPI_URL, CSS, HTML_SKELETON
 
 class ChatHandler:
     '''对话响应类'''
@@ -20,10 +34,12 @@ class ChatHandler:
                  chat_config: ChatConfig):
         self.cc = chat_config
 
-        self.cooldown_until = 0 #辅助特殊模型冷却功能
-        self.recall_times = 0 #辅助撤回功能
         self.tavily_client = AsyncTavilyClient(SAPI_KEY)
         self.http_client = httpx.AsyncClient() # 创建客户端实例
+        self._folding : List[dict] = [] # 已移出窗口、尚未折叠进摘要的对话
+        self._fold_lock = asyncio.Lock() # 摘要按移出顺序逐次更新
+        self._batch : List[Tuple[Event, str, asyncio.Future]] = [] # 合并窗口中的 (事件, 发言, 回复)
+        self._batch_full = asyncio.Event() # 攒满batch_max条时提前结束窗口
         
         self.role_map = {"user": "用户", "assistant": "助手", "system": "系统"}
         # function calling专用prompt
@@ -50,9 +66,35 @@ class ChatHandler:
 
     # 辅助函数
     def _manage_memory(self):
-        """管理记忆上下文"""
+        """管理记忆上下文，开启记忆压缩时被移出的对话交由后台折叠进滚动摘要"""
+        evicted = []
         while len(self.cc.mess) > self.cc.rd:
-            del self.cc.mess[0]
+            evicted.append(self.cc.mess.pop(0))
+        if evicted and self.cc.compact:
+            self._folding.extend(evicted)
+            tasks.spawn(self._fold_summary(), f"fold_summary:{self.cc.name}")
+
+    async def _fold_summary(self):
+        """用廉价模型把移出的对话与已有摘要合并为新的摘要；失败时保留待折叠内容，下次一并处理"""
+        async with self._fold_lock:
+            if not self._folding:
+                return
+            batch, self._folding = self._folding, []
+            dialogue = "\n".join(msg["content"] for msg in batch)
+            mess = [
+                {"role": "system", "content": f"你负责维护一段对话的前情提要。请将已有提要与刚移出上下文的对话合并为不超过{SUMMARY_MAX}字的新提要，"
+                                              "保留人物、事实、约定、偏好与未完结的话题，删去寒暄与重复内容，只输出提要本身。"},
+                {"role": "user", "content": f"已有提要: {self.cc.summary or '无'}\n\n移出的对话:\n{dialogue}"},
+            ]
+            with tracer.span("fold_summary", turns=len(batch)):
+                response = await self._call_api(mess, lane="background", model=SUM_MOD)
+            summary = self._process_response(response)["response"] if response else ""
+            if not summary:
+                self._folding = batch + self._folding
+                logger.warning(f"组群 {self.cc.name} 滚动摘要更新失败，将在下次移出对话时重试")
+                return
+            self.cc.summary = summary[:SUMMARY_MAX * 2] # 模型不守字数时兜底截断
+            if self.cc.prt: logger.info(f"组群 {self.cc.name} 滚动摘要已更新（折叠 {len(batch)} 条）")
 
     def _create_mess(self, role: str, content: str, name: str = None, show_time: bool = False) -> dict:
         '''生成对话记录'''
@@ -77,7 +119,8 @@ class ChatHandler:
             [f"[{msg['role'].upper()}]: \n {msg['content']}" 
             for msg in self.cc.mess[-(self.cc.rd):]]
         )
-        return f"\n{'#'*40}\n当前人格:\n{self.cc.current_personality}\n\n对话记录:\n{dialogue_log}\n{'#'*40}\n"
+        summary = f"前情提要:\n{self.cc.summary}\n\n" if self.cc.summary else ""
+        return f"\n{'#'*40}\n当前人格:\n{self.cc.current_personality}\n\n{summary}对话记录:\n{dialogue_log}\n{'#'*40}\n"
     
     def _rag_info(self) -> str:
         """读取RAG索引内容"""
@@ -88,8 +131,8 @@ class ChatHandler:
         """检查API调用限制"""
         if self.cc.mod not in PRE_MOD:
             return False,None
-        elif time.time() < self.cooldown_until and not superuser:
-            remaining = self.cooldown_until-time.time()
+        elif time.time() < self.cc.cooldown_until and not superuser:
+            remaining = self.cc.cooldown_until-time.time()
             return True,f"特殊模型冷却中，剩余时间：{remaining:.0f}秒"
         return False,None
 
@@ -134,8 +177,11 @@ class ChatHandler:
         return [{'type': 'function','function': function_def}] + ([additional_info]  if additional_info else [])
 
     # 显然现在没有用到ddgs，由于链接不上的问题；但曾经设计时如此，故保留
-    async def _llm_tool_ddg_search(self, queries: List[str], max_results: int = 5) -> Optional[List[Dict]]:
-        '''联网搜索功能'''
+    @tracer.traced("search")
+    async def _llm_tool_ddg_search(self, queries: List[str], max_results: int = 5, timeout: Optional[float] = None) -> Optional[List[Dict]]:
+        '''联网搜索功能，timeout为本阶段可用的秒数（默认取本轮可选阶段的剩余时间），用尽后不再发起后续查询'''
+        timeout = deadline.optional() if timeout is None else timeout
+        until = time.monotonic() + timeout
         try:
             if not SAPI_KEY:
                 logger.error(f"搜索失败: 请先设置api_key")
@@ -146,26 +192,29 @@ class ChatHandler:
                     
             results = []
             if SAPI_URL:
-                for q in queries:
+                for i, q in enumerate(queries):
+                    if (left := until - time.monotonic()) < 1:
+                        logger.warning(f"搜索时间已用尽，跳过剩余的 {len(queries) - i} 条查询")
+                        break
                     payload = {
                                 "messages": [{"role": "user","content": q}],
                                 "resource_type_filter": [{"type": "web","top_k": max_results}],
                             }
                     headers = {'Authorization': SAPI_KEY}
                     response = await self.http_client.post(
-                        API_URL,
-                        json=payload,
-                        headers=headers,
-                        timeout=60,
+                        SAPI_URL,
+                        content=serial.dumps(payload),
+                        headers=headers | {"Content-Type": "application/json"},
+                        timeout=left,
                     )
                     response.raise_for_status()
-                    for rr in response.json()["references"]:  
+                    for rr in serial.loads(response.content)["references"]:  
                         results.append({
                             "title": rr["title"],
                             "content": rr["content"]
                         })
             else:
-                responses = await gather(*(self.tavily_client.search(q, max_results=max_results) for q in queries), return_exceptions=True)
+                responses = await gather(*(self.tavily_client.search(q, max_results=max_results, timeout=timeout) for q in queries), return_exceptions=True)
                 for response in responses:
                     if isinstance(response, Exception):
                         logger.error(f"搜索失败: {response}")
@@ -175,51 +224,62 @@ class ChatHandler:
                                 "title": rr["title"],
                                 "content": rr["content"]
                             })
-            if results: logger.debug(f"搜索成功，内容:\n{results}")
+            if results: slog.payload("search_results", results, group=self.cc.name)
             return results
         except Exception as e:
             logger.error(f"搜索失败: {str(e)}")
             raise
         
-    async def _llm_tool_rag_index(self, contents: List[str]):
+    @tracer.traced("rag_index")
+    async def _llm_tool_rag_index(self, contents: List[str], lane: str = "background"):
         '''信息记录功能'''
         try:
             if not EMB_URL:
                 logger.error(f"记录失败：请先设置嵌入模型接口")
                 return
 
+            contents = await self.cc.hipporag.novel(contents, self.cc.dedup_threshold, self.cc.dedup_similarity)
             if not contents:
                 return
             
-            logger.debug(f"RAG_index插入中: \n{contents}")
+            slog.payload("rag_index_contents", contents, group=self.cc.name)
             
-            await self.cc.hipporag.index(contents)
+            async with scheduler.slot("embed", self.cc.name, lane):
+                await self.cc.hipporag.index(contents)
 
             logger.debug(f"RAG_index插入成功")
         except Exception as e:
             logger.error(f"index保存失败: {str(e)}")
             raise
 
-    async def _llm_tool_rag_retrieve(self, queries: List[str], num: int = 2) -> Optional[List[str]]:
-        '''信息检索功能'''
+    @tracer.traced("rag_retrieve")
+    async def _llm_tool_rag_retrieve(self, queries: List[str], num: int = 2, lane: str = "normal", timeout: Optional[float] = None) -> Optional[List[str]]:
+        '''信息检索功能，timeout涵盖排队与检索（默认取本轮可选阶段的剩余时间）'''
         try:
             if not queries:
                 return None
             
-            res = await self.cc.hipporag.retrieve(queries, num)
+            async def retrieve():
+                async with scheduler.slot("embed", self.cc.name, lane):
+                    return await self.cc.hipporag.retrieve(queries, num)
+            res = await asyncio.wait_for(retrieve(), deadline.optional() if timeout is None else timeout)
             
-            retrieved_docs = [solution.docs for solution in res]
+            retrieved_docs = [solution.docs for solution in res if solution.docs]
             
-            if retrieved_docs: logger.debug(f"检索到的内容列表: {retrieved_docs}")
+            if retrieved_docs: slog.payload("rag_retrieved_docs", retrieved_docs, group=self.cc.name)
             return retrieved_docs
         except Exception as e:
             logger.warning(f"检索失败,可能是尚无相关信息: {str(e)}")
             raise
 
-    async def _call_api(self, mess: List[dict], tools: Optional[List] = None) -> Optional[dict]:
-        """执行API请求"""
+    async def _call_api(self, mess: List[dict], tools: Optional[List] = None, lane: str = "normal", model: Optional[str] = None,
+                        timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        执行API请求，lane为调度通道；指定model时视为辅助请求，与function calling共用调度名额
+        timeout涵盖排队与请求，默认取本轮对话的剩余时间（无期限时为call_timeout）
+        """
         payload = {
-            "model": FUNC if tools else MODELS[self.cc.mod],
+            "model": model or (FUNC if tools else MODELS[self.cc.mod]),
             "messages": mess,
             "max_tokens": self.cc.max_token,
         }
@@ -227,26 +287,40 @@ class ChatHandler:
         # 注入工具（如果有）
         if tools : payload["tools"] = tools
 
-        logger.debug(payload)
+        slog.payload("api_payload", payload, group=self.cc.name)
 
-        try:
-            # 发送异步POST请求
-            response = await self.http_client.post(
-                API_URL,
-                json=payload,
-                headers={
-                    "Authorization" : API_KEY,
-                    "Content-Type" : "application/json"
-                },
-                timeout=60,
-            )
-            # 检查HTTP状态码
-            response.raise_for_status()
-            # 返回JSON响应
-            return response.json()
-        except Exception as e:
-            logger.error(f"API请求失败: {e}")
-            return None
+        kind = "func" if tools or model else "main"
+        timeout = deadline.timeout() if timeout is None else timeout
+        with tracer.span("call_api", kind=kind, model=payload["model"], lane=lane, timeout=round(timeout, 1)) as span:
+            try:
+                body = serial.dumps(payload) # 在取得调度名额前编码，整段记忆只序列化一次
+                # 经调度器取得名额后发送异步POST请求
+                async def post():
+                    async with scheduler.slot(kind, self.cc.name, lane):
+                        return await self.http_client.post(
+                            API_URL,
+                            content=body,
+                            headers={
+                                "Authorization" : API_KEY,
+                                "Content-Type" : "application/json"
+                            },
+                            timeout=timeout,
+                        )
+                response = await asyncio.wait_for(post(), timeout)
+                # 检查HTTP状态码
+                response.raise_for_status()
+                # 记录token用量并返回JSON响应
+                data = serial.loads(response.content)
+                ledger.record(self.cc.name, payload["model"], kind, data.get("usage"))
+                return data
+            except asyncio.TimeoutError:
+                span.set(error="timeout")
+                logger.error(f"API请求超时（{timeout:.1f}秒）")
+                return None
+            except Exception as e:
+                span.set(error=str(e))
+                logger.error(f"API请求失败: {e}")
+                return None
         
     def _process_response(self, data: dict) -> dict:
         """处理API响应"""
@@ -289,25 +363,26 @@ class ChatHandler:
             result["error"] = f"响应解析错误: {str(e)}"
             result["response_message"] = "抱歉，响应解析出现错误"
 
-        logger.debug(result)
+        slog.payload("api_result", result, group=self.cc.name)
         
         return result
     
-    async def _handle_rag_indexing(self, cont: List[str]):
-            """辅助信息记录后台运行"""
+    @tracer.traced("rag_indexing")
+    async def _handle_rag_indexing(self, cont: List[str], turn: List[dict]):
+            """辅助信息记录后台运行，turn为本轮写入记忆的全部发言与回复（合并回复时含多条发言）"""
             if self.cc.search and self.cc.ssin:
                 await self._llm_tool_rag_index(cont)
             if self.cc.allin:
-                await self._llm_tool_rag_index([self.cc.mess[-2]["content"], self.cc.mess[-1]["content"]])
+                await self._llm_tool_rag_index([msg["content"] for msg in turn])
             else:
                 results = await self._call_api(
-                    [self.func_call, 
-                    {"role": "user", "content": "消息: " + self.cc.mess[-2]["content"] + "\n   "},
-                    {"role": "user", "content": "消息: " + self.cc.mess[-1]["content"]}
-                    ], self.tools_map["_llm_tool_rag_index"])
+                    [self.func_call] + [{"role": "user", "content": "消息: " + msg["content"] + "\n   "} for msg in turn],
+                    self.tools_map["_llm_tool_rag_index"], "background")
                 for info in self._process_response(results)["tool_calls"]:
                     params = json.loads(info["arguments"])
                     await getattr(self, "_llm_tool_rag_index")(**params)
+            # 超出容量上限时淘汰旧文档，保持检索开销稳定
+            await self.cc.hipporag.evict(self.cc.rag_max_docs, self.cc.rag_max_kb * 1024, self.cc.rag_evict)
 
     def switch_thinking(self) -> str:
         if self.cc.tkc :
@@ -345,6 +420,24 @@ class ChatHandler:
                 self.cc.rag = True
                 return "✅ 已开启RAG功能"
         
+    def switch_compact(self) -> str:
+        if self.cc.compact :
+            self.cc.compact = False
+            return "✅ 已关闭记忆压缩"
+        else :
+            self.cc.compact = True
+            return "✅ 已开启记忆压缩"
+
+    def switch_batch(self) -> str:
+        if self.cc.batch :
+            self.cc.batch = False
+            return "✅ 已关闭合并回复"
+        else :
+            if self.cc.group == 1:
+                return "⚠️ 私聊无法开启合并回复"
+            self.cc.batch = True
+            return "✅ 已开启合并回复"
+
     def switch_search(self) -> str:
         if self.cc.search :
             self.cc.search = False
@@ -362,7 +455,7 @@ class ChatHandler:
     async def handle_markdown(self) -> str:
         try:
             md_text = self.cc.mess[-1]['content']
-            html_fragment = await to_thread(markdown2.markdown, md_text, extras=["fenced-code-blocks", "tables", "strike", "task_list"])
+            html_fragment = await to_thread(profiler.wrap(markdown2.markdown), md_text, extras=["fenced-code-blocks", "tables", "strike", "task_list"])
             full_html = HTML_SKELETON.format(css=CSS, content=html_fragment)
             return full_html
         except Exception as e:
@@ -382,43 +475,128 @@ class ChatHandler:
             return "⚠️ 请输入文本"
 
     async def handle_chat(self, event: Event, contents: List[str]) -> str:
-        """处理对话请求"""
-        superuser = event.is_admin()
+        """处理对话请求，每次请求对应一条trace；开启合并回复时先进入合并窗口"""
+        user = str(event.get_sender_id() or "")
+        with tracer.root("chat", group=self.cc.name, user=user), ledger.user(user), deadline.scope(), \
+             slog.timed("chat", group=self.cc.name, model=MODELS[self.cc.mod]) as fields:
+            if self.cc.batch and self.cc.group != 1:
+                reply = await self._join_batch(event, contents, fields)
+            else:
+                reply = await self._handle_chat(event, contents, fields)
+            fields["reply_len"] = len(reply)
+            return reply
 
-        if self.cc.prt : logger.info(f"对话事件启动, 群:{self.cc.group}, 模型:{MODELS[self.cc.mod]}")
-        
+    async def _join_batch(self, event: Event, contents: List[str], fields: Dict[str, Any]) -> str:
+        """进入合并窗口：首条消息等待窗口结束（或攒满batch_max条）后代表整批发出请求，其余消息等待拆分回来的回复"""
         if not (user_input := " ".join(contents)):
             return "📛 请输入有效内容"
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((event, user_input, future))
+        if len(self._batch) > 1:
+            if len(self._batch) >= BATCH_MAX:
+                self._batch_full.set()
+            fields["batched"] = True
+            return await future
+
+        self._batch_full.clear()
+        batch = None
+        try:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), BATCH_WINDOW)
+            except asyncio.TimeoutError:
+                pass
+            batch, self._batch = self._batch, []
+            replies = await self._respond([(e, text) for e, text, _ in batch], fields)
+        except BaseException: # 首条请求失败或被取消时，同批的其他用户不能一直等下去
+            if batch is None:
+                batch, self._batch = self._batch, []
+            for _, _, f in batch[1:]:
+                if not f.done(): f.set_result("⚠️ 服务暂不可用")
+            raise
+        for (_, _, f), reply in zip(batch[1:], replies[1:]):
+            if not f.done(): f.set_result(reply)
+        return replies[0]
+
+    def _split_batch(self, text: str, count: int) -> List[str]:
+        """按【序号】拆分合并回复；模型漏掉某段时，该用户收到完整回复"""
+        pieces = re.split(r"【(\d+)】", text)
+        parts = {int(pieces[i]): pieces[i + 1].strip() for i in range(1, len(pieces) - 1, 2)}
+        return [parts.get(i + 1) or text for i in range(count)]
+
+    async def _handle_chat(self, event: Event, contents: List[str], fields: Optional[Dict[str, Any]] = None) -> str:
+        """单条对话请求"""
+        if not (user_input := " ".join(contents)):
+            return "📛 请输入有效内容"
+        return (await self._respond([(event, user_input)], fields))[0]
+
+    async def _respond(self, entries: List[Tuple[Event, str]], fields: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        对话请求的具体流程，entries为 (事件, 发言) 列表，多于一条时为合并回复，返回与之一一对应的回复；
+        fields为本次请求的日志字段（记录prompt大小与裁剪量）
+        """
+        count = len(entries)
+        if self.cc.prt : logger.info("对话事件启动, 群:%s, 模型:%s, 消息数:%d", self.cc.group, MODELS[self.cc.mod], count)
+
+        # API调用限制与每日token预算按用户检查（在任何上游请求之前）：管理员只豁免自己，被拦下的发言直接得到提示
+        admins = [event.is_admin() for event, _ in entries]
+        boolean, string = await self._check_api_limit(False)
+        notice = string if boolean else ledger.over_budget(self.cc.name)
+        replies : List[Optional[str]] = [None if admin or not notice else notice for admin in admins]
+        kept = [i for i, reply in enumerate(replies) if reply is None]
+        if not kept:
+            return replies
+
+        # 合并请求的用量由同批用户分摊
+        users = [str(entries[i][0].get_sender_id() or "") for i in kept]
+        with ledger.user(*users):
+            answers = iter(await self._complete([entries[i] for i in kept], all(admins[i] for i in kept), fields))
+        return [reply if reply is not None else next(answers) for reply in replies]
+
+    async def _complete(self, entries: List[Tuple[Event, str]], superuser: bool, fields: Optional[Dict[str, Any]]) -> List[str]:
+        """对通过检查的发言发出请求；superuser表示全部发言者均为管理员（决定调度通道与是否进入冷却）"""
+        count = len(entries)
+        lane = scheduler.lane_of(self.cc.name, superuser) # 上游调度通道
+        if count > 1:
+            if fields is not None: fields["batch"] = count
+            slog.event("chat_batched", group=self.cc.name, size=count)
 
-        # API调用限制检查
-        boolean, string = await self._check_api_limit(superuser)
-        if boolean : return string
-        
         # 记忆管理
         self._manage_memory()
-        
+
         # 构建对话记录
-        user_info = await self._get_user_info(event) 
-        self.cc.mess.append(
-            self._create_mess("user", user_input, user_info['name'], True)
-        ) # 群聊可获取用户名称，私聊加为好友后方可获取。
+        for event, user_input in entries:
+            user_info = await self._get_user_info(event) 
+            self.cc.mess.append(
+                self._create_mess("user", user_input, user_info['name'], True)
+            ) # 群聊可获取用户名称，私聊加为好友后方可获取。
+        current = "\n".join(msg["content"] for msg in self.cc.mess[-count:]) # 本轮的全部发言
 
         # 使用function calling对对话记录进行润色
         prompt = []
         cont = [] # 为保存搜索记录提供
-        if self.cc.search or self.cc.rag:
+        if (self.cc.search or self.cc.rag) and (left := deadline.optional()) < deadline.min_optional:
+            logger.warning(f"本轮剩余时间不足（可选阶段仅余{left:.1f}秒），跳过搜索与检索")
+            slog.event("stage_skipped", group=self.cc.name, stage="tools", left=round(left, 1))
+        elif self.cc.search or self.cc.rag:
             tools = []
             if self.cc.search : tools += self.tools_map["_llm_tool_ddg_search"]
             if self.cc.rag : tools += self.tools_map["_llm_tool_rag_retrieve"]
-            results = await self._call_api([self.func_call, {"role": "user", "content": "消息: " + self.cc.mess[-1]["content"]}], tools)
+            results = await self._call_api([self.func_call, {"role": "user", "content": "消息: " + current}], tools, lane,
+                                           timeout=deadline.optional(deadline.func_share))
             if not results : 
                 logger.error("⚠️ function call失败")
             else:
                 for info in self._process_response(results)["tool_calls"]:
                     params = json.loads(info["arguments"])
-                    tasks = []
-                    tasks.append(getattr(self, info["name"])(**params))
-                    tool_results = await gather(*tasks, return_exceptions=True)
+                    if (left := deadline.optional()) < deadline.min_optional: # 剩余时间留给主对话
+                        logger.warning(f"本轮剩余时间不足，跳过工具调用: {info['name']}")
+                        slog.event("stage_skipped", group=self.cc.name, stage=info["name"], left=round(left, 1))
+                        break
+                    params["timeout"] = left
+                    calls = []
+                    if "rag" in info["name"]: params["lane"] = lane
+                    calls.append(getattr(self, info["name"])(**params))
+                    tool_results = await gather(*calls, return_exceptions=True)
                     for ret in tool_results :
                         if isinstance(ret, Exception):
                             logger.error(f"⚠️ 工具调用失败: {info['name']} - {str(ret)}")
@@ -432,33 +610,49 @@ class ChatHandler:
                             prompt.append(f"(记录: {ret})\n") 
 
         pro_str = " ".join(prompt)
-        pro_lst = [self._create_mess("system", pro_str)] if pro_str else []
+        head = [self._create_mess("system", self.cc.current_personality)]
+        if self.cc.summary: # 滚动摘要紧随人格之后
+            head.append(self._create_mess("system", f"(前情提要: {self.cc.summary})"))
+        if count > 1: # 合并回复要求模型按序号分段作答，便于拆分
+            head.append(self._create_mess("system", f"(最后{count}条用户消息几乎同时发出，请按发言顺序逐一回复，"
+                                                    f"每段以【序号】开头，从【1】到【{count}】，每段只回应对应的那条发言)"))
 
-        # 执行API请求
-        response = await self._call_api(([self._create_mess("system", self.cc.current_personality)] + pro_lst + self.cc.mess)
-                                        if pro_lst 
-                                        else ([self._create_mess("system", self.cc.current_personality)] + self.cc.mess))
+        # 按模型上下文窗口裁剪本次请求：最早的历史 -> 工具资料 -> 时间戳
+        mess, report = budget.fit(head, self._create_mess("system", pro_str), self.cc.mess,
+                                  budget.limit(MODELS[self.cc.mod], self.cc.max_token), count)
+        if fields is not None:
+            fields.update(prompt_tokens=report["final"], trimmed_tokens=report["tokens"] - report["final"])
+        if report["tokens"] > report["final"]:
+            slog.event("prompt_trimmed", group=self.cc.name, model=MODELS[self.cc.mod], **report)
+            if self.cc.prt: logger.info(f"请求超出上下文预算，已裁剪: {report}")
+
+        # 执行API请求，主对话始终保留main_reserve秒
+        response = await self._call_api(mess, lane=lane, timeout=deadline.main())
         if not response:
-            self.cc.mess.pop()
-            return "⚠️ 服务暂不可用"
+            del self.cc.mess[-count:]
+            return ["⚠️ 服务暂不可用"] * count
         
         # 处理响应
         result = self._process_response(response)
         self.cc.mess.append(result["assistant_msg"])
+        turn = self.cc.mess[-(count + 1):]
 
-        if self.recall_times > 0: self.recall_times -= 1 #增加可撤回次数
+        if self.cc.recall_times > 0: self.cc.recall_times -= 1 #增加可撤回次数
 
-        if self.cc.prt : logger.info(self._chat_info())
+        if self.cc.prt : logger.info(Lazy(self._chat_info))
 
         # 执行RAG插入(后台任务)
         if self.cc.rag:
-            create_task(self._handle_rag_indexing(cont))
+            tasks.spawn(self._handle_rag_indexing(cont, turn), f"rag_indexing:{self.cc.name}")
         
         # 更新API调用时间
         if not superuser and self.cc.mod in PRE_MOD:  # 特殊模型
-            self.cooldown_until = time.time() + self.cc.cooldown
+            self.cc.cooldown_until = time.time() + self.cc.cooldown
         
-        return result["response_message"]
+        if count == 1:
+            return [result["response_message"]]
+        thinking = result["thinking"] + "\n### 谈话:\n" if self.cc.tkc else ""
+        return [thinking + part for part in self._split_batch(result["response"], count)]
     
     # 记忆命令
     
@@ -468,10 +662,10 @@ class ChatHandler:
     
     def handle_recall_memory(self, superuser: bool) -> str:
         """记忆撤回命令"""
-        if len(self.cc.mess) > 0 and (superuser or self.recall_times < self.cc.max_recall/2):
+        if len(self.cc.mess) > 0 and (superuser or self.cc.recall_times < self.cc.max_recall/2):
             self.cc.mess = self.cc.mess[:-2]
-            self.recall_times += 1
-            if self.cc.prt : logger.info(self._chat_info())
+            self.cc.recall_times += 1
+            if self.cc.prt : logger.info(Lazy(self._chat_info))
             return "✅ 已撤回上轮对话"
         elif len(self.cc.mess) >= 2:
             return "⚠️ 撤回数量达上限"
@@ -480,10 +674,12 @@ class ChatHandler:
         
     def handle_clean_memory(self) -> None:
         "记忆清除命令"
-        if not self.cc.mess:
+        if not self.cc.mess and not self.cc.summary:
             return "⚠️ 记忆体为空"
         else:
             self.cc.mess.clear()
+            self.cc.summary = ""
+            self._folding.clear()
             return "✅ 清除成功"
         
     def handle_add_memory(self, contents: List[str]) -> str:
@@ -501,7 +697,7 @@ class ChatHandler:
                 self._create_mess(self.role_map[role], text)
             )  # 在多人语境中text最好添加用户名，如：用户[xxx]: .....
 
-            logger.info(self._chat_info())
+            logger.info(Lazy(self._chat_info))
             return "✅ 添加成功"
         except Exception as e:
             logger.exception(f"未知错误:{e}")
@@ -529,7 +725,8 @@ class ChatHandler:
         if not self.cc.rag:
             return "⚠️ RAG功能未开启"
         try:
-            await self.cc.hipporag.index(contents)
+            async with scheduler.slot("embed", self.cc.name, "admin"):
+                await self.cc.hipporag.index(contents)
             # if self.cc.prt : logger.info(self._rag_info())
             return "✅ 添加成功"
         except ValueError as e:
@@ -539,6 +736,126 @@ class ChatHandler:
             logger.exception(f"未知错误:{e}")
             return "⚠️ 系统异常，请联系管理员"
         
+    def handle_dedup_setting(self, contents: List[str]) -> str:
+        """RAG去重命令：无参数时查看，否则设置 [文本相似度] [嵌入相似度]"""
+        if contents:
+            try:
+                threshold = float(contents[0])
+                similarity = float(contents[1]) if len(contents) > 1 else self.cc.dedup_similarity
+            except ValueError:
+                return "⚠️ 格式错误，正确格式：/RAG去重 [文本相似度(0~1)] [嵌入相似度(0~1)]"
+            if not (0 <= threshold <= 1 and 0 <= similarity <= 1):
+                return "📛 相似度需在0~1之间"
+            self.cc.dedup_threshold, self.cc.dedup_similarity = threshold, similarity
+        return (f"🧹 去重设置：文本相似度 {self.cc.dedup_threshold}，嵌入相似度 {self.cc.dedup_similarity or '关闭'}\n"
+                f"本次运行已跳过 {self.cc.hipporag.stats['dedup_skipped']} 条近重复文本")
+
+    async def handle_capacity_setting(self, contents: List[str]) -> str:
+        """RAG容量命令：无参数时查看，否则设置 [文档数] [KB] [age/lru/lfu]，设置后立即按新上限淘汰"""
+        if contents:
+            try:
+                max_docs = int(contents[0])
+                max_kb = int(contents[1]) if len(contents) > 1 else self.cc.rag_max_kb
+            except ValueError:
+                return "⚠️ 格式错误，正确格式：/RAG容量 [文档数] [KB] [age/lru/lfu]"
+            policy = contents[2] if len(contents) > 2 else self.cc.rag_evict
+            if max_docs < 0 or max_kb < 0 or policy not in POLICIES:
+                return "📛 上限需为非负整数，策略需为 age/lru/lfu"
+            self.cc.rag_max_docs, self.cc.rag_max_kb, self.cc.rag_evict = max_docs, max_kb, policy
+            try:
+                await self.cc.hipporag.evict(max_docs, max_kb * 1024, policy)
+            except Exception as e:
+                logger.exception(f"淘汰失败: {e}")
+                return "⚠️ 系统异常，请联系管理员"
+        return f"📦 RAG容量：{self.cc.rag_capacity_info()}"
+
+    async def handle_shared_index(self, contents: List[str], delete: bool = False) -> str:
+        """共享RAG添加/删除命令：操作所有组群共同检索的公共知识库，完成后立即保存"""
+        if not contents:
+            return "⚠️ 请输入文本"
+        store = shared_rag()
+        try:
+            if delete:
+                await store.delete(contents)
+            else:
+                async with scheduler.slot("embed", self.cc.name, "admin"):
+                    await store.index(contents)
+            await store.save()
+            return f"✅ {'删除' if delete else '添加'}成功，公共知识库现有 {await store.count()} 条"
+        except ValueError as e:
+            logger.exception(f"公共知识库操作失败: {e}")
+            return "ℹ️ 文档不存在" if delete else "ℹ️ 文档已存在"
+        except Exception as e:
+            logger.exception(f"未知错误:{e}")
+            return "⚠️ 系统异常，请联系管理员"
+
+    async def ingest_file(self, path: Path) -> AsyncIterator[Dict[str, Any]]:
+        """将本地文件切块后批量写入此组群的RAG，按 [ingest] report_every 产出进度（见 BulkIngestor.run）"""
+        async for progress in BulkIngestor(self.cc.hipporag, self.cc.name, INGEST).run(path):
+            yield progress
+
+    async def handle_bulk_ingest(self, name: str) -> AsyncIterator[str]:
+        """RAG导入命令：导入数据目录下 [ingest] dir 中的文件，定期回报进度"""
+        if not self.cc.rag:
+            yield "⚠️ RAG功能未开启"
+            return
+        if not EMB_URL:
+            yield "⚠️ 请先设置嵌入模型接口"
+            return
+        import_dir = (DATA_DIR / INGEST.get("dir", "imports")).resolve()
+        path = (import_dir / name).resolve()
+        if not name or not path.is_relative_to(import_dir) or not path.is_file():
+            yield f"⚠️ 文件不存在，请将文件放入 {import_dir} 后以文件名导入"
+            return
+
+        yield f"📥 开始导入 {path.name}"
+        try:
+            async for p in self.ingest_file(path):
+                head = "✅ 导入完成" if p["finished"] else "⏳ 导入中"
+                resumed = f"（自第{p['resumed']}块续传）" if p["resumed"] else ""
+                failed = f"，失败 {p['failed']} 块（重新导入将从断点重试）" if p["failed"] else ""
+                yield (f"{head}{resumed}：已完成 {p['done']} 块，新增 {p['indexed']}，"
+                       f"已存在 {p['skipped']}{failed}，用时 {p['elapsed']}s")
+        except UnicodeDecodeError:
+            yield "❌ 导入失败：文件需为UTF-8编码"
+        except Exception as e:
+            logger.exception(f"批量导入失败: {e}")
+            yield "⚠️ 系统异常，请联系管理员"
+
+    async def handle_export_archive(self, contents: List[str]) -> str:
+        """RAG迁出命令：将此组群的文档、嵌入与图谱打包到数据目录 exports 下，可选半精度嵌入"""
+        if not self.cc.rag:
+            return "⚠️ RAG功能未开启"
+        half = bool(contents) and contents[0].lower() in ("半精度", "f16", "float16")
+        dest = DATA_DIR / "exports" / f"{self.cc.name}_{time.strftime('%Y%m%d%H%M%S')}.huaer-rag.zip"
+        try:
+            counts = await RAGArchive(EMBED[0]).export(self.cc.hipporag, dest, half)
+            detail = "，".join(f"{k} {v}" for k, v in counts.items())
+            return f"✅ 已导出到 {dest.name}（{detail}，{dest.stat().st_size // 1024}KB）"
+        except Exception as e:
+            logger.exception(f"导出失败: {e}")
+            return "⚠️ 系统异常，请联系管理员"
+
+    async def handle_import_archive(self, name: str) -> str:
+        """RAG迁入命令：从数据目录 exports 下的归档合并文档，直接使用归档中的嵌入，不重新嵌入"""
+        if not self.cc.rag:
+            return "⚠️ RAG功能未开启"
+        export_dir = (DATA_DIR / "exports").resolve()
+        path = (export_dir / name).resolve()
+        if not name or not path.is_relative_to(export_dir) or not path.is_file():
+            return f"⚠️ 文件不存在，请将归档放入 {export_dir} 后以文件名导入"
+        try:
+            added = await RAGArchive(EMBED[0]).load(self.cc.hipporag, path)
+            await self.cc.hipporag.save()
+            await self.cc.hipporag.evict(self.cc.rag_max_docs, self.cc.rag_max_kb * 1024, self.cc.rag_evict)
+            return f"✅ 导入完成：新增 {added} 条，现有 {await self.cc.hipporag.count()} 条"
+        except (ValueError, zipfile.BadZipFile, KeyError) as e:
+            logger.warning(f"归档 {name} 导入失败: {e}")
+            return f"❌ 导入失败：{e}"
+        except Exception as e:
+            logger.exception(f"导入失败: {e}")
+            return "⚠️ 系统异常，请联系管理员"
+
     async def handle_save_index(self) -> str:
         """RAG保存命令（包括图结构和嵌入存储）"""
         if not self.cc.rag:
@@ -579,6 +896,7 @@ class PersonalityManager:
         self.cc.rag_file = str(self.cc.file / "RAG_file_base") # 将rag位置定向到base，使得rag可以任意清空
         self.cc.current_personality = new_personality
         self.cc.mess.clear()
+        self.cc.summary = ""
         logger.info(f"人格已更新: {new_personality}")
 
     def _save_personality(self, name: str, opt: bool):
@@ -596,7 +914,8 @@ class PersonalityManager:
             Path(self.cc.rag_file).mkdir(exist_ok=True, parents=True)
         data = {
             "personality": self.cc.current_personality,
-            "memory": self.cc.mess
+            "memory": self.cc.mess,
+            "summary": self.cc.summary,
         }
         ConfigManager.save_json(data, save_path)
 
@@ -619,6 +938,7 @@ class PersonalityManager:
         data = ConfigManager.load_json(file_path, {})
         self.cc.current_personality = data.get("personality", "")
         self.cc.mess = data.get("memory", [])
+        self.cc.summary = data.get("summary", "")
 
     # 人格命令
     async def handle_set_personality(self, content: str) -> str:
@@ -652,7 +972,7 @@ class PersonalityManager:
             if '/' in name or '\\' in name:
                 raise ValueError("名称包含非法字符")
                 
-            await to_thread(self._save_personality, name, True if place == "私有" else False)
+            await state_io().call(self._save_personality, name, True if place == "私有" else False)
 
             if self.cc.rag:
                 if not Path(self.cc.rag_file).exists(): 
@@ -678,7 +998,7 @@ class PersonalityManager:
             logger.exception("未知保存错误")
             return "⚠️ 系统异常，请联系管理员"
 
-    def handle_load_persona(self, contents: List[str]) -> str:
+    async def handle_load_persona(self, contents: List[str]) -> str:
         '''人格读取命令'''
         try:
             parsed = Tools._parse_args(contents, "公共", "私有")
@@ -689,7 +1009,7 @@ class PersonalityManager:
             if '/' in name or '\\' in name:
                 raise ValueError("⚠️ 名称包含非法字符")
                 
-            self._load_personality(name, True if place == "私有" else False)
+            await state_io().call(self._load_personality, name, True if place == "私有" else False)
 
             if self.cc.rag:
                 self.cc._reset_rag()
@@ -709,7 +1029,7 @@ class PersonalityManager:
             logger.exception("未知加载错误")
             return "⚠️ 系统异常，请联系管理员"
         
-    def handle_list_persona(self) -> str:
+    async def handle_list_persona(self) -> str:
         '''人格列出命令'''
         # 获取存储目录下所有文件夹名称
         def extract_names(base_dir):
@@ -719,8 +1039,8 @@ class PersonalityManager:
             return [d.name.replace("personality_", "") for d in persona_dirs]
 
         # 获取私有和公共目录下的人格name列表
-        persona_names_private = extract_names(self.cc.personality_file)
-        persona_names_public = extract_names(PUBLIC_DIR / "personalitys")
+        persona_names_private = await state_io().call(extract_names, self.cc.personality_file)
+        persona_names_public = await state_io().call(extract_names, PUBLIC_DIR / "personalitys")
         
         # 构建提示信息
         if not persona_names_private and not persona_names_public:
@@ -1,4 +1,3 @@
-import json
 import toml
 import copy
 import shutil
@@ -9,6 +8,10 @@ from typing import Optional, Tuple, Dict, List, Any
 
 from astrbot.api import logger
 
+from . import serial
+from .rag import RAGBackend, RAGStore
+from .state import StateBackend, StateIO, atomic_write_json, create_state
+
 class ConfigManager:
     '''配置管理类'''
 
@@ -39,10 +42,8 @@ class ConfigManager:
     def load_json(file_path: Path, default: Dict) -> Dict:
         try:
             if file_path.exists():
-                with open(file_path, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(default, f, ensure_ascii=False, indent=2)
+                return serial.load_file(file_path)
+            atomic_write_json(file_path, default, pretty=True)
             return default
         except Exception as e:
             logger.error(f"加载 {file_path} 失败: {e}")
@@ -51,8 +52,7 @@ class ConfigManager:
     @staticmethod
     def save_json(data: Dict[str, Any], file_path: Path):
         try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            atomic_write_json(file_path, data, pretty=True)
         except Exception as e:
             logger.error(f"保存 {file_path} 失败: {e}")
 
@@ -102,6 +102,7 @@ API_URL = api_config.get("url", "")
 MODELS = api_config.get("models", [])
 API_KEY = api_config.get("api_key", "")
 FUNC = api_config.get("funccall_model","")
+SUM_MOD = api_config.get("summary_model", "") or FUNC # 记忆压缩（滚动摘要）使用的模型，默认与function calling相同
 EMBED = api_config.get("embedding_model", [])
 EMB_URL = api_config.get("embedding_url", "")
 PRE_MOD = set(api_config.get("pre_mod", [])) # 转换为集合
@@ -127,8 +128,91 @@ whitelist_config = cfg["whitelist_config"]
 # 解析白名单路径
 WHITELIST_MODE  = whitelist_config.get("whitelist_mode", 0)
 
+# 加载限流配置（旧版配置文件可能没有此节）
+RATE_LIMIT = cfg.get("rate_limit", {})
+
+# 加载对话准入（过载保护）配置
+ADMISSION = cfg.get("admission", {})
+
+# 加载上游调度配置
+SCHEDULER = cfg.get("scheduler", {})
+
+# 加载链路追踪配置
+TRACE = cfg.get("trace", {})
+
+# 加载结构化日志配置
+LOG = cfg.get("log", {})
+
+# 加载RAG配置
+RAG = cfg.get("rag", {})
+
+# 加载批量导入配置
+INGEST = cfg.get("ingest", {})
+
+# 加载状态存储配置
+STATE = cfg.get("state", {})
+
+# 加载上下文预算配置
+CONTEXT = cfg.get("context", {})
+
+# 加载后台任务配置
+TASKS = cfg.get("tasks", {})
+
+# 加载对话期限配置
+DEADLINE = cfg.get("deadline", {})
+
+# 加载token账本配置
+LEDGER = cfg.get("ledger", {})
+
 # 加载对话配置
 basic_config = cfg["basic_config"]
+SUMMARY_MAX = basic_config.get("summary_max", 300) # 滚动摘要的最大字数
+BATCH_WINDOW = basic_config.get("batch_window", 2.0) # 合并回复的等待窗口，单位秒
+BATCH_MAX = basic_config.get("batch_max", 5) # 单次合并的最多消息数
+
+_state : Optional[StateBackend] = None
+_state_io : Optional[StateIO] = None
+
+def state_store() -> StateBackend:
+    """组群状态存储（[state] backend），首次调用时创建"""
+    global _state
+    if _state is None:
+        _state = create_state(STATE, DATA_DIR)
+    return _state
+
+def state_io() -> StateIO:
+    """状态存储的异步读写入口（专用I/O线程池、合并重复保存），事件循环中的读写都应经过这里"""
+    global _state_io
+    if _state_io is None:
+        _state_io = StateIO(state_store(), STATE.get("io_workers", 2))
+    return _state_io
+
+def _creat_backend(filename: str) -> RAGBackend:
+    """按 [rag] backend 创建RAG后端，本地后端不可用时回退到HippoRAG"""
+    if RAG.get("backend", "hipporag") == "local":
+        try:
+            from .vector import LocalVectorBackend
+            return LocalVectorBackend(filename, API_KEY, EMB_URL, EMBED[0], RAG.get("embed_batch", 32))
+        except ImportError as e:
+            logger.error(f"本地向量后端不可用，回退到HippoRAG: {e}")
+    return HippoRAG(
+                api_key=API_KEY,
+                llm_base_url=API_URL,
+                save_dir=filename, 
+                llm_model_name=EMBED[1],
+                embedding_model_name=EMBED[0],
+                embedding_base_url=EMB_URL)
+
+_shared_rag : Optional[RAGStore] = None
+
+def shared_rag(create: bool = True) -> Optional[RAGStore]:
+    """公共知识库（public组维护，存于PUBLIC_DIR/RAG_file_shared），首次调用时创建；create为False时不存在则返回None"""
+    global _shared_rag
+    if _shared_rag is None and create:
+        filename = PUBLIC_DIR / "RAG_file_shared"
+        filename.mkdir(parents=True, exist_ok=True)
+        _shared_rag = RAGStore(_creat_backend(str(filename)), str(filename), RAG)
+    return _shared_rag
 
 class ChatConfig:
     '''变量容器类，配置的动态载体'''
@@ -142,7 +226,7 @@ class ChatConfig:
 
         # rag数据保存位置,以此代表相应的实例写入配置文件,相当于特殊的self.mess,不过仅指代不存储信息
         self.rag_file : str = str(self.file / "RAG_file_base") # 基文件，用于随意修改，而不影响需要存储的信息
-        self.hipporag : HippoRAG = self._creat_rag(self.rag_file)
+        self.hipporag : RAGStore = self._creat_rag(self.rag_file)
 
         # 基础配置
         self.rd : int = basic_config.get("rd", 6)
@@ -154,10 +238,21 @@ class ChatConfig:
         self.allin : bool = basic_config.get("allin", False)
         self.search : bool = basic_config.get("search", False)
         self.mess : List[dict] = basic_config.get("memory", []) 
+        self.compact : bool = basic_config.get("compact", False) # 记忆压缩：移出窗口的对话折叠进滚动摘要
+        self.summary : str = "" # 滚动摘要（前情提要）
+        self.batch : bool = basic_config.get("batch", False) # 合并回复：窗口期内多位用户的请求合为一次
         self.cooldown : float = basic_config.get("cooldown", 300.0)
         self.max_token : int = basic_config.get("max_token", 1024)
         self.max_recall : int = min(self.rd , basic_config.get("max_recall", 2))
+        self.dedup_threshold : float = basic_config.get("dedup_threshold", 0.8) # 入库前MinHash去重的相似度阈值
+        self.dedup_similarity : float = basic_config.get("dedup_similarity", 0.0) # 入库前嵌入去重的相似度阈值（0为关闭）
+        self.rag_max_docs : int = basic_config.get("rag_max_docs", 0) # RAG文档数上限（0为不限）
+        self.rag_max_kb : int = basic_config.get("rag_max_kb", 0) # RAG原文体积上限，单位KB（0为不限）
+        self.rag_evict : str = basic_config.get("rag_evict", "lru") # 超限淘汰策略 age/lru/lfu
         self.current_personality : str = basic_config.get("default_personality", "你是名叫华尔的猫娘。") 
+        self.cooldown_until : float = 0.0 # 特殊模型冷却截止时间（时间戳），随状态保存以便其他进程接管
+        self.recall_times : int = 0 # 已撤回次数
+        self._saved : Optional[bytes] = None # 上次保存的内容，用于跳过未变化的同步
 
     def _path_generation(self, ID) -> Path:#函数形式生成，方便拓展
         """生成数据存储位置"""
@@ -186,26 +281,20 @@ class ChatConfig:
         else:
             return str(self.group)
         
-    def _creat_rag(self, filename: str) -> HippoRAG:
-        """新建一个rag实例"""
-        return  HippoRAG(
-                        api_key=API_KEY,
-                        llm_base_url=API_URL,
-                        save_dir=filename, 
-                        llm_model_name=EMBED[1],
-                        embedding_model_name=EMBED[0],
-                        embedding_base_url=EMB_URL)
+    def _creat_rag(self, filename: str) -> RAGStore:
+        """新建一个rag实例（RAG后端外加本地词法索引），检索时会一并查询公共知识库"""
+        store = RAGStore(_creat_backend(filename), filename, RAG)
+        if RAG.get("shared", True):
+            store.shared = shared_rag()
+        return store
     
     def _reset_rag(self):
         """重置rag"""
         self.hipporag = self._creat_rag(self.rag_file)
 
-    def save_group(self) -> str:
-        """一键保存群组配置"""
-        save_path = self.file / f"{self.config_name}.json"
-        save_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        data = {
+    def _dump(self) -> Dict[str, Any]:
+        """需要持久化的配置与记忆"""
+        return {
             "rd" : self.rd,
             "prt" : self.prt,
             "mod" : self.mod,
@@ -214,17 +303,75 @@ class ChatConfig:
             "ssin" : self.ssin,
             "allin" : self.allin,
             "memory" : self.mess,
+            "compact" : self.compact,
+            "summary" : self.summary,
+            "batch" : self.batch,
             "search" : self.search,
             "cooldown" : self.cooldown,
             "rag_file" : self.rag_file,
             "max_token" : self.max_token,
             "max_recall" : self.max_recall,
+            "dedup_threshold" : self.dedup_threshold,
+            "dedup_similarity" : self.dedup_similarity,
+            "rag_max_docs" : self.rag_max_docs,
+            "rag_max_kb" : self.rag_max_kb,
+            "rag_evict" : self.rag_evict,
             "default_personality" : self.current_personality,
+            "cooldown_until" : self.cooldown_until,
+            "recall_times" : self.recall_times,
         }
-        
+
+    def _apply(self, data: Dict[str, Any]):
+        self.rd = data.get("rd", 6)
+        self.mod = data.get("mod", 3)
+        self.prt = data.get("prt", True)
+        self.tkc = data.get("tkc", False)
+        self.rag = data.get("rag", False)
+        self.mess = data.get("memory", [])
+        self.compact = data.get("compact", False)
+        self.summary = data.get("summary", "")
+        self.batch = data.get("batch", False)
+        self.ssin = data.get("ssin", False)
+        self.allin = data.get("allin", False)
+        self.search = data.get("search", False)
+        self.cooldown = data.get("cooldown", 300.0)
+        self.max_recall = data.get("max_recall", 2)
+        self.max_token = data.get("max_token", 1024)
+        self.dedup_threshold = data.get("dedup_threshold", 0.8)
+        self.dedup_similarity = data.get("dedup_similarity", 0.0)
+        self.rag_max_docs = data.get("rag_max_docs", 0)
+        self.rag_max_kb = data.get("rag_max_kb", 0)
+        self.rag_evict = data.get("rag_evict", "lru")
+        self.rag_file = data.get("rag_file", str(self.file / "RAG_file_base"))
+        self.current_personality = data.get("default_personality", "你是名叫华尔的猫娘。")
+        self.cooldown_until = data.get("cooldown_until", 0.0)
+        self.recall_times = data.get("recall_times", 0)
+
+    def save_group(self, changed_only: bool = False) -> str:
+        """一键保存群组配置（阻塞，供线程中调用）；changed_only为True时内容未变化则不写入"""
+        save_path = self.file / f"{self.config_name}.json"
+        try :
+            data = self._dump()
+            snapshot = serial.dumps(data, sort_keys=True)
+            if changed_only and snapshot == self._saved:
+                return "✅ 保存成功"
+            state_store().save(data, save_path)
+            self._saved = snapshot
+            logger.debug(f"组群: {self.name} 保存成功")
+            return "✅ 保存成功"
+        except Exception as e:
+            logger.exception(f"未知保存错误：{e}")
+            return "⚠️ 系统异常，请联系管理员"
+
+    async def save_group_async(self, changed_only: bool = False) -> str:
+        """保存群组配置，经I/O线程池原子写入，短时间内的重复保存会被合并；changed_only为True时内容未变化则不写入"""
+        save_path = self.file / f"{self.config_name}.json"
         try :
-            with open(save_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            snapshot = serial.dumps(self._dump(), sort_keys=True) # 在事件循环中取快照，避免写入时记忆被修改
+            if changed_only and snapshot == self._saved:
+                return "✅ 保存成功"
+            await state_io().save(serial.loads(snapshot), save_path)
+            self._saved = snapshot
             logger.debug(f"组群: {self.name} 保存成功")
             return "✅ 保存成功"
         except Exception as e:
@@ -232,30 +379,31 @@ class ChatConfig:
             return "⚠️ 系统异常，请联系管理员"
 
     def load_group(self) -> str:
-        """加载此群组的配置"""
+        """加载此群组的配置（阻塞，供线程中调用）"""
         load_path = self.file / f"{self.config_name}.json"
-        if not load_path.exists():
+        if not state_store().exists(load_path):
             logger.warning(f"群组 {self.group} 的配置文件不存在，已自动生成")
             self.save_group()
             return
         
         try :
-            with open(load_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.rd = data.get("rd", 6)
-                self.mod = data.get("mod", 3)
-                self.prt = data.get("prt", True)
-                self.tkc = data.get("tkc", False)
-                self.rag = data.get("rag", False)
-                self.mess = data.get("memory", [])
-                self.ssin = data.get("ssin", False)
-                self.allin = data.get("allin", False)
-                self.search = data.get("search", False)
-                self.cooldown = data.get("cooldown", 300.0)
-                self.max_recall = data.get("max_recall", 2)
-                self.max_token = data.get("max_token", 1024)
-                self.rag_file = data.get("rag_file", str(self.file / "RAG_file_base"))
-                self.current_personality = data.get("default_personality", "你是名叫华尔的猫娘。")
+            if data := state_store().load(load_path, {}):
+                self._apply(data)
+            return "✅ 加载成功"
+        except Exception as e:
+            logger.exception(f"未知加载错误{e}")
+            return "⚠️ 系统异常，请联系管理员"
+
+    async def load_group_async(self) -> str:
+        """加载此群组的配置，读取在I/O线程池中进行"""
+        load_path = self.file / f"{self.config_name}.json"
+        if not await state_io().exists(load_path):
+            logger.warning(f"群组 {self.group} 的配置文件不存在，已自动生成")
+            return await self.save_group_async()
+
+        try :
+            if data := await state_io().load(load_path, {}):
+                self._apply(data)
             return "✅ 加载成功"
         except Exception as e:
             logger.exception(f"未知加载错误{e}")
@@ -264,16 +412,26 @@ class ChatConfig:
     def _conf_info(self):
         """打印此类变量信息（除去mess）"""
         simple_fields = [
-            "rd", "prt", "mod", "tkc", "rag", "ssin", "allin","search", "cooldown","rag_file", 
-            "max_token","max_recall", "current_personality", "group", "name", "config_name"
+            "rd", "prt", "mod", "tkc", "rag", "ssin", "allin","search", "compact", "batch", "cooldown","rag_file", 
+            "max_token","max_recall", "dedup_threshold", "dedup_similarity", "rag_max_docs", "rag_max_kb", "rag_evict",
+            "current_personality", "group", "name", "config_name"
         ]
         return {field: getattr(self, field) for field in simple_fields}
     
+    def rag_capacity_info(self) -> str:
+        """RAG当前用量与容量上限"""
+        limit_docs = self.rag_max_docs or "不限"
+        limit_kb = f"{self.rag_max_kb}KB" if self.rag_max_kb else "不限"
+        if size := self.hipporag.size():
+            return f"{size[0]}/{limit_docs}条，{size[1] / 1024:.1f}KB/{limit_kb}，淘汰策略 {self.rag_evict}"
+        return f"上限 {limit_docs}条 / {limit_kb}，淘汰策略 {self.rag_evict}"
+
     def copy_config(self, new_config):
         """为重置准备的深拷贝"""
         simple_fields = [
-            "rd", "prt", "mod", "tkc", "rag", "ssin", "allin", "search", "mess",
-            "cooldown", "max_token","max_recall", "current_personality"
+            "rd", "prt", "mod", "tkc", "rag", "ssin", "allin", "search", "mess", "compact", "summary", "batch",
+            "cooldown", "max_token","max_recall", "dedup_threshold", "dedup_similarity", "rag_max_docs", "rag_max_kb", "rag_evict",
+            "current_personality"
         ]
         for field in {field: getattr(self, field) for field in simple_fields}:
             if hasattr(new_config, field):
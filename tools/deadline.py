@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from .config import DEADLINE
+
+_deadline : ContextVar[Optional[float]] = ContextVar("turn_deadline", default=None) # time.monotonic()下的截止时刻
+
+class TurnDeadline:
+    '''
+    对话轮次的总期限
+
+    每轮 /对话 开始时设定一个截止时刻，经contextvars传到本轮的各个阶段（function calling、搜索、检索、主对话），
+    各阶段的超时由剩余时间推出，而不是各自固定60秒：主对话始终保留main_reserve秒，
+    可选阶段只能使用其余的时间，不足min_optional秒时直接跳过。后台任务不受对话期限约束。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = DEADLINE if conf is None else conf
+        self.enable : bool = conf.get("enable", True)
+        self.turn_timeout : float = conf.get("turn_timeout", 90.0)
+        self.reserve : float = conf.get("main_reserve", 30.0)
+        self.min_optional : float = conf.get("min_optional", 5.0)
+        self.func_share : float = conf.get("func_share", 0.4)
+        self.call_timeout : float = conf.get("call_timeout", 60.0) # 单次上游请求的上限，也是无期限时的超时
+
+    @contextmanager
+    def scope(self) -> Iterator[None]:
+        """为一轮对话设定总期限"""
+        token = _deadline.set(time.monotonic() + self.turn_timeout if self.enable else None)
+        try:
+            yield
+        finally:
+            _deadline.reset(token)
+
+    def clear(self):
+        """解除当前上下文的期限（后台任务开始时调用）"""
+        _deadline.set(None)
+
+    def remaining(self) -> Optional[float]:
+        """本轮剩余秒数，无期限时为None"""
+        if (end := _deadline.get()) is None:
+            return None
+        return end - time.monotonic()
+
+    def timeout(self, reserve: float = 0.0, share: float = 1.0) -> float:
+        """本阶段可用的秒数：剩余时间扣除reserve后按share分配，不超过call_timeout；无期限时为call_timeout"""
+        if (left := self.remaining()) is None:
+            return self.call_timeout
+        return max(0.0, min(self.call_timeout, (left - reserve) * share))
+
+    def optional(self, share: float = 1.0) -> float:
+        """可选阶段（function calling、搜索、检索）可用的秒数，已为主对话留出reserve"""
+        return self.timeout(self.reserve, share)
+
+    def main(self) -> float:
+        """主对话的超时：剩余时间，但至少保留reserve"""
+        return max(self.timeout(), min(self.reserve, self.call_timeout))
+
+deadline = TurnDeadline()
@@ -0,0 +1,111 @@
+import re
+import hashlib
+import unicodedata
+from typing import Dict, Iterable, List, Set, Tuple
+
+from .lexical import tokenize
+
+_NOISE = re.compile(r"[\W_]+", re.UNICODE)
+_HEADER = re.compile(r"^\s*(?:时间\[[^\]]*\]\s*)?(?:(?:用户|助手|系统)(?:\[[^\]]*\])?\s*[:：]\s*)?") # _create_mess加在消息前的时间与发言人
+
+PERMS = 64 # MinHash签名长度
+ROWS = 4 # LSH每段行数，共PERMS/ROWS段；Jaccard约0.5以上的文本大概率落入同一桶
+_PRIME = (1 << 61) - 1
+_COEFFS : List[Tuple[int, int]] = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _PRIME | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIME)
+    for i in range(PERMS)
+]
+
+def strip_header(text: str) -> str:
+    """去掉对话记录开头的 时间[...] 与 用户[...]: ，不同人说的同一句话应视为重复"""
+    return _HEADER.sub("", text, count=1)
+
+def normalize(text: str) -> str:
+    """去掉消息头后NFKC、转小写并去掉标点与空白，使仅在格式上不同的文本完全一致"""
+    return _NOISE.sub("", unicodedata.normalize("NFKC", strip_header(text)).lower())
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """基于消息正文分词（英文整词/中文二元组）集合的MinHash签名"""
+    features = set(tokenize(strip_header(text))) or {normalize(text)}
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big") for f in features]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _COEFFS)
+
+def similarity(x: Tuple[int, ...], y: Tuple[int, ...]) -> float:
+    """由签名估计的Jaccard相似度"""
+    return sum(1 for p, q in zip(x, y) if p == q) / PERMS
+
+class Deduplicator:
+    '''
+    近重复检测
+
+    维护已入库文本的规范化摘要与MinHash签名；签名按段分桶（LSH），
+    查询时只与至少一段相同的候选比较，规模增长时仍接近常数开销。
+    '''
+    def __init__(self):
+        self.exact : Dict[str, str] = {} # 规范化摘要 -> 原文
+        self.signatures : Dict[str, Tuple[int, ...]] = {} # 原文 -> 签名
+        self.buckets : List[Dict[Tuple[int, ...], Set[str]]] = [{} for _ in range(PERMS // ROWS)]
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.md5(normalize(text).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _bands(sig: Tuple[int, ...]) -> Iterable[Tuple[int, ...]]:
+        return (sig[i:i + ROWS] for i in range(0, PERMS, ROWS))
+
+    def add(self, texts: Iterable[str]):
+        for text in texts:
+            if not text or text in self.signatures:
+                continue
+            sig = minhash(text)
+            self.signatures[text] = sig
+            self.exact.setdefault(self._digest(text), text)
+            for bucket, band in zip(self.buckets, self._bands(sig)):
+                bucket.setdefault(band, set()).add(text)
+
+    def remove(self, texts: Iterable[str]):
+        for text in texts:
+            sig = self.signatures.pop(text, None)
+            if sig is None:
+                continue
+            digest = self._digest(text)
+            if self.exact.get(digest) == text:
+                del self.exact[digest]
+            for bucket, band in zip(self.buckets, self._bands(sig)):
+                members = bucket.get(band)
+                if members is not None:
+                    members.discard(text)
+                    if not members:
+                        del bucket[band]
+
+    def clear(self):
+        self.exact.clear()
+        self.signatures.clear()
+        for bucket in self.buckets:
+            bucket.clear()
+
+    def is_duplicate(self, text: str, threshold: float) -> bool:
+        '''
+        判断text是否与已有文本近重复
+
+        Args:
+            threshold: 估计Jaccard相似度达到该值即视为重复；不小于1时只做规范化后的完全匹配
+        '''
+        if self._digest(text) in self.exact:
+            return True
+        if threshold >= 1:
+            return False
+        sig = minhash(text)
+        seen : Set[str] = set()
+        for bucket, band in zip(self.buckets, self._bands(sig)):
+            for other in bucket.get(band, ()):
+                if other not in seen:
+                    seen.add(other)
+                    if similarity(sig, self.signatures[other]) >= threshold:
+                        return True
+        return False
@@ -49,6 +49,18 @@ class Documentation:
 
         29. 退出群聊
         30. 选择群聊 [群号|public|private]
+        31. 调度状态
+        32. 性能分析 [轮数|秒数s]
+        33. RAG去重 [文本相似度] [嵌入相似度]
+        34. RAG容量 [文档数] [KB] [age/lru/lfu]
+        35. 共享RAG添加 [添加内容]
+        36. 共享RAG删除 [删除内容]
+        37. RAG导入 [文件名]
+        38. RAG迁出 [半精度]
+        39. RAG迁入 [文件名]
+        40. 记忆压缩
+        41. 合并回复
+        42. 用量统计 [天数]
         ##################
         """.replace('    ', '') 
 
@@ -73,7 +85,7 @@ class Documentation:
         {self.chat_config.current_personality}
 
         记忆能力:
-        {memory_rounds}轮对话
+        {memory_rounds}轮对话{'（记忆压缩已开启）' if self.chat_config.compact else ''}
 
         最大token:
         {self.chat_config.max_token}
@@ -84,6 +96,9 @@ class Documentation:
         RAG功能:
         {'已启用' if self.chat_config.rag else '暂未启用'}
 
+        RAG容量:
+        {self.chat_config.rag_capacity_info()}
+
         联网搜索:
         {'已启用' if self.chat_config.search else '暂未启用'}
 
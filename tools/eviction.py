@@ -0,0 +1,124 @@
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from astrbot.api import logger
+
+from . import serial
+from .state import atomic_write_json
+
+POLICIES = ("age", "lru", "lfu")
+
+class UsageTable:
+    '''
+    RAG文档的使用记录：入库时间、最近被检索时间、被检索次数与字节数
+
+    持久化为与rag_file同级的 *.usage.json，供容量超限时挑选淘汰对象。
+    '''
+    LOW_WATER = 0.9 # 淘汰到上限的90%，避免每轮都触发删除
+
+    def __init__(self, file: Path):
+        self.file = file
+        self.rows : Dict[str, List[float]] = {} # 原文 -> [入库时间, 最近检索时间, 命中次数, 字节数]
+        self.total_bytes = 0
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self.rows
+
+    def add(self, texts: Iterable[str], now: float = 0.0):
+        now = now or time.time()
+        for text in texts:
+            if text and text not in self.rows:
+                size = len(text.encode("utf-8"))
+                self.rows[text] = [now, now, 0, size]
+                self.total_bytes += size
+                self.dirty = True
+
+    def remove(self, texts: Iterable[str]):
+        for text in texts:
+            row = self.rows.pop(text, None)
+            if row is not None:
+                self.total_bytes -= row[3]
+                self.dirty = True
+
+    def clear(self):
+        self.rows.clear()
+        self.total_bytes = 0
+        self.dirty = True
+
+    def restore(self, rows: Dict[str, List[float]]):
+        """用导入的记录覆盖已存在文档的使用记录"""
+        for text, row in rows.items():
+            if text in self.rows and len(row) == 4:
+                self.total_bytes += row[3] - self.rows[text][3]
+                self.rows[text] = list(row)
+                self.dirty = True
+
+    def touch(self, texts: Iterable[str]):
+        """记录一次检索命中"""
+        now = time.time()
+        for text in texts:
+            if (row := self.rows.get(text)) is not None:
+                row[1] = now
+                row[2] += 1
+                self.dirty = True
+
+    def victims(self, max_docs: int, max_bytes: int, policy: str) -> List[str]:
+        '''
+        挑选需要淘汰的文档，使数量与体积回落到上限的LOW_WATER以内
+
+        Args:
+            max_docs / max_bytes: 上限，0为不限
+            policy: age（最早入库）/ lru（最久未被检索）/ lfu（检索次数最少，同次数按最久未检索）
+        '''
+        over_docs = max_docs and len(self.rows) > max_docs
+        over_bytes = max_bytes and self.total_bytes > max_bytes
+        if not (over_docs or over_bytes):
+            return []
+        doc_goal = int(max_docs * self.LOW_WATER) if max_docs else len(self.rows)
+        byte_goal = int(max_bytes * self.LOW_WATER) if max_bytes else self.total_bytes
+
+        key = {
+            "age": lambda item: item[1][0],
+            "lru": lambda item: item[1][1],
+            "lfu": lambda item: (item[1][2], item[1][1]),
+        }.get(policy, lambda item: item[1][1])
+        count, size = len(self.rows), self.total_bytes
+        chosen = []
+        for text, row in sorted(self.rows.items(), key=key):
+            if count <= doc_goal and size <= byte_goal:
+                break
+            chosen.append(text)
+            count -= 1
+            size -= row[3]
+        return chosen
+
+    def save(self):
+        """写出使用记录（由调用方决定在哪个线程执行）"""
+        if not self.dirty:
+            return
+        atomic_write_json(self.file, self.rows)
+        self.dirty = False
+
+    def load(self, texts: Iterable[str]):
+        """读取使用记录，并与后端中实际存在的原文对齐（缺失的按当前时间补齐）"""
+        saved : Dict[str, List[float]] = {}
+        if self.file.exists():
+            try:
+                saved = serial.load_file(self.file)
+            except Exception as e:
+                logger.warning(f"使用记录 {self.file} 读取失败，将重建: {e}")
+        self.rows.clear()
+        self.total_bytes = 0
+        for text in texts:
+            row = saved.get(text)
+            if row is None:
+                self.add([text])
+            else:
+                self.rows[text] = row
+                self.total_bytes += row[3]
+        self.dirty = len(self.rows) != len(saved) or self.dirty
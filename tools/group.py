@@ -1,25 +1,38 @@
 import re
+import time
+import asyncio
 from pathlib import Path
-from typing import Dict, List
+from asyncio import to_thread
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
 
 from astrbot.api import logger
 from astrbot.api.event import AstrMessageEvent as Event
 
 from .doc import Documentation
 from .chat import ChatHandler, PersonalityManager
-from .config import ConfigManager, ChatConfig, Tools, GROUP_WHITELIST_FILE, USER_WHITELIST_FILE, WHITELIST_MODE
+from .state import shard_of, worker_identity
+from .config import ChatConfig, Tools, state_store, state_io, STATE, GROUP_WHITELIST_FILE, USER_WHITELIST_FILE, WHITELIST_MODE
 
 class WhitelistManager:
     '''白名单管理类'''
     def __init__(self):
-        self.groups: List[str] = ConfigManager.load_json(
-            GROUP_WHITELIST_FILE, []
-        )
-        self.users: List[str] = ConfigManager.load_json(
-            USER_WHITELIST_FILE, []
-        )
+        self.groups: List[str] = []
+        self.users: List[str] = []
+        self.reload()
+
+    def _read(self) -> Tuple[List[str], List[str]]:
+        return state_store().load(GROUP_WHITELIST_FILE, []), state_store().load(USER_WHITELIST_FILE, [])
+
+    def reload(self):
+        """从状态存储重新读取白名单（阻塞）"""
+        self.groups, self.users = self._read()
 
-    def _update_group(self, group_id: str, opt: bool):
+    async def refresh(self):
+        """经I/O线程池重新读取白名单（多进程部署时其他进程可能已修改），结果在事件循环中替换"""
+        self.groups, self.users = await state_io().call(self._read)
+
+    async def _update_group(self, group_id: str, opt: bool):
         '''群聊白名单更新，opt = true 为增加，opt = False 为删除'''
         original_groups = set(self.groups.copy())
         
@@ -34,9 +47,9 @@ class WhitelistManager:
         
         # 仅在发生变化时保存
         if set(self.groups) != original_groups:
-            ConfigManager.save_json(self.groups, GROUP_WHITELIST_FILE)
+            await state_io().save(list(self.groups), GROUP_WHITELIST_FILE)
 
-    def _update_user(self, user_id: str, opt: bool):
+    async def _update_user(self, user_id: str, opt: bool):
         '''用户白名单更新，opt = true 为增加，opt = False 为删除'''
         original_users = set(self.users.copy())
         
@@ -51,7 +64,7 @@ class WhitelistManager:
 
         # 仅在发生变化时保存
         if set(self.users) != original_users:
-            ConfigManager.save_json(self.users, USER_WHITELIST_FILE)
+            await state_io().save(list(self.users), USER_WHITELIST_FILE)
 
     def _validate_group_id(self, group_id: str) -> bool:
         """验证群号格式"""
@@ -93,9 +106,10 @@ class WhitelistManager:
             group_id, action = parsed
             if not self._validate_group_id(group_id):
                 return "⚠️ 群号无效"
+            await self.refresh()
             
             # 执行更新操作
-            self._update_group(group_id, True if action == "增加" else False)
+            await self._update_group(group_id, True if action == "增加" else False)
             
             return f"✅ 群聊 {group_id} {action}成功"
             
@@ -117,9 +131,10 @@ class WhitelistManager:
             user_id, action = parsed
             if not self._validate_user_id(user_id):
                 return "⚠️ QQ号无效"
+            await self.refresh()
             
             # 执行更新操作
-            self._update_user(user_id, True if action == "增加" else False)
+            await self._update_user(user_id, True if action == "增加" else False)
             
             # 添加操作反馈增强
             return f"✅ 用户 {user_id} {action}成功"
@@ -147,7 +162,7 @@ class GroupManagement:
 
     def _initialize(self, ID: int):
         save_path = self.chat_config.file / f"{self.chat_config.config_name}.json"
-        if save_path.exists() :
+        if state_store().exists(save_path) :
             self.chat_config.load_group()
         else :
             self.chat_config.save_group()
@@ -157,13 +172,17 @@ class GroupManagement:
                 self.chat_config.rd = 0 # 私聊记忆锁，容量默认为0
                 self.chat_config.rag = False
                 
-    def save_group(self):
+    async def save_group(self):
         """保存配置"""
-        return self.chat_config.save_group()
+        return await self.chat_config.save_group_async()
 
-    def load_group(self):
+    async def load_group(self):
         """加载配置"""
-        return self.chat_config.load_group()
+        return await self.chat_config.load_group_async()
+
+    async def sync_group(self):
+        """配置有变化时写回状态存储（多进程部署时由租约循环定期调用）"""
+        return await self.chat_config.save_group_async(changed_only=True)
     
     def show_dev_doc(self):
         """开发者文档"""
@@ -174,7 +193,14 @@ class GroupManagement:
         return self.documentation.show_user_doc()
 
 class GroupManager:
-    '''组管理器容器类（单例模式）'''
+    '''
+    组管理器容器类（单例模式）
+
+    [state] workers 大于1时，多个进程共用同一状态库：组群按群号哈希划分给各进程，
+    每个进程只响应自己持有租约的组群；某进程的心跳租约过期后，其余进程接管它的组群，
+    该进程恢复后再交还。私聊与公共实例各只有一份共用的记忆体，不能同时由多个进程改写，
+    因此不参与哈希，固定由0号进程负责（宕机时同样被接管）。
+    '''
     _instance = None
     _initialized = False
 
@@ -190,16 +216,55 @@ class GroupManager:
             self.public_group_id = "public"
             self.groups: Dict[str, GroupManagement] = {}
             self.whitelist_manager = WhitelistManager()
+
+            self.owner = worker_identity()
+            self.workers : int = STATE.get("workers", 1)
+            self.worker_index : int = STATE.get("worker_index", 0)
+            self.lease_ttl : float = STATE.get("lease_ttl", 30.0)
+            self.owned : Set[str] = set() # 本进程持有租约的组群
+            if self.workers > 1 and STATE.get("backend", "file") != "sqlite":
+                logger.warning("多进程分担需要 [state] backend = \"sqlite\"，已按单进程运行")
+                self.workers = 1
             
+            # 公共/私聊实例同步创建（公共实例会顺带创建公共知识库），白名单中的组群由load_groups并发加载
             self.add_private_group()
             self.add_public_group()
+            self._initialized = True
 
-            for group in self.whitelist_manager.groups :
-                self.groups[group] = GroupManagement(int(group))
-                if self.groups[group].chat_config.prt: logger.info(f"群{group}实例已初始化")
-            
+    async def load_groups(self):
+        """在有界线程池中并发加载白名单中的组群，每个组群就绪后立即可用"""
+        pending = [gid for gid in self.whitelist_manager.groups if gid not in self.groups]
+        if not pending:
             logger.info(f"群组管理器初始化完成，共加载 {len(self.groups)} 个实例")
-            self._initialized = True
+            return
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        slowest : Tuple[str, float] = ("", 0.0)
+        failed = 0
+
+        async def load(gid: str) -> Tuple[str, Optional[GroupManagement], float]:
+            begin = time.perf_counter()
+            try:
+                group = await loop.run_in_executor(pool, GroupManagement, int(gid))
+            except Exception as e:
+                logger.exception(f"群{gid}实例加载失败: {e}")
+                group = None
+            return gid, group, time.perf_counter() - begin
+
+        with ThreadPoolExecutor(max_workers=STATE.get("load_workers", 8), thread_name_prefix="huaer-load") as pool:
+            for done in asyncio.as_completed([load(gid) for gid in pending]):
+                gid, group, cost = await done
+                if group is None:
+                    failed += 1
+                    continue
+                self.groups.setdefault(gid, group)
+                slowest = max(slowest, (gid, cost), key=lambda item: item[1])
+                if group.chat_config.prt: logger.info(f"群{gid}实例已初始化（{cost:.2f}s）")
+
+        logger.info(
+            f"群组管理器初始化完成，共加载 {len(self.groups)} 个实例（失败 {failed}），"
+            f"并发加载用时 {time.perf_counter() - start:.2f}s，最慢为群{slowest[0]} {slowest[1]:.2f}s"
+        )
 
     def add_public_group(self):
         """初始化公共实例"""
@@ -216,6 +281,85 @@ class GroupManager:
     def get_group(self, group_id: str) -> GroupManagement:
         """安全获取实例"""
         return self.groups.get(group_id)
+
+    def owns(self, group_id: str) -> bool:
+        """本进程是否负责此组群（单进程部署时总是负责）"""
+        return self.workers <= 1 or group_id in self.owned
+
+    def _shard(self, group_id: str) -> int:
+        """组群的首选进程：私聊与公共实例固定为0号，其余按群号哈希"""
+        if group_id in (self.private_group_id, self.public_group_id):
+            return 0
+        return shard_of(group_id, self.workers)
+
+    def _renew(self, group_ids: List[str]) -> Dict[str, Optional[bool]]:
+        '''
+        续约心跳，并为应由本进程负责的组群取得/续约租约（阻塞，在I/O线程池中执行）
+
+        返回 组群 -> True（持有）/ False（被其他进程持有）/ None（原负责进程已恢复，应交还）；
+        交还的租约不在此释放，由rebalance写回状态后再释放。
+        '''
+        state = state_store()
+        state.acquire(f"worker:{self.worker_index}", self.owner, self.lease_ttl)
+        leases : Dict[str, Optional[bool]] = {}
+        for group_id in group_ids:
+            preferred = self._shard(group_id)
+            if preferred == self.worker_index or not state.alive(f"worker:{preferred}"):
+                leases[group_id] = state.acquire(f"group:{group_id}", self.owner, self.lease_ttl)
+            else:
+                leases[group_id] = None
+        return leases
+
+    async def rebalance(self):
+        '''
+        续约心跳与组群租约，按哈希归属接管/交还组群，并同步所持组群的状态
+
+        只有租约读写在I/O线程池中进行；组群的增加、状态加载与写回都在事件循环中完成，
+        不会与正在处理的对话同时修改同一对象。
+        '''
+        await self.whitelist_manager.refresh()
+        for group_id in self.whitelist_manager.groups:
+            if group_id not in self.groups:
+                group = await to_thread(GroupManagement, int(group_id))
+                self.groups.setdefault(group_id, group)
+
+        leases = await state_io().call(self._renew, list(self.groups))
+        for group_id, held in leases.items():
+            if (group := self.groups.get(group_id)) is None: # 续约期间已被移除
+                continue
+            if held is None and group_id in self.owned: # 原负责进程已恢复，写回后交还
+                await group.save_group()
+                await state_io().call(state_store().release, f"group:{group_id}", self.owner)
+                self.owned.discard(group_id)
+                logger.info(f"组群 {group_id} 已交还进程 {self._shard(group_id)}")
+
+            if held and group_id not in self.owned:
+                await group.load_group() # 接管时读取其他进程写入的最新状态
+                logger.info(f"组群 {group_id} 由本进程（{self.worker_index}）负责")
+            elif held is False and group_id in self.owned:
+                logger.warning(f"组群 {group_id} 的租约已被其他进程持有")
+            if held:
+                await group.sync_group()
+                self.owned.add(group_id)
+            else:
+                self.owned.discard(group_id)
+
+    async def run_leases(self):
+        """租约循环：每隔三分之一有效期执行一次rebalance（首次由initialize在开始服务前执行），单进程部署时不启动"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"租约续约失败: {e}")
+
+    def release_all(self):
+        """退出前释放所有租约，其他进程无需等待过期即可接管"""
+        state = state_store()
+        for group_id in self.owned:
+            state.release(f"group:{group_id}", self.owner)
+        state.release(f"worker:{self.worker_index}", self.owner)
+        self.owned.clear()
     
     async def reset_group(self, group_id: str) -> str:
         """重置群组配置"""
@@ -236,8 +380,8 @@ class GroupManager:
             logger.warning(f"群组 {group_id} 已存在，跳过创建")
             return
             
-        # 创建群组实例
-        self.groups[group_id] = GroupManagement(int(group_id))
+        # 创建群组实例（涉及磁盘读写与RAG后端构造，放到线程中执行）
+        self.groups[group_id] = await to_thread(GroupManagement, int(group_id))
             
         logger.info(f"群组 {group_id} 实例已创建")
 
@@ -246,6 +390,9 @@ class GroupManager:
         if group_id in self.groups:
             # 执行清理操作
             del self.groups[group_id]
+            if group_id in self.owned:
+                self.owned.discard(group_id)
+                await state_io().call(state_store().release, f"group:{group_id}", self.owner)
             logger.info(f"群组 {group_id} 实例已移除")
         else:
             logger.warning(f"尝试移除不存在的群组：{group_id}")
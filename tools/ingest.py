@@ -0,0 +1,205 @@
+import re
+import json
+import time
+import asyncio
+from pathlib import Path
+from asyncio import to_thread
+from itertools import islice
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from astrbot.api import logger
+
+from .rag import RAGStore
+from .state import atomic_write_json
+from .tokens import estimate_tokens
+from .scheduler import scheduler
+
+_SENTENCE = re.compile(r"(?<=[。！？!?；;\n])|(?<=\.)\s+")
+
+def iter_units(path: Path) -> Iterator[str]:
+    '''
+    流式读取文件中的文本单元，不会一次性读入整个文件
+
+    .jsonl 每行一个对象（取text/content字段）或字符串；其余按空行分段（txt/markdown）。
+    '''
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix.lower() == ".jsonl":
+            for line in f:
+                if not (line := line.strip()):
+                    continue
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"{path.name} 中存在无法解析的行，已跳过")
+                    continue
+                text = item if isinstance(item, str) else item.get("text") or item.get("content") or ""
+                if text.strip():
+                    yield text.strip()
+        else:
+            paragraph: List[str] = []
+            for line in f:
+                if line.strip():
+                    paragraph.append(line.rstrip())
+                elif paragraph:
+                    yield "\n".join(paragraph)
+                    paragraph = []
+            if paragraph:
+                yield "\n".join(paragraph)
+
+def _pieces(unit: str, max_tokens: int) -> Iterator[str]:
+    """把文本单元切成不超过max_tokens的句子（超长句子按字符硬切）"""
+    for sentence in _SENTENCE.split(unit):
+        if not (sentence := sentence.strip()):
+            continue
+        if estimate_tokens(sentence) <= max_tokens:
+            yield sentence
+            continue
+        step = max(1, len(sentence) * max_tokens // estimate_tokens(sentence))
+        for start in range(0, len(sentence), step):
+            yield sentence[start:start + step]
+
+def iter_chunks(path: Path, max_tokens: int, overlap: int) -> Iterator[str]:
+    '''
+    将文件切为token数受限、相邻块之间重叠overlap个token的文本块
+
+    切分是确定性的，因此断点续传时按块序号跳过即可。
+    '''
+    window: List[str] = []
+    tokens = 0
+    for unit in iter_units(path):
+        for piece in _pieces(unit, max_tokens):
+            cost = estimate_tokens(piece)
+            if window and tokens + cost > max_tokens:
+                yield " ".join(window)
+                # 保留末尾不超过overlap个token的句子作为下一块的开头
+                kept: List[str] = []
+                kept_tokens = 0
+                for prev in reversed(window):
+                    prev_cost = estimate_tokens(prev)
+                    if kept_tokens + prev_cost > overlap:
+                        break
+                    kept.insert(0, prev)
+                    kept_tokens += prev_cost
+                window, tokens = kept, kept_tokens
+            window.append(piece)
+            tokens += cost
+    if window:
+        yield " ".join(window)
+
+class BulkIngestor:
+    '''
+    大文件批量导入RAG
+
+    流式切块 -> 按batch分批 -> 经调度器embed通道、以concurrency为上限并发嵌入，写入串行
+    （HippoRAG的嵌入与抽取在写入内完成，各批依次执行）；
+    已完成的连续块数写入检查点（与文件同名的 *.ingest.json），中断后再次导入同一文件会从断点继续。
+    '''
+    def __init__(self, store: RAGStore, group: str, conf: Optional[Dict] = None):
+        conf = conf or {}
+        self.store = store
+        self.group = group
+        self.max_tokens : int = conf.get("chunk_tokens", 400)
+        self.overlap : int = conf.get("overlap_tokens", 60)
+        self.batch : int = conf.get("batch", 16)
+        self.concurrency : int = conf.get("concurrency", 2)
+        self.report_every : float = conf.get("report_every", 15.0)
+
+    @staticmethod
+    def _checkpoint_file(path: Path) -> Path:
+        return path.with_name(path.name + ".ingest.json")
+
+    def _load_checkpoint(self, path: Path) -> int:
+        """返回已完成的块数；文件被修改过或参数不同则从头开始"""
+        file = self._checkpoint_file(path)
+        if not file.exists():
+            return 0
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return 0
+        stat = path.stat()
+        signature = [stat.st_size, stat.st_mtime, self.max_tokens, self.overlap, self.group]
+        return data.get("done", 0) if data.get("signature") == signature else 0
+
+    def _save_checkpoint(self, path: Path, done: int, finished: bool = False):
+        file = self._checkpoint_file(path)
+        if finished:
+            file.unlink(missing_ok=True)
+            return
+        stat = path.stat()
+        atomic_write_json(file, {"signature": [stat.st_size, stat.st_mtime, self.max_tokens, self.overlap, self.group], "done": done})
+
+    async def run(self, path: Path) -> AsyncIterator[Dict[str, Any]]:
+        '''
+        执行导入，每隔report_every秒及结束时产出一次进度
+
+        进度字段: done（已完成块数，含断点前）、indexed、skipped（已存在）、failed、finished、elapsed
+        '''
+        start = time.perf_counter()
+        resumed = await to_thread(self._load_checkpoint, path)
+        chunks = iter_chunks(path, self.max_tokens, self.overlap)
+        progress = {"done": resumed, "resumed": resumed, "indexed": 0, "skipped": 0, "failed": 0, "finished": False, "elapsed": 0.0}
+
+        completed: Dict[int, int] = {} # 批起始序号 -> 块数，用于推进连续完成的前缀；失败的批次不计入，续传时重试
+        frontier = resumed
+
+        async def ingest(offset: int, batch: List[str]):
+            try:
+                # 已存在的块（如续传时重叠部分）不再写入；只在请求上游时占用embed名额，等待写入锁时不占
+                indexed = await self.store.index_missing(batch, lambda: scheduler.slot("embed", self.group, "background"))
+            except Exception as e:
+                progress["failed"] += len(batch)
+                logger.error(f"批量导入 {path.name} 第{offset}块起的一批失败: {e}")
+                return
+            progress["indexed"] += indexed
+            progress["skipped"] += len(batch) - indexed
+            completed[offset] = len(batch)
+
+        def next_batch() -> List[str]:
+            return [chunk for _, chunk in zip(range(self.batch), chunks)]
+
+        def advance() -> Dict[str, Any]:
+            nonlocal frontier
+            while frontier in completed:
+                frontier += completed.pop(frontier)
+            progress.update(done=frontier, elapsed=round(time.perf_counter() - start, 1))
+            return dict(progress)
+
+        await to_thread(lambda: deque(islice(chunks, resumed), maxlen=0)) # 跳过断点前的块
+        pending = set()
+        offset = resumed
+        exhausted = False
+        last_report = time.perf_counter()
+        try:
+            while True:
+                batch = await to_thread(next_batch)
+                if batch:
+                    # 同时在途的批次不超过concurrency，读取进度不会远超写入进度
+                    while len(pending) >= self.concurrency:
+                        _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    pending.add(asyncio.create_task(ingest(offset, batch)))
+                    offset += len(batch)
+                elif pending:
+                    _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    exhausted = True
+                    break
+
+                if time.perf_counter() - last_report >= self.report_every:
+                    last_report = time.perf_counter()
+                    snapshot = advance()
+                    await to_thread(self._save_checkpoint, path, frontier)
+                    await self.store.save()
+                    yield snapshot
+        finally:
+            # 正常结束或被中途关闭时都等待在途批次写完，再落盘检查点
+            if pending:
+                await asyncio.wait(pending)
+            advance()
+            await self.store.save()
+            await to_thread(self._save_checkpoint, path, frontier, exhausted and progress["failed"] == 0)
+
+        progress["finished"] = True
+        yield progress
@@ -0,0 +1,155 @@
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .config import DATA_DIR, LEDGER, state_io
+from .tasks import tasks
+
+_users : ContextVar[Tuple[str, ...]] = ContextVar("ledger_users", default=("",))
+
+def _split(total: int, parts: int) -> List[int]:
+    """把total尽量平均地分为parts份（余数归前几份），各份之和仍为total"""
+    base, rest = divmod(total, parts)
+    return [base + (1 if i < rest else 0) for i in range(parts)]
+
+class TokenLedger:
+    '''
+    token用量账本
+
+    每次上游对话请求的 prompt/completion/reasoning token 按 日期、组群、用户、模型 追加写入SQLite（只增不改）；
+    写入先在内存中攒批，由后台任务经I/O线程池落盘。当天各组群的用量同时保存在内存中，
+    超出每日预算的检查不涉及磁盘。当前用户经contextvars传递，后台任务（RAG存入、摘要）计入触发它的用户；合并回复的用量由同批用户均摊。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = LEDGER if conf is None else conf
+        self.enable : bool = conf.get("enable", True)
+        file = Path(conf.get("file", "ledger.sqlite3"))
+        self.file = file if file.is_absolute() else DATA_DIR / file
+        self.daily_budget : int = conf.get("daily_budget", 0) # 各组群每日token上限，0为不限
+        self.budgets : Dict[str, int] = {str(k): v for k, v in conf.get("budgets", {}).items()} # 单独设置的组群
+        self.flush_every : int = max(1, conf.get("flush_every", 20))
+
+        self.db : Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.day = time.strftime("%Y-%m-%d")
+        self.spent : Dict[str, int] = {} # 当天各组群已用token
+        self._pending : List[Tuple] = []
+
+    # 持久化（阻塞，在I/O线程池中执行）
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            self.file.parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(str(self.file), timeout=10, check_same_thread=False, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS usage (ts REAL NOT NULL, day TEXT NOT NULL, grp TEXT NOT NULL, user TEXT NOT NULL, "
+                "model TEXT NOT NULL, kind TEXT NOT NULL, prompt INTEGER NOT NULL, completion INTEGER NOT NULL, reasoning INTEGER NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS usage_day ON usage (day, grp)")
+        return self.db
+
+    def open(self):
+        """打开账本并读入当天已用量（重启后预算继续累计）"""
+        if not self.enable:
+            return
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT grp, SUM(prompt + completion) FROM usage WHERE day = ? GROUP BY grp", (self.day,)
+            ).fetchall()
+        for group, total in rows:
+            self.spent[group] = self.spent.get(group, 0) + total
+
+    def _write(self, rows: List[Tuple]):
+        with self._lock:
+            self._connect().executemany("INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    async def flush(self):
+        """将攒批的记录写入账本"""
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await state_io().call(self._write, rows)
+        except Exception as e:
+            self._pending = rows + self._pending
+            logger.error(f"token账本写入失败，将在下次重试: {e}")
+
+    def close(self):
+        with self._lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    # 记录与预算
+    @contextmanager
+    def user(self, *user_ids: str) -> Iterator[None]:
+        """在此范围内（含其间启动的后台任务）的用量计入user_ids，多个用户时均摊"""
+        token = _users.set(user_ids or ("",))
+        try:
+            yield
+        finally:
+            _users.reset(token)
+
+    def _roll(self):
+        if (today := time.strftime("%Y-%m-%d")) != self.day:
+            self.day, self.spent = today, {}
+
+    def record(self, group: str, model: str, kind: str, usage: Optional[Dict[str, Any]]):
+        """记录一次上游响应的usage字段"""
+        if not self.enable or not usage:
+            return
+        self._roll()
+        prompt = usage.get("prompt_tokens") or 0
+        completion = usage.get("completion_tokens") or 0
+        reasoning = (usage.get("completion_tokens_details") or {}).get("reasoning_tokens") or 0 # 已包含在completion中
+        self.spent[group] = self.spent.get(group, 0) + prompt + completion
+        users, now = _users.get(), time.time() # 同一次请求的各行时间戳相同，报表据此统计请求次数
+        for user, p, c, r in zip(users, *(_split(n, len(users)) for n in (prompt, completion, reasoning))):
+            self._pending.append((now, self.day, group, user, model, kind, p, c, r))
+        if len(self._pending) >= self.flush_every:
+            tasks.spawn(self.flush(), "ledger_flush")
+
+    def budget_of(self, group: str) -> int:
+        return self.budgets.get(group, self.daily_budget)
+
+    def over_budget(self, group: str) -> Optional[str]:
+        """组群当天用量已达预算时返回提示，否则返回None"""
+        if not self.enable or not (limit := self.budget_of(group)):
+            return None
+        self._roll()
+        if self.spent.get(group, 0) >= limit:
+            return f"⚠️ 本群今日的token额度（{limit}）已用完，明天再来吧"
+        return None
+
+    # 报表
+    def _top(self, since: str, column: str, limit: int) -> List[Tuple]:
+        with self._lock:
+            return self._connect().execute(
+                f"SELECT {column}, SUM(prompt), SUM(completion), SUM(reasoning), COUNT(DISTINCT ts) FROM usage "
+                f"WHERE day >= ? GROUP BY {column} ORDER BY SUM(prompt + completion) DESC LIMIT ?",
+                (since, limit),
+            ).fetchall()
+
+    def report(self, days: int = 1, limit: int = 5) -> str:
+        """最近days天（含今天）用量最多的组群、用户与模型（阻塞，在I/O线程池中执行）"""
+        since = time.strftime("%Y-%m-%d", time.localtime(time.time() - (max(1, days) - 1) * 86400))
+        lines = [f"📊 token用量（{since} 起）"]
+        for title, column in (("组群", "grp"), ("用户", "user"), ("模型", "model")):
+            rows = self._top(since, column, limit)
+            lines.append(f"\n{title} Top{limit}:")
+            if not rows:
+                lines.append("  无记录")
+            for name, prompt, completion, reasoning, calls in rows:
+                budget = ""
+                if column == "grp" and (cap := self.budget_of(name)):
+                    budget = f"，今日 {self.spent.get(name, 0)}/{cap}"
+                lines.append(f"  {name or '未知'}: {prompt + completion}（输入{prompt}/输出{completion}/思考{reasoning}，{calls}次{budget}）")
+        return "\n".join(lines)
+
+ledger = TokenLedger()
@@ -0,0 +1,150 @@
+import re
+import math
+import threading
+import unicodedata
+from pathlib import Path
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from astrbot.api import logger
+
+from . import serial
+from .state import atomic_write_json
+
+_WORD = re.compile(r"[a-z0-9]+|[\u3400-\u9fff\uf900-\ufaff]+")
+
+def tokenize(text: str) -> List[str]:
+    '''
+    中英混合分词：英文与数字按整词切分，中文连续片段切为字符二元组（单字片段保留单字）
+
+    名字、编号等精确关键词因此能被直接命中。
+    '''
+    tokens: List[str] = []
+    for run in _WORD.findall(unicodedata.normalize("NFKC", text).lower()):
+        if run.isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class LexicalIndex:
+    '''
+    基于BM25的本地倒排索引
+
+    只持久化文档原文（JSON列表），倒排表在加载时重建。
+    各方法由内部锁串行化，检索可放在工作线程中执行，与事件循环上的增删互不干扰。
+    '''
+    def __init__(self, file: Path, k1: float = 1.5, b: float = 0.75):
+        self.file = file
+        self.k1 = k1
+        self.b = b
+        self.docs : Dict[int, str] = {}
+        self.ids : Dict[str, int] = {} # 原文 -> 文档编号
+        self.lengths : Dict[int, int] = {}
+        self.postings : Dict[str, Dict[int, int]] = {}
+        self.total_len = 0
+        self._next_id = 0
+        self.dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self.ids
+
+    def add(self, texts: Iterable[str]):
+        """添加文档，已存在的原文会被跳过"""
+        with self._lock:
+            for text in texts:
+                if not text or text in self.ids:
+                    continue
+                doc_id = self._next_id
+                self._next_id += 1
+                terms = Counter(tokenize(text))
+                self.docs[doc_id] = text
+                self.ids[text] = doc_id
+                self.lengths[doc_id] = sum(terms.values())
+                self.total_len += self.lengths[doc_id]
+                for term, tf in terms.items():
+                    self.postings.setdefault(term, {})[doc_id] = tf
+                self.dirty = True
+
+    def remove(self, texts: Iterable[str]):
+        """删除文档，不存在的原文会被忽略"""
+        with self._lock:
+            for text in texts:
+                doc_id = self.ids.pop(text, None)
+                if doc_id is None:
+                    continue
+                for term in set(tokenize(self.docs.pop(doc_id))):
+                    posting = self.postings.get(term)
+                    if posting is not None:
+                        posting.pop(doc_id, None)
+                        if not posting:
+                            del self.postings[term]
+                self.total_len -= self.lengths.pop(doc_id)
+                self.dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.docs.clear()
+            self.ids.clear()
+            self.lengths.clear()
+            self.postings.clear()
+            self.total_len = 0
+            self.dirty = True
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float, float]]:
+        '''
+        BM25检索
+
+        返回:
+            [(原文, BM25得分, 查询词覆盖率)]，按得分降序
+        '''
+        with self._lock:
+            terms = set(tokenize(query))
+            if not terms or not self.docs:
+                return []
+            n = len(self.docs)
+            avg_len = self.total_len / n if n else 1.0
+            scores : Dict[int, float] = {}
+            matched : Dict[int, int] = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+                    matched[doc_id] = matched.get(doc_id, 0) + 1
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self.docs[d], score, matched[d] / len(terms)) for d, score in ranked]
+
+    def save(self):
+        """写出文档原文（由调用方决定在哪个线程执行）"""
+        with self._lock:
+            if not self.dirty:
+                return
+            texts, self.dirty = list(self.docs.values()), False
+        try:
+            atomic_write_json(self.file, texts)
+        except BaseException:
+            self.dirty = True
+            raise
+
+    def load(self) -> bool:
+        """从文件重建索引，文件不存在或损坏时返回False"""
+        if not self.file.exists():
+            return False
+        try:
+            texts = serial.load_file(self.file)
+        except Exception as e:
+            logger.warning(f"词法索引 {self.file} 读取失败，将重建: {e}")
+            return False
+        with self._lock:
+            self.clear()
+            self.add(texts)
+            self.dirty = False
+        return True
@@ -0,0 +1,198 @@
+import time
+from collections import deque
+from asyncio import Future, TimeoutError as AsyncTimeout, get_running_loop, shield, wait_for
+from typing import Deque, Dict, Optional, Tuple
+
+from .config import RATE_LIMIT, ADMISSION
+
+class TokenBucket:
+    '''令牌桶，capacity为桶容量，rate为每秒补充的令牌数'''
+    __slots__ = ("capacity", "rate", "tokens", "stamp")
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float):
+        """按流逝时间补充令牌"""
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+
+    def wait_time(self, now: float, cost: float = 1.0) -> float:
+        """距离可取出cost个令牌还需等待的秒数，0表示立即可用"""
+        self._refill(now)
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float = 1.0):
+        self.tokens -= cost
+
+    def idle(self, now: float) -> bool:
+        """桶已回满，可安全回收"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class RateLimiter:
+    '''
+    多维令牌桶限流器
+
+    一次请求同时消耗用户、组群、模型三个维度的桶，任一维度不足则整体拒绝（不扣除任何令牌）。
+    容量或速率配置为0的维度视为不限流。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = RATE_LIMIT if conf is None else conf
+        self.enable : bool = conf.get("enable", False)
+        self.limits : Dict[str, Tuple[float, float]] = {
+            "user": (conf.get("user_capacity", 0), conf.get("user_rate", 0)),
+            "group": (conf.get("group_capacity", 0), conf.get("group_rate", 0)),
+            "model": (conf.get("model_capacity", 0), conf.get("model_rate", 0)),
+        }
+        self.buckets : Dict[Tuple[str, str], TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+        self._sweep_interval = 600.0 # 回收空闲桶的间隔，防止键无限增长
+
+    def _bucket(self, scope: str, key: str) -> Optional[TokenBucket]:
+        capacity, rate = self.limits[scope]
+        if capacity <= 0 or rate <= 0:
+            return None
+        bucket = self.buckets.get((scope, key))
+        if bucket is None:
+            bucket = self.buckets[(scope, key)] = TokenBucket(capacity, rate)
+        return bucket
+
+    def _sweep(self, now: float):
+        """清理已回满的桶"""
+        if now - self._last_sweep < self._sweep_interval:
+            return
+        self._last_sweep = now
+        for k in [k for k, b in self.buckets.items() if b.idle(now)]:
+            del self.buckets[k]
+
+    def acquire(self, user: str, group: str, model: str) -> Tuple[bool, float]:
+        '''
+        尝试为一次对话取得令牌
+
+        返回:
+            (是否放行, 需等待的秒数)
+        '''
+        if not self.enable:
+            return True, 0.0
+
+        now = time.monotonic()
+        self._sweep(now)
+
+        buckets = [b for b in (
+            self._bucket("user", user),
+            self._bucket("group", group),
+            self._bucket("model", model),
+        ) if b is not None]
+
+        wait = max((b.wait_time(now) for b in buckets), default=0.0)
+        if wait > 0:
+            return False, wait
+
+        for b in buckets:
+            b.take()
+        return True, 0.0
+
+class Ticket:
+    '''一次对话的入场凭证'''
+    __slots__ = ("since", "deadline", "ahead", "granted", "future")
+
+    def __init__(self, timeout: float):
+        self.since = time.monotonic()
+        self.deadline = self.since + timeout # 排队截止时间，过期仍未入场的对话直接丢弃
+        self.ahead = 0 # 入队时前面排队的条数
+        self.granted = False
+        self.future : Optional[Future] = None
+
+class AdmissionControl:
+    '''
+    对话准入控制（过载保护）
+
+    同时处理的对话轮数达到max_inflight后，新对话按先来后到排队，入场时回复前面的排队条数；
+    排队已满，或最早的在处理对话已超过stall_age秒（上游明显变慢，继续排队只会越积越多）时直接拒绝；
+    排队超过queue_timeout仍未入场的对话被丢弃，不再占用上游。超级用户不排队。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = ADMISSION if conf is None else conf
+        self.enable : bool = conf.get("enable", False)
+        self.max_inflight : int = max(1, conf.get("max_inflight", 16))
+        self.max_queue : int = conf.get("max_queue", 32)
+        self.queue_timeout : float = conf.get("queue_timeout", 60.0)
+        self.stall_age : float = conf.get("stall_age", 120.0)
+        self.inflight : Dict[Ticket, None] = {} # 按入场顺序，首个即最早
+        self.queue : Deque[Ticket] = deque()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "expired": 0}
+
+    def oldest_age(self) -> float:
+        """最早的在处理对话已进行的秒数"""
+        return time.monotonic() - next(iter(self.inflight)).since if self.inflight else 0.0
+
+    def stats_text(self) -> str:
+        return (f"对话准入: 处理中 {len(self.inflight)}/{self.max_inflight}（最早已{self.oldest_age():.0f}秒），"
+                f"排队 {len(self.queue)}/{self.max_queue}，累计入场 {self.stats['admitted']}，排队 {self.stats['queued']}，"
+                f"拒绝 {self.stats['rejected']}，超时丢弃 {self.stats['expired']}")
+
+    def _grant(self, ticket: Ticket):
+        ticket.granted = True
+        ticket.since = time.monotonic() # 入场后按处理时长计龄
+        self.inflight[ticket] = None
+        self.stats["admitted"] += 1
+
+    def enter(self, superuser: bool = False) -> Optional[Ticket]:
+        """申请入场：返回None为拒绝；返回的凭证未granted时需再wait"""
+        ticket = Ticket(self.queue_timeout)
+        if not self.enable or superuser or (len(self.inflight) < self.max_inflight and not self.queue):
+            self._grant(ticket)
+            return ticket
+        if len(self.queue) >= self.max_queue or self.oldest_age() > self.stall_age:
+            self.stats["rejected"] += 1
+            return None
+        ticket.ahead = len(self.queue)
+        ticket.future = get_running_loop().create_future()
+        self.queue.append(ticket)
+        self.stats["queued"] += 1
+        return ticket
+
+    async def wait(self, ticket: Ticket) -> bool:
+        """等待排队中的凭证入场，超过截止时间返回False"""
+        if ticket.granted:
+            return True
+        try:
+            return await wait_for(shield(ticket.future), max(0.0, ticket.deadline - time.monotonic()))
+        except AsyncTimeout:
+            if ticket.future.done(): # 恰在超时时入场
+                return ticket.future.result()
+            self.stats["expired"] += 1
+            self.leave(ticket)
+            return False
+
+    def leave(self, ticket: Ticket):
+        """对话结束（或放弃排队）时调用，空出的名额交给队首未过期的对话"""
+        if ticket.granted:
+            self.inflight.pop(ticket, None)
+        else:
+            try:
+                self.queue.remove(ticket)
+            except ValueError:
+                pass
+            if not ticket.future.done():
+                ticket.future.cancel()
+        now = time.monotonic()
+        while self.queue and len(self.inflight) < self.max_inflight:
+            head = self.queue.popleft()
+            if head.future.done():
+                continue
+            if now > head.deadline:
+                self.stats["expired"] += 1
+                head.future.set_result(False)
+                continue
+            self._grant(head)
+            head.future.set_result(True)
@@ -0,0 +1,180 @@
+import os
+import time
+import queue
+import random
+import logging
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from astrbot.api import logger
+
+from . import serial
+from .config import DATA_DIR, LOG
+
+class Lazy:
+    '''
+    延迟格式化的日志消息
+
+    logging只有在记录真正被输出时才会调用str(msg)，因此未启用的级别不会产生任何字符串拼接。
+    用法: logger.info(Lazy(self._chat_info))
+    '''
+    __slots__ = ("func", "args")
+
+    def __init__(self, func: Callable[..., Any], *args: Any):
+        self.func = func
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.func(*self.args))
+
+class _DeferredQueueHandler(QueueHandler):
+    '''不在调用线程格式化的QueueHandler，格式化工作全部交给后台线程'''
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+class JsonFormatter(logging.Formatter):
+    '''JSON行格式：msg为dict时直接序列化（trace），否则输出结构化事件'''
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, dict):
+            return serial.dumps_str(record.msg, default=str)
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        data.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return serial.dumps_str(data, default=str)
+
+class _AsyncSinks:
+    '''所有落盘日志共用的后台写线程'''
+    def __init__(self):
+        self.queue : queue.SimpleQueue = queue.SimpleQueue()
+        self.handlers : List[logging.Handler] = []
+        self.listener : Optional[QueueListener] = None
+
+    def attach(self, target: logging.Logger, handler: logging.Handler):
+        """令target的记录经队列由后台线程交给handler写出"""
+        handler.addFilter(lambda record, name=target.name: record.name == name) # 共用队列，按来源分流
+        self.handlers.append(handler)
+        target.addHandler(_DeferredQueueHandler(self.queue))
+        self._restart()
+
+    def _restart(self):
+        if self.listener:
+            self.listener.stop()
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def relocate(self, data_dir: Path):
+        """把各滚动日志文件改到data_dir下的同名子目录，之后的记录写入新位置（压测与测试使用临时数据目录）"""
+        for handler in self.handlers:
+            if not isinstance(handler, _LazyRotatingHandler):
+                continue
+            handler.acquire()
+            try:
+                if handler.stream is not None:
+                    handler.stream.close()
+                    handler.stream = None
+                handler.baseFilename = os.path.abspath(data_dir / handler.subdir / Path(handler.baseFilename).name)
+            finally:
+                handler.release()
+
+    def shutdown(self):
+        """刷新队列并停止后台线程"""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+        for handler in self.handlers:
+            handler.flush()
+
+sinks = _AsyncSinks()
+
+class _LazyRotatingHandler(RotatingFileHandler):
+    '''首条记录写出时才创建目录与文件，导入模块本身不触碰数据目录'''
+    def __init__(self, file: Path, subdir: str, **kwargs: Any):
+        super().__init__(file, delay=True, **kwargs)
+        self.subdir = subdir
+
+    def _open(self):
+        Path(self.baseFilename).parent.mkdir(parents=True, exist_ok=True)
+        return super()._open()
+
+def rotating_handler(file_name: str, subdir: str, conf: Dict) -> RotatingFileHandler:
+    """在DATA_DIR/subdir下创建以JSON行输出的滚动文件handler"""
+    handler = _LazyRotatingHandler(
+        DATA_DIR / subdir / file_name, subdir,
+        maxBytes=conf.get("max_bytes", 10 * 1024 * 1024),
+        backupCount=conf.get("backup_count", 5),
+        encoding="utf-8",
+    )
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+class StructLog:
+    '''
+    结构化日志
+
+    事件以JSON行写入 data/logs，序列化在后台线程进行；
+    体积较大的请求/响应载荷按payload_sample_rate采样，并且只在DEBUG级别启用时才会记录。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = LOG if conf is None else conf
+        self.enable : bool = conf.get("enable", True)
+        self.sample_rate : float = conf.get("payload_sample_rate", 0.05)
+        self.context : List[Callable[[], Dict[str, Any]]] = [] # 附加字段的提供者，如trace_id
+
+        self.logger = logging.getLogger("huaer.struct")
+        self.logger.propagate = False
+        self.logger.setLevel(conf.get("level", "INFO").upper())
+        if self.enable and not self.logger.handlers:
+            sinks.attach(self.logger, rotating_handler(conf.get("file", "huaer.jsonl"), "logs", conf))
+
+    def enabled(self, level: int) -> bool:
+        return self.enable and self.logger.isEnabledFor(level)
+
+    def _fields(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        for provider in self.context:
+            fields.update(provider())
+        return fields
+
+    def event(self, name: str, level: int = logging.INFO, **fields: Any):
+        """记录一条结构化事件，级别未启用时立即返回"""
+        if not self.enabled(level):
+            return
+        self.logger.log(level, name, extra={"fields": self._fields(fields)})
+
+    @contextmanager
+    def timed(self, name: str, **fields: Any):
+        """计时上下文，退出时以结构化事件记录耗时，可在with块内向返回的dict追加字段"""
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            fields["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self.event(name, **fields)
+
+    def payload(self, name: str, value: Any, **fields: Any):
+        '''
+        采样记录大体积载荷（请求体、响应解析结果等）
+
+        同时写入结构化日志与控制台debug；两者均未启用或未被采样时不做任何格式化。
+        '''
+        to_file = self.enabled(logging.DEBUG)
+        to_console = logger.isEnabledFor(logging.DEBUG)
+        if not (to_file or to_console) or random.random() >= self.sample_rate:
+            return
+        if to_file:
+            fields["payload"] = value
+            self.logger.debug(name, extra={"fields": self._fields(fields)})
+        if to_console:
+            logger.debug("%s: %s", name, value)
+
+# 进程级单例，所有组群共享
+slog = StructLog()
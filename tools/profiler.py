@@ -0,0 +1,135 @@
+import os
+import time
+import pstats
+import cProfile
+import datetime
+import functools
+from pathlib import Path
+from asyncio import Event as AsyncEvent, TimeoutError as AsyncTimeout, get_running_loop, wait_for
+from typing import Callable, List, Optional
+
+from astrbot.api import logger
+
+from .config import DATA_DIR
+
+class Profiler:
+    '''
+    按需性能剖析器
+
+    开启后在事件循环线程上启用cProfile，覆盖各命令处理、_process_response与HippoRAG协程；
+    经wrap包装、交由线程池执行的函数（如markdown渲染）在各自线程内单独剖析，结束时合并。
+    未开启时各埋点仅有一次布尔判断，不产生额外开销。
+    '''
+    def __init__(self, out_dir: Path = DATA_DIR / "profiles", top: int = 15):
+        self.active : bool = False
+        self.out_dir = out_dir
+        self.top = top
+
+        self.turns_left = 0 # 剩余的对话轮数，0表示按时长结束
+        self.started = 0.0
+        self.profile : Optional[cProfile.Profile] = None
+        self.thread_profiles : List[cProfile.Profile] = []
+        self.summary = ""
+        self._done : Optional[AsyncEvent] = None
+        self._timer = None
+
+    def start(self, turns: int = 0, seconds: float = 0.0) -> str:
+        '''
+        开始一次剖析，turns与seconds至少给出一个；先达到者结束本次剖析
+
+        返回:
+            无法开始的原因（已有剖析进行中、或其他剖析工具占用时），成功开始时为空字符串
+        '''
+        if self.active:
+            return "⚠️ 已有剖析正在进行"
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e: # Python 3.12起同一时刻只允许一个剖析工具（如调试器、其他插件的cProfile）
+            logger.warning(f"性能剖析无法开启: {e}")
+            return "⚠️ 无法开启剖析：已有其他剖析工具在运行"
+        self.profile = profile
+        self.turns_left = max(0, turns)
+        self.started = time.perf_counter()
+        self.thread_profiles = []
+        self.summary = ""
+        self._done = AsyncEvent()
+        if seconds > 0:
+            self._timer = get_running_loop().call_later(seconds, self.stop)
+        self.active = True
+        logger.info(f"性能剖析已开启: 轮数={turns or '-'}, 时长={seconds or '-'}秒")
+        return ""
+
+    def turn_done(self):
+        """一轮对话结束，调用方应先判断active"""
+        if self.turns_left > 0:
+            self.turns_left -= 1
+            if self.turns_left == 0:
+                self.stop()
+
+    def wrap(self, func: Callable) -> Callable:
+        """包装将在线程池中执行的函数，未开启时原样返回"""
+        if not self.active:
+            return func
+
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError: # 该线程已被其他剖析工具占用，不剖析此次调用
+                return func(*args, **kwargs)
+            self.thread_profiles.append(prof)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                prof.disable()
+        return profiled
+
+    def stop(self):
+        """结束剖析，写出文件并生成摘要"""
+        if not self.active:
+            return
+        self.active = False
+        self.profile.disable()
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        elapsed = time.perf_counter() - self.started
+
+        try:
+            stats = pstats.Stats(self.profile)
+            for prof in self.thread_profiles:
+                stats.add(prof)
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            dump_file = self.out_dir / f"profile_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.prof"
+            stats.dump_stats(str(dump_file))
+            self.summary = self._summarize(stats, elapsed, dump_file)
+            logger.info(self.summary)
+        except Exception as e:
+            logger.exception(f"剖析结果处理失败: {e}")
+            self.summary = "⚠️ 剖析结果处理失败，请查看日志"
+        finally:
+            self.profile = None
+            self.thread_profiles = []
+            self._done.set()
+
+    async def wait(self, timeout: float) -> str:
+        """等待本次剖析结束并返回摘要，超时则强制结束"""
+        try:
+            await wait_for(self._done.wait(), timeout)
+        except AsyncTimeout:
+            self.stop()
+        return self.summary
+
+    def _summarize(self, stats: pstats.Stats, elapsed: float, dump_file: Path) -> str:
+        """按累计耗时取前N个函数"""
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        lines = [f"🔬 剖析完成（{elapsed:.1f}秒），文件: {dump_file.name}", "累计s | 自身s | 调用次数 | 函数"]
+        for (filename, lineno, name), (_, ncalls, tottime, cumtime, _) in rows[:self.top]:
+            where = f"{os.path.basename(filename)}:{lineno}" if lineno else filename
+            lines.append(f"{cumtime:.3f} | {tottime:.3f} | {ncalls} | {name} ({where})")
+        return "\n".join(lines)
+
+# 进程级单例，所有组群共享
+profiler = Profiler()
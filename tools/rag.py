@@ -0,0 +1,351 @@
+import asyncio
+from contextlib import nullcontext
+from abc import ABC, abstractmethod
+from pathlib import Path
+from asyncio import to_thread, gather
+from dataclasses import dataclass, field
+from typing import Any, AsyncContextManager, Callable, Dict, Iterator, List, Optional, Tuple
+
+from astrbot.api import logger
+
+from .lexical import LexicalIndex
+from .dedup import Deduplicator
+from .eviction import UsageTable
+
+@dataclass
+class QuerySolution:
+    '''单个问题的检索结果，与HippoRAG的返回结构保持一致（docs/doc_scores）'''
+    question: str
+    docs: List[str] = field(default_factory=list)
+    doc_scores: List[float] = field(default_factory=list)
+
+def _fuse(rankings: List[List[str]], num: int) -> Tuple[List[str], List[float]]:
+    """倒数排名融合（RRF）：不同来源的得分不可比，只按名次合并"""
+    fused : Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused[doc] = fused.get(doc, 0.0) + 1 / (60 + rank)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:num]
+    return [d for d, _ in ranked], [s for _, s in ranked]
+
+class RAGBackend(ABC):
+    '''
+    RAG后端接口
+
+    hipporag_lite.HippoRAG 天然满足此接口（无需继承）；自定义后端继承此类并实现全部抽象方法即可接入 RAGStore。
+    index在全部文档已存在时、delete在全部文档不存在时应抛出ValueError（命令层据此给出提示）。
+    '''
+    @abstractmethod
+    async def index(self, contents: List[str]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def retrieve(self, queries: List[str], num: int) -> List[QuerySolution]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, contents: List[str]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        """遍历 (原文, hash_id)"""
+        raise NotImplementedError
+
+    async def nearest(self, texts: List[str]) -> Optional[List[float]]:
+        """可选：每条文本与库中最相近文档的余弦相似度，用于语义去重；不支持时返回None"""
+        return None
+
+    async def embed(self, texts: List[str]) -> Optional[Any]:
+        """可选：只计算嵌入而不写入，返回与texts逐行对应的向量（矩阵或列表），交给add_vectors；不支持时返回None（嵌入在index内完成）"""
+        return None
+
+    async def add_vectors(self, texts: List[str], vectors: Any) -> int:
+        """可选：写入embed算出的向量，已存在的文本跳过，返回新增条数；实现了embed的后端须一并实现"""
+        raise NotImplementedError
+
+class RAGStore:
+    '''
+    RAG存储，ChatConfig.hipporag 即为此类实例
+
+    在后端（默认HippoRAG）之前维护一个本地BM25词法索引（与rag_file同级的 *.lexical.json）：
+    index/delete/clear 同步更新两侧，词法索引随save落盘（加载时与后端原文核对，补齐未落盘的增删）；检索时若词法结果明显胜出（查询词覆盖率高且领先第二名足够多），
+    该问题直接返回而不再请求远程嵌入，否则与后端的结果按倒数排名融合。
+    '''
+    def __init__(self, backend: RAGBackend, save_dir: str, conf: Optional[Dict] = None):
+        conf = conf or {}
+        self.backend = backend
+        self.save_dir = save_dir
+        self.use_lexical : bool = conf.get("lexical", True)
+        self.coverage : float = conf.get("lexical_coverage", 0.6) # 短路所需的最低查询词覆盖率
+        self.margin : float = conf.get("lexical_margin", 1.5) # 短路所需的第一名/第二名得分比
+
+        self.lexical = LexicalIndex(Path(f"{save_dir}.lexical.json"))
+        self._lexical_ready = False
+        self.dedup = Deduplicator() # 指纹只在内存中维护，首次去重时从后端原文构建
+        self._dedup_ready = False
+        self.usage = UsageTable(Path(f"{save_dir}.usage.json"))
+        self._usage_ready = False
+        self.stats : Dict[str, int] = {"queries": 0, "short_circuit": 0, "dedup_skipped": 0, "evicted": 0}
+        self.shared : Optional["RAGStore"] = None # 公共知识库，检索时与本库结果合并；增删只作用于本库
+        self.write_lock = asyncio.Lock() # 串行化对后端的改写（增删、清空、保存、导入归档），HippoRAG不支持并发写入
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        """遍历 (原文, hash_id)"""
+        try:
+            return iter(list(self.backend))
+        except AttributeError: # 新建的HippoRAG在首次写入前没有text_to_hash_id，视为空库
+            return iter([])
+
+    def _texts(self) -> List[str]:
+        return [text for text, _ in self]
+
+    # 词法索引维护
+    def _load_lexical(self):
+        """读取词法索引；文件不存在时（旧版数据）从后端中的原文重建，上次保存后的增删（如进程崩溃前）按后端补齐"""
+        texts = self._texts()
+        if not self.lexical.load():
+            self.lexical.clear()
+            self.lexical.add(texts)
+            self.lexical.save()
+            logger.info(f"已为 {self.save_dir} 重建词法索引，共 {len(self.lexical)} 条")
+            return
+        current = set(texts)
+        self.lexical.remove([text for text in list(self.lexical.ids) if text not in current])
+        self.lexical.add(texts)
+        if self.lexical.dirty:
+            self.lexical.save()
+            logger.info(f"{self.save_dir} 的词法索引与后端不一致，已补齐")
+
+    async def _ensure_lexical(self):
+        if self.use_lexical and not self._lexical_ready:
+            await to_thread(self._load_lexical)
+            self._lexical_ready = True
+
+    async def _persist_lexical(self):
+        if self.use_lexical and self.lexical.dirty:
+            await to_thread(self.lexical.save)
+
+    # 使用记录与容量淘汰
+    async def _ensure_usage(self):
+        if not self._usage_ready:
+            await to_thread(lambda: self.usage.load(self._texts()))
+            self._usage_ready = True
+
+    async def rebuild(self, usage: Optional[Dict[str, List[float]]] = None):
+        """后端被整体改写（如导入归档）后，重建词法索引与使用记录，去重指纹在下次使用时重建"""
+        def work():
+            texts = self._texts()
+            if self.use_lexical:
+                self.lexical.clear()
+                self.lexical.add(texts)
+                self.lexical.save()
+            self.usage.load(texts)
+            self.usage.restore(usage or {})
+            self.usage.save()
+        await to_thread(work)
+        self._lexical_ready = self._usage_ready = True
+        self.dedup.clear()
+        self._dedup_ready = False
+
+    async def count(self) -> int:
+        """文档数"""
+        await self._ensure_usage()
+        return len(self.usage)
+
+    def size(self) -> Optional[Tuple[int, int]]:
+        """(文档数, 字节数)，使用记录尚未加载时为None"""
+        return (len(self.usage), self.usage.total_bytes) if self._usage_ready else None
+
+    async def evict(self, max_docs: int, max_bytes: int, policy: str = "lru") -> int:
+        '''
+        超出容量上限时按策略删除文档，返回删除条数
+
+        Args:
+            max_docs / max_bytes: 文档数与原文字节数上限，0为不限
+            policy: age / lru / lfu，见 UsageTable.victims
+        '''
+        if not (max_docs or max_bytes):
+            return 0
+        await self._ensure_usage()
+        victims = self.usage.victims(max_docs, max_bytes, policy)
+        if not victims:
+            return 0
+        try:
+            await self.delete(victims)
+        except ValueError: # 使用记录与后端不一致，以后端为准
+            self.usage.remove(victims)
+        self.stats["evicted"] += len(victims)
+        await to_thread(self.usage.save)
+        logger.info(f"{self.save_dir} 超出容量上限，按{policy}策略淘汰 {len(victims)} 条文档")
+        return len(victims)
+
+    # 近重复过滤
+    async def _ensure_dedup(self):
+        if not self._dedup_ready:
+            await to_thread(lambda: self.dedup.add(self._texts()))
+            self._dedup_ready = True
+
+    async def novel(self, contents: List[str], threshold: float = 0.8, min_similarity: float = 0.0) -> List[str]:
+        '''
+        过滤与库中已有文本（及同批次文本）近重复的内容，被跳过的条数计入stats["dedup_skipped"]
+
+        Args:
+            threshold: MinHash估计的Jaccard相似度阈值，不小于1时只过滤规范化后完全相同的文本
+            min_similarity: 嵌入余弦相似度阈值，大于0且后端支持nearest时额外做一次语义去重（需一次嵌入请求）
+        '''
+        await self._ensure_dedup()
+        batch = Deduplicator()
+        kept = []
+        for text in contents:
+            if text and not self.dedup.is_duplicate(text, threshold) and not batch.is_duplicate(text, threshold):
+                batch.add([text])
+                kept.append(text)
+
+        nearest = getattr(self.backend, "nearest", None) # HippoRAG未实现此可选接口
+        if min_similarity > 0 and kept and nearest is not None:
+            if (scores := await nearest(kept)) is not None:
+                kept = [text for text, score in zip(kept, scores) if score < min_similarity]
+
+        skipped = len(contents) - len(kept)
+        if skipped:
+            self.stats["dedup_skipped"] += skipped
+            logger.debug(f"{self.save_dir} 跳过 {skipped} 条近重复文本")
+        return kept
+
+    # 与HippoRAG一致的接口
+    async def index(self, contents: List[str]):
+        await self._ensure_lexical()
+        async with self.write_lock:
+            await self._index(contents)
+
+    async def index_missing(self, contents: List[str], slot: Callable[[], AsyncContextManager] = nullcontext) -> int:
+        '''
+        只写入库中尚不存在的文档，返回实际写入的条数
+
+        与index不同，部分文档已存在时不会整批失败（HippoRAG只要有一条已存在就拒绝整批），供批量导入续传使用。
+        后端支持embed时嵌入在写入锁之外进行，多批可同时请求嵌入，只有写入本身串行；
+        否则（HippoRAG的嵌入与抽取都在index内）整批在锁内依次完成。
+        slot为每次上游请求占用的名额（如调度器的embed通道），等待写入锁期间不占用。
+        '''
+        await self._ensure_lexical()
+        await self._ensure_usage() # 使用记录与后端文档一一对应，据此判断是否已存在
+        fresh = self._missing(contents)
+        embed = getattr(self.backend, "embed", None) # HippoRAG未实现此可选接口
+        vectors = None
+        if fresh and embed is not None:
+            async with slot():
+                vectors = await embed(fresh)
+        async with self.write_lock:
+            if vectors is not None: # 嵌入期间可能已有其他批次写入了相同的文档
+                if len(keep := [i for i, text in enumerate(fresh) if text not in self.usage]) < len(fresh):
+                    fresh, vectors = [fresh[i] for i in keep], [vectors[i] for i in keep]
+                if fresh:
+                    await self._index(fresh, vectors)
+            elif fresh := self._missing(contents):
+                async with slot():
+                    await self._index(fresh)
+        return len(fresh)
+
+    def _missing(self, contents: List[str]) -> List[str]:
+        return [text for text in dict.fromkeys(contents) if text and text not in self.usage]
+
+    async def _index(self, contents: List[str], vectors: Optional[Any] = None):
+        if vectors is None:
+            await self.backend.index(contents)
+        else:
+            await self.backend.add_vectors(contents, vectors)
+        if self._dedup_ready:
+            self.dedup.add(contents)
+        if self._usage_ready:
+            self.usage.add(contents)
+        if self.use_lexical: # 落盘推迟到save，每次写入不再整体重写词法索引文件
+            await to_thread(self.lexical.add, contents)
+
+    async def delete(self, contents: List[str]):
+        await self._ensure_lexical()
+        async with self.write_lock:
+            await self.backend.delete(contents)
+            self.dedup.remove(contents)
+            self.usage.remove(contents)
+            if self.use_lexical:
+                await to_thread(self.lexical.remove, contents)
+
+    async def clear(self):
+        async with self.write_lock:
+            await self.backend.clear()
+            self.dedup.clear()
+            self._dedup_ready = True
+            self.usage.clear()
+            self._usage_ready = True
+            await to_thread(self.usage.save)
+            self.lexical.clear()
+            self._lexical_ready = True
+            await self._persist_lexical()
+
+    async def save(self):
+        async with self.write_lock:
+            await self.backend.save()
+            await self._persist_lexical()
+            if self._usage_ready:
+                await to_thread(self.usage.save)
+
+    def _lexical_wins(self, hits: List[Tuple[str, float, float]]) -> bool:
+        """词法结果是否明显胜出"""
+        if not hits or hits[0][2] < self.coverage:
+            return False
+        return len(hits) == 1 or hits[0][1] >= self.margin * hits[1][1]
+
+    async def retrieve(self, queries: List[str], num: int = 2) -> List[QuerySolution]:
+        '''
+        混合检索，命中的文档计入使用记录；设置了公共知识库时并发查询两者并按名次合并
+
+        Args:
+            queries: 问题列表
+            num: 每个问题返回的文档数
+        '''
+        shared = self.shared if self.shared is not None and self.shared is not self else None
+        if shared is None or not await shared.count():
+            return await self._retrieve_own(queries, num)
+        own, common = await gather(self._retrieve_own(queries, num), shared._retrieve_own(queries, num))
+        return [QuerySolution(q, *_fuse([a.docs, b.docs], num)) for q, a, b in zip(queries, own, common)]
+
+    async def _retrieve_own(self, queries: List[str], num: int) -> List[QuerySolution]:
+        if not await self.count():
+            return [QuerySolution(q) for q in queries]
+        results = await self._retrieve(queries, num)
+        for solution in results:
+            self.usage.touch(solution.docs)
+        return results
+
+    async def _retrieve(self, queries: List[str], num: int) -> List[QuerySolution]:
+        if not self.use_lexical:
+            return await self.backend.retrieve(queries, num)
+
+        await self._ensure_lexical()
+        lexical_hits = await to_thread(lambda: {q: self.lexical.search(q, max(num * 2, 4)) for q in queries}) # BM25检索随库增大，不占用事件循环
+        remote = [q for q in queries if not self._lexical_wins(lexical_hits[q])]
+        self.stats["queries"] += len(queries)
+        self.stats["short_circuit"] += len(queries) - len(remote)
+
+        remote_docs : Dict[str, List[str]] = {}
+        if remote:
+            for q, solution in zip(remote, await self.backend.retrieve(remote, num)):
+                remote_docs[q] = list(solution.docs)
+
+        results = []
+        for q in queries:
+            hits = lexical_hits[q]
+            if q not in remote_docs:
+                results.append(QuerySolution(q, [h[0] for h in hits[:num]], [h[1] for h in hits[:num]]))
+                continue
+            results.append(QuerySolution(q, *_fuse([remote_docs[q], [h[0] for h in hits]], num)))
+        return results
@@ -0,0 +1,204 @@
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from asyncio import Future, get_running_loop, CancelledError
+from typing import Deque, Dict, List, Optional
+
+from .config import SCHEDULER
+
+LANES = ("admin", "priority", "normal", "background") # 通道优先级由高到低
+KINDS = ("main", "func", "embed") # 主对话、function calling、嵌入/RAG流量
+
+class _Waiter:
+    __slots__ = ("kind", "group", "future", "since")
+
+    def __init__(self, kind: str, group: str, future: Future):
+        self.kind = kind
+        self.group = group
+        self.future = future
+        self.since = time.monotonic()
+
+class FairScheduler:
+    '''
+    进程级上游API调度器
+
+    全局并发上限之下，再按流量种类（main/func/embed）分别设置并发预算；
+    排队请求先按通道优先级出队，同一通道内按组群轮转（round-robin），
+    使繁忙组群无法挤占安静组群的名额。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = SCHEDULER if conf is None else conf
+        self.enable : bool = conf.get("enable", True)
+        self.capacity : int = max(1, conf.get("max_concurrency", 8))
+        self.budgets : Dict[str, int] = {k: max(1, conf.get(k, self.capacity)) for k in KINDS}
+        self.priority_groups = set(str(g) for g in conf.get("priority_groups", []))
+
+        self.running = 0
+        self.running_kind : Dict[str, int] = {k: 0 for k in KINDS}
+        # lane -> group -> 等待队列；lane -> 轮转顺序
+        self.queues : Dict[str, Dict[str, Deque[_Waiter]]] = {lane: {} for lane in LANES}
+        self.rotation : Dict[str, Deque[str]] = {lane: deque() for lane in LANES}
+
+        # 排队耗时指标，仅保留最近的样本
+        self.waits : Dict[str, Deque[float]] = {k: deque(maxlen=1024) for k in KINDS}
+        self.granted : Dict[str, int] = {k: 0 for k in KINDS}
+        self.max_wait : Dict[str, float] = {k: 0.0 for k in KINDS}
+
+    def lane_of(self, group: str, superuser: bool = False) -> str:
+        """依据身份和组群确定通道"""
+        if superuser:
+            return "admin"
+        if group in self.priority_groups:
+            return "priority"
+        return "normal"
+
+    def _free(self, kind: str) -> bool:
+        return self.running < self.capacity and self.running_kind[kind] < self.budgets[kind]
+
+    def _grant(self, waiter: _Waiter):
+        self.running += 1
+        self.running_kind[waiter.kind] += 1
+        wait = time.monotonic() - waiter.since
+        self.waits[waiter.kind].append(wait)
+        self.granted[waiter.kind] += 1
+        self.max_wait[waiter.kind] = max(self.max_wait[waiter.kind], wait)
+        waiter.future.set_result(None)
+
+    def _pop_from_group(self, lane: str, group: str) -> Optional[_Waiter]:
+        """取出该组群队列中第一个可被放行的请求"""
+        queue = self.queues[lane][group]
+        for waiter in queue:
+            if waiter.future.done():
+                continue
+            if self._free(waiter.kind):
+                queue.remove(waiter)
+                return waiter
+        return None
+
+    def _dispatch(self):
+        """在有空余名额时按通道优先级与组群轮转放行排队请求"""
+        while self.running < self.capacity:
+            waiter = None
+            for lane in LANES:
+                rotation = self.rotation[lane]
+                for _ in range(len(rotation)):
+                    if not rotation:
+                        break
+                    group = rotation[0]
+                    rotation.rotate(-1) # 本组群移至队尾
+                    waiter = self._pop_from_group(lane, group)
+                    self._drop_empty(lane, group)
+                    if waiter:
+                        break
+                if waiter:
+                    break
+            if waiter is None:
+                return
+            self._grant(waiter)
+
+    def _drop_empty(self, lane: str, group: str):
+        queue = self.queues[lane].get(group)
+        if queue is None:
+            return
+        while queue and queue[0].future.done():
+            queue.popleft()
+        if not queue:
+            del self.queues[lane][group]
+            self.rotation[lane].remove(group)
+
+    async def acquire(self, kind: str, group: str, lane: str = "normal"):
+        """取得一个上游调用名额"""
+        if not self._has_waiters() and self._free(kind):
+            self.running += 1
+            self.running_kind[kind] += 1
+            self.waits[kind].append(0.0)
+            self.granted[kind] += 1
+            return
+
+        waiter = _Waiter(kind, group, get_running_loop().create_future())
+        if group not in self.queues[lane]:
+            self.queues[lane][group] = deque()
+            self.rotation[lane].append(group)
+        self.queues[lane][group].append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(kind) # 已被放行但调用方放弃，归还名额
+            else:
+                queue = self.queues[lane].get(group)
+                if queue is not None and waiter in queue:
+                    queue.remove(waiter)
+                self._drop_empty(lane, group)
+            raise
+
+    def release(self, kind: str):
+        """归还名额并唤醒后续请求"""
+        self.running -= 1
+        self.running_kind[kind] -= 1
+        self._dispatch()
+
+    def _has_waiters(self) -> bool:
+        return any(self.rotation[lane] for lane in LANES)
+
+    @asynccontextmanager
+    async def slot(self, kind: str, group: str, lane: str = "normal"):
+        '''
+        上游调用名额的上下文管理器
+
+        Args:
+            kind: 流量种类，main/func/embed
+            group: 发起请求的组群名称
+            lane: 通道，admin/priority/normal/background
+        '''
+        if not self.enable:
+            yield
+            return
+        await self.acquire(kind, group, lane)
+        try:
+            yield
+        finally:
+            self.release(kind)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """导出排队耗时等指标（单位秒）"""
+        def pct(samples: List[float], q: float) -> float:
+            if not samples:
+                return 0.0
+            ordered = sorted(samples)
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        queued = {k: 0 for k in KINDS}
+        for lane in LANES:
+            for queue in self.queues[lane].values():
+                for waiter in queue:
+                    if not waiter.future.done():
+                        queued[waiter.kind] += 1
+
+        return {
+            kind: {
+                "running": self.running_kind[kind],
+                "budget": self.budgets[kind],
+                "queued": queued[kind],
+                "granted": self.granted[kind],
+                "wait_p50": pct(list(self.waits[kind]), 0.50),
+                "wait_p95": pct(list(self.waits[kind]), 0.95),
+                "wait_max": self.max_wait[kind],
+            }
+            for kind in KINDS
+        }
+
+    def stats_text(self) -> str:
+        """格式化指标，供管理员命令使用"""
+        lines = [f"📊 上游调度状态（全局 {self.running}/{self.capacity}）"]
+        for kind, s in self.stats().items():
+            lines.append(
+                f"{kind}: 运行 {s['running']}/{s['budget']}, 排队 {s['queued']}, 累计 {s['granted']}, "
+                f"等待 p50 {s['wait_p50']:.2f}s / p95 {s['wait_p95']:.2f}s / max {s['wait_max']:.2f}s"
+            )
+        return "\n".join(lines)
+
+# 进程级单例，所有组群共享
+scheduler = FairScheduler()
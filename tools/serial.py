@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+try:
+    import orjson
+except ImportError: # orjson为可选依赖，缺失时回退到标准库
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+def dumps(obj: Any, pretty: bool = False, sort_keys: bool = False, default: Optional[Callable] = None) -> bytes:
+    """序列化为UTF-8字节；默认紧凑输出，pretty为两格缩进（仅供人工查看的文件使用）"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty: option |= orjson.OPT_INDENT_2
+        if sort_keys: option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(
+        obj, ensure_ascii=False, sort_keys=sort_keys, default=default,
+        indent=2 if pretty else None, separators=None if pretty else (",", ":"),
+    ).encode("utf-8")
+
+def dumps_str(obj: Any, pretty: bool = False, sort_keys: bool = False, default: Optional[Callable] = None) -> str:
+    return dumps(obj, pretty, sort_keys, default).decode("utf-8")
+
+def loads(data: Union[bytes, str]) -> Any:
+    """反序列化；两种实现的解析错误都是json.JSONDecodeError的子类"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def load_file(path: Path) -> Any:
+    return loads(Path(path).read_bytes())
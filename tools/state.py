@@ -0,0 +1,254 @@
+import os
+import time
+import asyncio
+import sqlite3
+import socket
+import zlib
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from astrbot.api import logger
+
+from . import serial
+
+def atomic_write_json(path: Path, data: Any, pretty: bool = False):
+    """先写同目录下的临时文件并fsync，再原子替换目标文件；中途崩溃只会留下临时文件，原文件保持完整。默认紧凑输出"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp") # 按线程区分，并发写同一文件时互不覆盖临时文件
+    try:
+        with open(tmp, "wb") as f:
+            f.write(serial.dumps(data, pretty))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+class StateBackend(ABC):
+    '''
+    组群状态存储接口
+
+    以数据文件路径为键保存JSON可序列化的对象（组群配置与记忆、白名单、冷却/撤回计数），
+    并提供带过期时间的租约，供多个AstrBot进程按群划分负载。
+    '''
+    @abstractmethod
+    def load(self, path: Path, default: Any) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, data: Any, path: Path):
+        raise NotImplementedError
+
+    @abstractmethod
+    def exists(self, path: Path) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """获取或续约租约：无人持有、已过期或本就由owner持有时成功"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release(self, name: str, owner: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def alive(self, name: str) -> bool:
+        """租约是否仍被某个进程持有（未过期）"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class FileState(StateBackend):
+    '''本地JSON文件（默认，与旧版布局完全一致）；租约只在进程内有效，适用于单进程部署'''
+    def __init__(self, pretty: bool = True):
+        self.pretty = pretty # 组群配置与白名单由管理员手工查看/修改，默认缩进输出
+        self.leases : Dict[str, tuple] = {} # 名称 -> (持有者, 过期时间)
+
+    def load(self, path: Path, default: Any) -> Any:
+        try:
+            if path.exists():
+                return serial.load_file(path)
+            self.save(default, path)
+        except Exception as e:
+            logger.error(f"加载 {path} 失败: {e}")
+        return default
+
+    def save(self, data: Any, path: Path):
+        atomic_write_json(path, data, self.pretty)
+
+    def exists(self, path: Path) -> bool:
+        return path.exists()
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        holder = self.leases.get(name)
+        if holder and holder[0] != owner and holder[1] > now:
+            return False
+        self.leases[name] = (owner, now + ttl)
+        return True
+
+    def release(self, name: str, owner: str):
+        if self.leases.get(name, (None,))[0] == owner:
+            del self.leases[name]
+
+    def alive(self, name: str) -> bool:
+        holder = self.leases.get(name)
+        return bool(holder) and holder[1] > time.time()
+
+class SQLiteState(StateBackend):
+    '''
+    SQLite状态库，放在共享卷上即可被多个进程共用
+
+    键为数据文件相对root（数据目录）的路径，各进程的挂载位置不同也能对应到同一条记录。
+    WAL模式下读写互不阻塞；租约的判定与更新在一条语句内完成，不会被两个进程同时拿到。
+    '''
+    def __init__(self, file: Path, root: Path):
+        self.file = file
+        self.root = root
+        file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock() # 同一连接跨线程使用时串行化
+        self.db = sqlite3.connect(str(file), timeout=10, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _key(self, path: Path) -> str:
+        try:
+            return Path(path).resolve().relative_to(self.root.resolve()).as_posix()
+        except ValueError:
+            return Path(path).resolve().as_posix()
+
+    def load(self, path: Path, default: Any) -> Any:
+        with self._lock:
+            row = self.db.execute("SELECT value FROM kv WHERE key = ?", (self._key(path),)).fetchone()
+        if row is not None:
+            return serial.loads(row[0])
+        if path.exists(): # 首次启用时从旧的JSON文件迁移
+            default = serial.load_file(path)
+            logger.info(f"已将 {path} 迁移至状态库")
+        self.save(default, path)
+        return default
+
+    def save(self, data: Any, path: Path):
+        value = serial.dumps_str(data)
+        with self._lock:
+            self.db.execute(
+                "INSERT INTO kv (key, value, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = excluded.updated",
+                (self._key(path), value, time.time()),
+            )
+
+    def exists(self, path: Path) -> bool:
+        with self._lock:
+            row = self.db.execute("SELECT 1 FROM kv WHERE key = ?", (self._key(path),)).fetchone()
+        return row is not None or path.exists()
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self.db.execute(
+                "INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE leases.owner = excluded.owner OR leases.expires <= ?",
+                (name, owner, now + ttl, now),
+            )
+        return cursor.rowcount > 0
+
+    def release(self, name: str, owner: str):
+        with self._lock:
+            self.db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def alive(self, name: str) -> bool:
+        with self._lock:
+            row = self.db.execute("SELECT expires FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] > time.time()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+class StateIO:
+    '''
+    状态读写的异步外壳
+
+    所有读写在专用线程池中执行，不占用事件循环，也不与to_thread的默认线程池争抢；
+    同一文件的保存串行执行，排队期间的多次保存合并为一次，只写入最新的内容；
+    写入在独立的任务中进行，调用方被取消（如关闭插件时）时已提交的保存照常完成。
+    '''
+    def __init__(self, backend: StateBackend, workers: int = 2):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="huaer-io")
+        self._queued : Dict[str, List[Any]] = {} # 文件 -> [最新内容, 共用的结果Future]，尚未开始写入
+        self._locks : Dict[str, asyncio.Lock] = {}
+        self._writing : Set[asyncio.Task] = set() # 进行中的写入任务（持有强引用）
+        self.coalesced = 0 # 被合并掉的保存次数
+
+    async def call(self, func: Callable, *args: Any) -> Any:
+        """在I/O线程池中执行任意阻塞操作（如遍历目录、读取人格文件）"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def load(self, path: Path, default: Any) -> Any:
+        return await self.call(self.backend.load, path, default)
+
+    async def exists(self, path: Path) -> bool:
+        return await self.call(self.backend.exists, path)
+
+    async def save(self, data: Any, path: Path):
+        key = str(path)
+        if (entry := self._queued.get(key)) is not None: # 已有排队中的写入，替换为最新内容并等待其结果
+            entry[0] = data
+            self.coalesced += 1
+        else:
+            entry = self._queued[key] = [data, asyncio.get_running_loop().create_future()]
+            task = asyncio.create_task(self._write(key, entry, path))
+            self._writing.add(task)
+            task.add_done_callback(self._writing.discard)
+        await asyncio.shield(entry[1])
+
+    async def _write(self, key: str, entry: List[Any], path: Path):
+        """执行一次写入；与发起保存的调用方相互独立，调用方被取消不会中断写入，也不会让合并到此的保存一直等待"""
+        try:
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                if self._queued.get(key) is entry: # 此后到达的保存排入下一次写入
+                    del self._queued[key]
+                await self.call(self.backend.save, entry[0], path)
+        except BaseException as e:
+            if self._queued.get(key) is entry:
+                del self._queued[key]
+            if isinstance(e, asyncio.CancelledError): # 事件循环关闭时
+                entry[1].cancel()
+                raise
+            entry[1].set_exception(e)
+            entry[1].exception() # 由等待的调用方抛出，避免无人等待时的告警
+        else:
+            entry[1].set_result(None)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+def create_state(conf: Dict, data_dir: Path) -> StateBackend:
+    """按 [state] backend 创建状态存储，SQLite不可用时回退到本地文件"""
+    if conf.get("backend", "file") == "sqlite":
+        file = Path(conf.get("file") or data_dir / "state.sqlite3")
+        if not file.is_absolute():
+            file = data_dir / file
+        try:
+            return SQLiteState(file, data_dir)
+        except sqlite3.Error as e:
+            logger.error(f"状态库 {file} 不可用，回退到本地文件: {e}")
+    return FileState(conf.get("pretty", True))
+
+def shard_of(group_id: str, workers: int) -> int:
+    """组群按crc32哈希划分到的进程序号（跨进程、跨重启稳定）"""
+    return zlib.crc32(group_id.encode("utf-8")) % max(1, workers)
+
+def worker_identity() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
@@ -0,0 +1,88 @@
+import time
+import asyncio
+from typing import Any, Coroutine, Dict, List, Optional, Set
+
+from astrbot.api import logger
+
+from .config import TASKS
+from .log import slog
+from .deadline import deadline
+
+class TaskRegistry:
+    '''
+    后台任务登记处
+
+    持有所有后台任务的强引用（避免被垃圾回收中途销毁），以max_concurrency限制同时运行的数量，
+    记录失败；关闭时在期限内等待剩余任务完成，超时的任务被取消并记录。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = TASKS if conf is None else conf
+        self.max_concurrency : int = conf.get("max_concurrency", 8)
+        self.drain_timeout : float = conf.get("drain_timeout", 10.0)
+        self.tasks : Set[asyncio.Task] = set()
+        self.stats = {"spawned": 0, "failed": 0, "dropped": 0}
+        self._sem : Optional[asyncio.Semaphore] = None # 首次使用时在当前事件循环中创建
+        self._closing = False
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def stats_text(self) -> str:
+        return (f"后台任务: 进行中 {len(self.tasks)}（上限{self.max_concurrency}），累计 {self.stats['spawned']}，"
+                f"失败 {self.stats['failed']}，丢弃 {self.stats['dropped']}")
+
+    async def _run(self, coro: Coroutine):
+        deadline.clear() # 任务复制了发起者的上下文，但后台工作不受对话期限约束
+        try:
+            async with self._sem:
+                return await coro
+        finally:
+            coro.close() # 排队期间被取消时协程尚未开始，关闭以免告警；已结束的协程不受影响
+
+    def _done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if task.cancelled():
+            return
+        if (e := task.exception()) is not None:
+            self.stats["failed"] += 1
+            logger.error(f"后台任务 {task.get_name()} 失败: {e!r}")
+            slog.event("task_failed", task=task.get_name(), error=repr(e))
+
+    def spawn(self, coro: Coroutine, name: str) -> Optional[asyncio.Task]:
+        """登记并启动一个后台任务；正在关闭时不再接受新任务"""
+        if self._closing:
+            coro.close()
+            logger.warning(f"插件正在关闭，已丢弃后台任务 {name}")
+            self.stats["dropped"] += 1
+            return None
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(max(1, self.max_concurrency))
+        task = asyncio.create_task(self._run(coro), name=name)
+        self.tasks.add(task)
+        self.stats["spawned"] += 1
+        task.add_done_callback(self._done)
+        return task
+
+    async def drain(self, timeout: Optional[float] = None) -> List[str]:
+        """等待剩余任务至多timeout秒，随后取消未完成的任务，返回被取消的任务名"""
+        self._closing = True
+        timeout = self.drain_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        pending = set(self.tasks)
+        if pending:
+            logger.info(f"等待 {len(pending)} 个后台任务完成（至多{timeout}秒）")
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        dropped = sorted(task.get_name() for task in pending)
+        for task in pending:
+            task.cancel()
+        if pending: # 等待取消生效，之后再保存索引
+            await asyncio.wait(pending, timeout=1.0)
+            self.stats["dropped"] += len(pending)
+            logger.warning(f"关闭期限已到，取消了 {len(dropped)} 个后台任务: {', '.join(dropped)}")
+            slog.event("tasks_dropped", count=len(dropped), tasks=dropped)
+        logger.info(f"后台任务排空用时 {time.perf_counter() - start:.2f}s")
+        self._sem = None
+        self._closing = False
+        return dropped
+
+tasks = TaskRegistry()
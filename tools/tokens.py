@@ -0,0 +1,91 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import CONTEXT
+
+_CJK = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+_ASCII_WORD = re.compile(r"[A-Za-z0-9]+")
+_TIMESTAMP = re.compile(r"^时间\[[^\]]*\] ")
+
+MESSAGE_OVERHEAD = 4 # 每条消息的角色与分隔符开销
+
+def estimate_tokens(text: str) -> int:
+    """粗略的token估计：中文按字计，英文单词约4/3个token，无需分词器"""
+    return len(_CJK.findall(text)) + (len(_ASCII_WORD.findall(text)) * 4 + 2) // 3
+
+def message_tokens(mess: List[dict]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in mess)
+
+class ContextBudget:
+    '''
+    按模型上下文窗口裁剪请求
+
+    本地估算prompt大小，超出 窗口×safety_margin−max_tokens 时依次：
+    丢弃最早的历史消息（保留本轮的全部发言）→ 截短工具资料 → 去掉历史消息中的时间戳。
+    只裁剪本次请求的副本，不改动记忆体。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = CONTEXT if conf is None else conf
+        self.enable : bool = conf.get("enable", True)
+        self.default_window : int = conf.get("default_window", 32768)
+        self.margin : float = conf.get("safety_margin", 0.9)
+        self.windows : Dict[str, int] = conf.get("windows", {})
+
+    def limit(self, model: str, max_tokens: int) -> int:
+        """可用于prompt的token数（已为回复预留max_tokens）"""
+        return int(self.windows.get(model, self.default_window) * self.margin) - max_tokens
+
+    def fit(self, head: List[dict], tool: Optional[dict], history: List[dict], limit: int, current: int = 1) -> Tuple[List[dict], Dict[str, Any]]:
+        '''
+        组装 head + tool + history 并裁剪到limit以内
+
+        Args:
+            head: 人格、摘要等固定的系统消息，不裁剪
+            tool: 工具资料（搜索结果、RAG记录）系统消息，可为None
+            history: 对话记录，最后current条为本轮发言
+            current: 本轮发言条数（合并回复时为同批的发言数），这些消息不会被丢弃
+        Returns:
+            (消息列表, 报告)；报告含 tokens（裁剪前）、final、limit、dropped（丢弃的历史条数）、
+            tool_cut（工具资料截掉的token数）、untimed（去掉时间戳的条数）
+        '''
+        history = list(history)
+        fixed = message_tokens(head)
+        sizes = [message_tokens([m]) for m in history]
+        tool_size = message_tokens([tool]) if tool else 0
+        total = fixed + tool_size + sum(sizes)
+        report = {"tokens": total, "final": total, "limit": limit, "dropped": 0, "tool_cut": 0, "untimed": 0}
+        if not self.enable or total <= limit:
+            return head + ([tool] if tool else []) + history, report
+
+        # 1. 丢弃最早的历史消息，本轮发言始终保留
+        while total > limit and len(history) > max(1, current):
+            history.pop(0)
+            total -= sizes.pop(0)
+            report["dropped"] += 1
+
+        # 2. 按超出比例截短工具资料，仍放不下则整条去掉
+        if total > limit and tool:
+            content = tool["content"]
+            body = tool_size - MESSAGE_OVERHEAD
+            keep = max(0, body - (total - limit))
+            if keep <= 0:
+                tool, cut = None, tool_size
+            else:
+                tool = {**tool, "content": content[:len(content) * keep // max(1, body)] + "…"}
+                cut = tool_size - message_tokens([tool])
+            total -= cut
+            report["tool_cut"] = cut
+
+        # 3. 去掉时间戳
+        if total > limit:
+            for i, msg in enumerate(history):
+                stripped = _TIMESTAMP.sub("", msg.get("content") or "")
+                if stripped != msg.get("content"):
+                    history[i] = {**msg, "content": stripped}
+                    total -= sizes[i] - message_tokens([history[i]])
+                    report["untimed"] += 1
+
+        report["final"] = total
+        return head + ([tool] if tool else []) + history, report
+
+budget = ContextBudget()
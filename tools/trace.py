@@ -0,0 +1,160 @@
+import os
+import time
+import logging
+import functools
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from astrbot.api import logger
+
+from .config import TRACE
+from .log import sinks, slog, rotating_handler
+
+class Span:
+    '''一段计时区间，trace_id在整条调用链（含后台任务）中保持不变'''
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attrs", "start", "wall", "status")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.wall = time.time()
+        self.status = "ok"
+
+    def set(self, **attrs: Any):
+        """追加属性"""
+        self.attrs.update(attrs)
+
+    def to_native(self, duration: float) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.wall,
+            "duration_ms": round(duration * 1000, 3),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+    def to_otel(self, duration: float) -> Dict[str, Any]:
+        """OpenTelemetry(OTLP/JSON)风格的span"""
+        start_ns = int(self.wall * 1e9)
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": start_ns,
+            "endTimeUnixNano": start_ns + int(duration * 1e9),
+            "attributes": [{"key": k, "value": {"stringValue": str(v)}} for k, v in self.attrs.items()],
+            "status": {"code": 1 if self.status == "ok" else 2, "message": "" if self.status == "ok" else self.status},
+        }
+
+class TraceFormatter(logging.Formatter):
+    '''在原有格式化结果前加上 [trace:xxxxxxxx]，记录本身不被改写'''
+    def __init__(self, inner: Optional[logging.Formatter] = None):
+        super().__init__()
+        self.inner = inner or logging.Formatter()
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = self.inner.format(record)
+        trace_id = getattr(record, "trace_id", "")
+        return f"[trace:{trace_id}] {text}" if trace_id else text
+
+class Tracer:
+    '''
+    轻量级链路追踪
+
+    依靠contextvars传递当前span，create_task/to_thread会自动复制上下文，
+    因此后台的RAG索引任务也归属于触发它的那次对话。结束的span经后台线程以JSONL写入滚动文件。
+    '''
+    def __init__(self, conf: Optional[Dict] = None):
+        conf = TRACE if conf is None else conf
+        self.enable : bool = conf.get("enable", False)
+        self.otel : bool = conf.get("format", "native") == "otel"
+        self.current : ContextVar[Optional[Span]] = ContextVar("huaer_span", default=None)
+
+        self.sink = logging.getLogger("huaer.trace")
+        self.sink.propagate = False
+        self.sink.setLevel(logging.INFO)
+        if self.enable and not self.sink.handlers:
+            sinks.attach(self.sink, rotating_handler(conf.get("file", "trace.jsonl"), "traces", conf))
+            self.tag_logs(logger) # 为追踪期间产生的日志加上trace_id前缀
+            slog.context.append(lambda: {"trace_id": self.trace_id()}) # 结构化日志附带trace_id
+
+    def tag_logs(self, target: logging.Logger):
+        """过滤器只为target的记录添加trace_id属性（msg保持原样），前缀由包装在各handler原有格式化器外的TraceFormatter输出"""
+        target.addFilter(self._tag_record)
+        for handler in target.handlers:
+            if not isinstance(handler.formatter, TraceFormatter):
+                handler.setFormatter(TraceFormatter(handler.formatter))
+
+    def _tag_record(self, record: logging.LogRecord) -> bool:
+        current = self.current.get()
+        record.trace_id = current.trace_id[:8] if current is not None else ""
+        return True
+
+    def trace_id(self) -> Optional[str]:
+        """当前的trace_id，不在追踪中时为None"""
+        current = self.current.get()
+        return current.trace_id if current else None
+
+    @contextmanager
+    def _span(self, name: str, attrs: Dict[str, Any], root: bool = False):
+        span = Span(name, None if root else self.current.get(), attrs)
+        token = self.current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = type(e).__name__
+            raise
+        finally:
+            self.current.reset(token)
+            duration = time.perf_counter() - span.start
+            # dict交由后台线程序列化
+            self.sink.info(span.to_otel(duration) if self.otel else span.to_native(duration))
+
+    def span(self, name: str, **attrs: Any):
+        '''
+        开启一个span（上下文管理器）；没有父span时即为新trace的根
+
+        未启用追踪时返回空上下文，不产生额外开销。
+        '''
+        if not self.enable:
+            return nullcontext(_NOOP)
+        return self._span(name, attrs)
+
+    def root(self, name: str, **attrs: Any):
+        """为一个入站事件开启全新的trace（忽略上下文中残留的span）"""
+        if not self.enable:
+            return nullcontext(_NOOP)
+        return self._span(name, attrs, root=True)
+
+    def traced(self, name: str) -> Callable:
+        """协程函数装饰器：整个调用包裹在一个span中"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enable:
+                    return await func(*args, **kwargs)
+                with self._span(name, {}):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+class _NoopSpan:
+    '''追踪关闭时的占位span'''
+    trace_id = None
+
+    def set(self, **attrs: Any):
+        pass
+
+_NOOP = _NoopSpan()
+
+# 进程级单例，所有组群共享
+tracer = Tracer()
@@ -0,0 +1,214 @@
+import os
+import asyncio
+import hashlib
+from pathlib import Path
+from asyncio import to_thread
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import httpx
+from astrbot.api import logger
+
+from . import serial
+from .rag import QuerySolution, RAGBackend
+from .state import atomic_write_json
+
+try:
+    import numpy as np
+except ImportError: # numpy为可选依赖，仅本地向量后端需要
+    np = None
+
+class LocalVectorBackend(RAGBackend):
+    '''
+    本地向量RAG后端
+
+    嵌入以float32矩阵追加写入 rag_file/vectors.f32，并以只读内存映射打开：
+    检索时按块做矩阵乘法取top-k，常驻内存的只有原文列表，向量页由操作系统按需换入换出。
+    原文、维度与删除标记保存在 rag_file/vectors.json；删除只打标记，保存时若标记占比过高再压缩矩阵。
+    '''
+    BLOCK = 65536 # 每次参与矩阵乘法的行数，限制临时内存
+    COMPACT_RATIO = 0.25 # 删除标记超过该比例时在save中压缩
+
+    def __init__(self, save_dir: str, api_key: str, embedding_url: str, model: str, batch_size: int = 32):
+        if np is None:
+            raise ImportError("本地向量后端需要numpy，请先 pip install numpy")
+        self.dir = Path(save_dir)
+        self.vec_file = self.dir / "vectors.f32"
+        self.meta_file = self.dir / "vectors.json"
+        self.api_key = api_key
+        url = embedding_url.rstrip("/")
+        self.url = url if url.endswith("/embeddings") else f"{url}/embeddings" # 兼容填写完整接口或base_url
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.http_client = httpx.AsyncClient()
+
+        self.dim : Optional[int] = None
+        self.texts : List[str] = [] # 行号 -> 原文
+        self.rows : Dict[str, int] = {} # 原文 -> 行号（不含已删除）
+        self.deleted : Set[int] = set()
+        self.matrix = None # np.memmap，行数与texts一致
+        self.dirty = False
+        self._write_lock = asyncio.Lock() # 并发index时保证追加顺序与行号一致
+        self._load()
+
+    # 持久化
+    def _load(self):
+        if not self.meta_file.exists():
+            return
+        meta = serial.load_file(self.meta_file)
+        if meta.get("model") and meta["model"] != self.model:
+            logger.warning(f"{self.dir} 的向量由 {meta['model']} 生成，与当前嵌入模型 {self.model} 不一致")
+        self.dim = meta.get("dim")
+        self.texts = meta.get("texts", [])
+        self.deleted = set(meta.get("deleted", []))
+        self.rows = {t: i for i, t in enumerate(self.texts) if i not in self.deleted}
+        if self.dim and self.texts:
+            # 元数据落盘前崩溃会留下多余的行，截掉以免后续追加错位
+            expected = len(self.texts) * self.dim * 4
+            if self.vec_file.stat().st_size > expected:
+                os.truncate(self.vec_file, expected)
+            self._map()
+
+    def _map(self):
+        self.matrix = np.memmap(self.vec_file, dtype=np.float32, mode="r", shape=(len(self.texts), self.dim)) if self.texts else None
+
+    def _write_meta(self):
+        meta = {"model": self.model, "dim": self.dim, "texts": self.texts, "deleted": sorted(self.deleted)}
+        atomic_write_json(self.meta_file, meta)
+        self.dirty = False
+
+    def _append(self, vectors):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        with open(self.vec_file, "ab") as f:
+            f.write(vectors.tobytes())
+        self._map()
+
+    def _compact(self):
+        """丢弃已删除的行并重写矩阵"""
+        keep = [i for i in range(len(self.texts)) if i not in self.deleted]
+        tmp = self.vec_file.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            for start in range(0, len(keep), self.BLOCK):
+                f.write(np.ascontiguousarray(self.matrix[keep[start:start + self.BLOCK]]).tobytes())
+        self.matrix = None # 先释放旧映射
+        os.replace(tmp, self.vec_file)
+        self.texts = [self.texts[i] for i in keep]
+        self.rows = {t: i for i, t in enumerate(self.texts)}
+        self.deleted = set()
+        self._map()
+        self.dirty = True
+
+    # 嵌入
+    async def _embed(self, texts: List[str]):
+        """按batch_size分批请求嵌入，返回L2归一化后的 (n, dim) 矩阵"""
+        parts = []
+        for start in range(0, len(texts), self.batch_size):
+            response = await self.http_client.post(
+                self.url,
+                content=serial.dumps({"model": self.model, "input": texts[start:start + self.batch_size], "encoding_format": "float"}),
+                headers={"Authorization": self.api_key, "Content-Type": "application/json"},
+                timeout=60,
+            )
+            response.raise_for_status()
+            data = sorted(serial.loads(response.content)["data"], key=lambda d: d.get("index", 0))
+            parts.append(np.asarray([d["embedding"] for d in data], dtype=np.float32))
+        vectors = np.vstack(parts)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    # RAGBackend接口
+    async def index(self, contents: List[str]):
+        new = [t for t in dict.fromkeys(contents) if t and t not in self.rows]
+        if not new:
+            raise ValueError("文档已存在")
+        if not await self.add_vectors(new, await self._embed(new)):
+            raise ValueError("文档已存在")
+
+    async def embed(self, texts: List[str]):
+        return await self._embed(texts)
+
+    async def add_vectors(self, texts: List[str], vectors) -> int:
+        """写入已归一化的现成向量（如归档导入），已存在的文本跳过，返回新增条数"""
+        async with self._write_lock:
+            seen = set(self.rows)
+            keep = [i for i, t in enumerate(texts) if t and t not in seen and not seen.add(t)] # 嵌入期间可能已被其他批次写入
+            if not keep:
+                return 0
+            texts, vectors = [texts[i] for i in keep], np.asarray(vectors, dtype=np.float32)[keep]
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"嵌入维度 {vectors.shape[1]} 与已有向量 {self.dim} 不一致")
+            start = len(self.texts)
+            self.texts.extend(texts)
+            await to_thread(self._append, vectors)
+            self.rows.update((t, start + i) for i, t in enumerate(texts))
+            self.dirty = True
+            return len(texts)
+
+    async def delete(self, contents: List[str]):
+        rows = [self.rows.pop(t) for t in contents if t in self.rows]
+        if not rows:
+            raise ValueError("文档不存在")
+        self.deleted.update(rows)
+        self.dirty = True
+
+    async def clear(self):
+        self.matrix = None
+        for file in (self.vec_file, self.meta_file):
+            file.unlink(missing_ok=True)
+        self.dim = None
+        self.texts, self.rows, self.deleted = [], {}, set()
+        self.dirty = False
+
+    def _save(self):
+        if self.deleted and len(self.deleted) >= self.COMPACT_RATIO * len(self.texts):
+            self._compact()
+        if self.dirty:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self._write_meta()
+
+    async def save(self):
+        await to_thread(self._save)
+
+    def _top_k(self, queries, num: int) -> List[Tuple[List[str], List[float]]]:
+        """分块计算余弦相似度，返回每个问题的 (原文, 得分) top-k"""
+        matrix, texts, deleted = self.matrix, self.texts, self.deleted # 快照，压缩会整体替换这些对象
+        if matrix is None:
+            return [([], []) for _ in range(queries.shape[0])]
+        best_rows = np.empty((queries.shape[0], 0), dtype=np.int64)
+        best_scores = np.empty((queries.shape[0], 0), dtype=np.float32)
+        dead = np.array(list(deleted), dtype=np.int64) if deleted else None
+        for start in range(0, len(matrix), self.BLOCK):
+            block = matrix[start:start + self.BLOCK]
+            scores = queries @ block.T # (Q, B)
+            if dead is not None:
+                local = dead[(dead >= start) & (dead < start + len(block))] - start
+                scores[:, local] = -np.inf
+            k = min(num, scores.shape[1])
+            idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_rows = np.hstack([best_rows, idx + start])
+            best_scores = np.hstack([best_scores, np.take_along_axis(scores, idx, axis=1)])
+        order = np.argsort(-best_scores, axis=1)[:, :num]
+        results = []
+        for rows, scores in zip(np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)):
+            picked = [(texts[r], float(s)) for r, s in zip(rows, scores) if np.isfinite(s)]
+            results.append(([t for t, _ in picked], [s for _, s in picked]))
+        return results
+
+    async def retrieve(self, queries: List[str], num: int) -> List[QuerySolution]:
+        if not self.rows or not queries:
+            return [QuerySolution(q) for q in queries]
+        vectors = await self._embed(queries)
+        hits = await to_thread(self._top_k, vectors, num)
+        return [QuerySolution(q, docs, scores) for q, (docs, scores) in zip(queries, hits)]
+
+    async def nearest(self, texts: List[str]) -> List[float]:
+        """每条文本与库中最相近文档的余弦相似度，库为空时为0"""
+        if not self.rows or not texts:
+            return [0.0] * len(texts)
+        hits = await to_thread(self._top_k, await self._embed(texts), 1)
+        return [scores[0] if scores else 0.0 for _, scores in hits]
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for text in self.rows:
+            yield text, "chunk-" + hashlib.md5(text.encode("utf-8")).hexdigest()